@@ -1,135 +1,50 @@
-from flask import Flask, request, jsonify
-import re
-import string
-import math
-from collections import Counter
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import os
+import sys
+import time
 
-app = Flask(__name__)
+# Make the shared src/ package importable when deployed as a single function
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Common English stop words
-STOP_WORDS = {
-    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'your', 'yours',
-    'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 'her', 'hers',
-    'herself', 'it', 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves',
-    'what', 'which', 'who', 'whom', 'this', 'that', 'these', 'those', 'am', 'is', 'are',
-    'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
-    'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until',
-    'while', 'of', 'at', 'by', 'for', 'with', 'through', 'during', 'before', 'after',
-    'above', 'below', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again',
-    'further', 'then', 'once'
-}
+from src.model.lightweight import LightweightSpamFilter
+from src.model.metrics import cache_collector, registry as metrics
+from src.web.batch import NDJSON_MIMETYPE, batch_chunks, read_batch, result_lines
+from src.web.serving import cache_from_env
 
-class LightweightSpamFilter:
-    def __init__(self):
-        self.spam_words = {}
-        self.ham_words = {}
-        self.spam_count = 0
-        self.ham_count = 0
-        self.vocabulary = set()
-        self.is_trained = False
-    
-    def preprocess_text(self, text):
-        """Clean and preprocess text"""
-        # Convert to lowercase
-        text = text.lower()
-        # Remove punctuation
-        text = text.translate(str.maketrans('', '', string.punctuation))
-        # Remove numbers
-        text = re.sub(r'\d+', '', text)
-        # Split into words and remove stop words
-        words = [word for word in text.split() if word not in STOP_WORDS and len(word) > 2]
-        return words
-    
-    def train(self):
-        """Train the spam filter with a lightweight dataset"""
-        # Training data: (message, label)
-        training_data = [
-            ("free money now click here urgent", "spam"),
-            ("congratulations you won million dollars", "spam"),
-            ("limited time offer click now", "spam"),
-            ("urgent your account will be closed", "spam"),
-            ("winner notification click claim prize", "spam"),
-            ("call now free consultation", "spam"),
-            ("credit card has been charged", "spam"),
-            ("act now limited time", "spam"),
-            ("earn money fast", "spam"),
-            ("guarantee profit investment", "spam"),
-            ("hello how are you today", "ham"),
-            ("meeting tomorrow afternoon", "ham"),
-            ("can you send report", "ham"),
-            ("thanks for help yesterday", "ham"),
-            ("looking forward weekend", "ham"),
-            ("see you conference", "ham"),
-            ("happy birthday great day", "ham"),
-            ("project deadline next week", "ham"),
-            ("lunch plans today", "ham"),
-            ("good morning everyone", "ham")
-        ]
-        
-        # Process training data
-        for text, label in training_data:
-            words = self.preprocess_text(text)
-            self.vocabulary.update(words)
-            
-            if label == "spam":
-                self.spam_count += 1
-                for word in words:
-                    self.spam_words[word] = self.spam_words.get(word, 0) + 1
-            else:
-                self.ham_count += 1
-                for word in words:
-                    self.ham_words[word] = self.ham_words.get(word, 0) + 1
-        
-        self.is_trained = True
-    
-    def predict(self, text):
-        """Predict if a text is spam or ham using Naive Bayes"""
-        if not self.is_trained:
-            self.train()
-        
-        words = self.preprocess_text(text)
-        
-        # Calculate probabilities
-        total_messages = self.spam_count + self.ham_count
-        spam_prior = self.spam_count / total_messages
-        ham_prior = self.ham_count / total_messages
-        
-        # Calculate log probabilities to avoid underflow
-        spam_score = math.log(spam_prior)
-        ham_score = math.log(ham_prior)
-        
-        total_spam_words = sum(self.spam_words.values())
-        total_ham_words = sum(self.ham_words.values())
-        vocab_size = len(self.vocabulary)
-        
-        for word in words:
-            # Laplace smoothing
-            spam_word_count = self.spam_words.get(word, 0)
-            ham_word_count = self.ham_words.get(word, 0)
-            
-            spam_word_prob = (spam_word_count + 1) / (total_spam_words + vocab_size)
-            ham_word_prob = (ham_word_count + 1) / (total_ham_words + vocab_size)
-            
-            spam_score += math.log(spam_word_prob)
-            ham_score += math.log(ham_word_prob)
-        
-        # Determine prediction
-        if spam_score > ham_score:
-            prediction = "spam"
-            # Convert log probabilities back to regular probabilities
-            exp_spam = math.exp(spam_score)
-            exp_ham = math.exp(ham_score)
-            probability = exp_spam / (exp_spam + exp_ham)
-        else:
-            prediction = "ham"
-            exp_spam = math.exp(spam_score)
-            exp_ham = math.exp(ham_score)
-            probability = exp_ham / (exp_spam + exp_ham)
-        
-        return prediction, probability
+app = Flask(__name__)
+app.config['MAX_BATCH_SIZE'] = int(os.environ.get('SPAM_MAX_BATCH_SIZE', 1000))
+app.config['BATCH_CHUNK_SIZE'] = int(os.environ.get('SPAM_BATCH_CHUNK_SIZE', 256))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('SPAM_MAX_CONTENT_LENGTH', 5 * 1024 * 1024))
 
-# Global spam filter instance
+# Count table built offline from data/raw/spam.csv (python -m src.training.build_lightweight_model)
+MODEL_PATH = os.environ.get(
+    'SPAM_LIGHTWEIGHT_MODEL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lightweight_model.bin')
+)
+
+# Global spam filter instance, trained on the full corpus when the count table is available
 spam_filter = LightweightSpamFilter()
+spam_filter.prediction_cache = cache_from_env()
+metrics.add_collector(cache_collector(spam_filter.prediction_cache))
+if os.path.exists(MODEL_PATH):
+    _load_start = time.perf_counter()
+    spam_filter.load(MODEL_PATH)
+    metrics.set('spam_model_load_seconds', time.perf_counter() - _load_start)
+
+@app.before_request
+def _start_request_timer():
+    """Remember when the request started, for the request histogram"""
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    """Record the request duration and count by endpoint and status"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unknown'
+        metrics.observe('spam_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc('spam_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
 
 @app.route('/')
 def home():
@@ -322,7 +237,9 @@ def health_check():
         return jsonify({
             'status': 'healthy',
             'message': 'Spam detection API is running',
-            'model_trained': spam_filter.is_trained
+            'model_trained': spam_filter.is_trained,
+            'vocabulary_size': len(spam_filter.vocabulary),
+            'cache': spam_filter.prediction_cache.stats()
         })
     except Exception as e:
         return jsonify({
@@ -330,10 +247,17 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/metrics')
+@app.route('/api/metrics')
+def metrics_endpoint():
+    """Stage latencies, request counts and cache statistics for Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/check_spam', methods=['POST'])
 def check_spam():
     try:
-        data = request.get_json()
+        with metrics.stage('json_decode'):
+            data = request.get_json()
         if not data:
             return jsonify({'error': 'No JSON data provided'}), 400
             
@@ -347,12 +271,14 @@ def check_spam():
             spam_filter.train()
         
         prediction, probability = spam_filter.predict(message)
+        metrics.inc('spam_predictions_total', label=prediction)
         
-        return jsonify({
-            'prediction': prediction,
-            'probability': float(probability),
-            'is_spam': prediction == 'spam'
-        })
+        with metrics.stage('json_encode'):
+            return jsonify({
+                'prediction': prediction,
+                'probability': float(probability),
+                'is_spam': prediction == 'spam'
+            })
     except Exception as e:
         # Better error logging
         import traceback
@@ -362,6 +288,23 @@ def check_spam():
             'details': error_details
         }), 500
 
+@app.route('/api/check_spam_batch', methods=['POST'])
+def check_spam_batch():
+    try:
+        items, error = read_batch(request, app.config['MAX_BATCH_SIZE'])
+        if error is not None:
+            return error
+        
+        # Ensure the model is trained
+        if not spam_filter.is_trained:
+            spam_filter.train()
+        
+        chunks = batch_chunks(items, app.config['BATCH_CHUNK_SIZE'])
+        results = ((messages,) + tuple(spam_filter.predict_batch(valid)) for messages, valid in chunks)
+        return Response(stream_with_context(result_lines(results)), mimetype=NDJSON_MIMETYPE)
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 # Export the app for Vercel
 app = app
 
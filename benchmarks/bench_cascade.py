@@ -0,0 +1,114 @@
+"""Throughput and accuracy of the cascade against always running the full model.
+
+The full model is trained as ``SpamFilter.train`` does and the lightweight
+count table is built from the same 80% of the corpus, so both are scored on
+the unseen 20%. For the full model alone and for the cascade at each
+uncertainty band the benchmark reports accuracy, spam precision and recall,
+agreement with the full model, the share of messages decided by the rules,
+the lightweight model and the full model, and throughput when scoring the
+held-out set at once and one message per call. The rules were chosen on the
+training split, so their hits and precision on the held-out split are
+reported per rule as well.
+
+    python -m benchmarks.bench_cascade [--full sklearn|mapped|compiled] [--bands 0.1,0.999 0.3,0.7]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import tempfile
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from sklearn.model_selection import train_test_split
+
+from src.model.cascade import CascadeSpamFilter, parse_band
+from src.model.lightweight import LightweightSpamFilter
+from src.model.mapped_model import MappedSpamFilter
+from src.model.spam_filter import SpamFilter
+from src.training.build_lightweight_model import count_messages
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def print_rule_precision(cascade, messages, labels):
+    hits = {}
+    for message, label in zip(messages, labels):
+        rule = cascade.match_rule(message)
+        if rule is not None:
+            hits.setdefault(rule, []).append(label == 'spam')
+    print('held-out rule hits: ' + ', '.join(
+        f'{name} {sum(spam)}/{len(spam)} spam ({sum(spam) / len(spam):.0%})'
+        for name, spam in sorted(hits.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='data/raw/spam.csv')
+    parser.add_argument('--full', choices=('sklearn', 'mapped', 'compiled'), default='sklearn')
+    parser.add_argument('--bands', nargs='+', type=parse_band,
+                        default=[(0.02, 0.98), (0.1, 0.999), (0.2, 0.9999), (0.3, 0.7)])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    model = SpamFilter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.train(args.data)
+    # Splitting the raw messages the same way gives SpamFilter.train's split
+    with open(args.data, encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE))
+    train_rows, test_rows = train_test_split(rows, test_size=0.2, random_state=42)
+    counts = count_messages(train_rows)
+    lightweight = LightweightSpamFilter().load_counts(counts['spam'][0], counts['ham'][0],
+                                                      counts['spam'][1], counts['ham'][1])
+    labels = [label for label, _ in test_rows]
+    messages = [message for _, message in test_rows]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full = model
+        if args.full != 'sklearn':
+            model.export_model(tmp)
+            full = MappedSpamFilter.load(tmp)
+            if args.full == 'compiled':
+                full = full.compile()
+        reference = [str(prediction) for prediction in full.predict_batch(messages)[0]]
+
+        print(f"{'path':<22}{'accuracy':>10}{'precision':>11}{'recall':>8}{'agree':>8}"
+              f"{'rules':>7}{'light':>7}{'full':>7}{'batch msg/s':>13}{'single msg/s':>14}")
+        candidates = [(f'{args.full} only', full)]
+        candidates += [(f'cascade {low:g}-{high:g}', CascadeSpamFilter(lightweight, full, (low, high)))
+                       for low, high in args.bands]
+        throughput = {}
+        for name, scorer in candidates:
+            seconds, (predictions, _) = best_time(lambda: scorer.predict_batch(messages), args.repeat)
+            single_seconds, _ = best_time(lambda: [scorer.predict(message) for message in messages], args.repeat)
+            predictions = [str(prediction) for prediction in predictions]
+            precision, recall, _, _ = precision_recall_fscore_support(
+                labels, predictions, pos_label='spam', average='binary', zero_division=0)
+            agreement = np.mean([a == b for a, b in zip(predictions, reference)])
+            shares = ['-', '-', '-']
+            if isinstance(scorer, CascadeSpamFilter):
+                # Every pass over the held-out set is routed the same way
+                routed = scorer.stats()['routed']
+                passes = routed['rules'] + routed['lightweight'] + routed['full']
+                shares = [f'{routed[stage] / passes:.0%}' for stage in ('rules', 'lightweight', 'full')]
+            throughput[name] = len(messages) / single_seconds
+            print(f'{name:<22}{accuracy_score(labels, predictions):>10.4f}{precision:>11.4f}{recall:>8.4f}'
+                  f'{agreement:>8.4f}{shares[0]:>7}{shares[1]:>7}{shares[2]:>7}'
+                  f'{len(messages) / seconds:>13.0f}{len(messages) / single_seconds:>14.0f}')
+    print_rule_precision(CascadeSpamFilter(lightweight, full), messages, labels)
+    baseline = throughput[f'{args.full} only']
+    print('single-message speedup over the full model: '
+          + ', '.join(f'{name} {value / baseline:.1f}x' for name, value in throughput.items() if name.startswith('cascade')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Per-message latency of the compiled scorer against the sklearn and mapped paths.
+
+Every message of the corpus is scored one call at a time, as ``/check_spam``
+does, by ``SpamFilter.predict``, ``MappedSpamFilter.predict`` and the
+``CompiledSpamFilter`` compiled from the same model, and the benchmark
+reports median and tail latency per path. It first checks that the compiled
+probabilities match ``predict_proba`` and exits with status 1 if they differ
+by more than ``--tolerance``.
+
+    python -m benchmarks.bench_compiled [--data data/raw/spam.csv] [--messages 2000]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.model.mapped_model import MappedSpamFilter
+from src.model.spam_filter import SpamFilter
+
+
+def latencies(predict, messages, repeat):
+    # Best of repeat timings per message, to drop scheduler noise
+    best = np.full(len(messages), np.inf)
+    for _ in range(repeat):
+        for i, message in enumerate(messages):
+            start = time.perf_counter()
+            predict(message)
+            best[i] = min(best[i], time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='data/raw/spam.csv')
+    parser.add_argument('--messages', type=int, default=2000, help='messages timed per path')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    model = SpamFilter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.train(args.data)
+    compiled = model.compile()
+    messages = pd.read_csv(args.data, sep='\t', header=None, names=['label', 'message'],
+                           dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)['message'].tolist()
+
+    clean_messages = model.clean_batch(messages)
+    expected = model.classifier.predict_proba(model.vectorizer.transform(clean_messages))
+    batch_error = np.abs(compiled.predict_proba(clean_messages) - expected).max()
+    single_error = max(abs(compiled.predict(message)[1] - expected[i].max()) for i, message in enumerate(messages))
+    print(f'max |probability difference| vs predict_proba: batch {batch_error:.2e}, single {single_error:.2e}')
+    if max(batch_error, single_error) > args.tolerance:
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model.export_model(tmp)
+        mapped = MappedSpamFilter.load(tmp)
+        timed = messages[:args.messages]
+        print(f"{'path':<12}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'msg/s':>10}")
+        results = {}
+        for name, predict in [('sklearn', model.predict), ('mapped', mapped.predict), ('compiled', compiled.predict)]:
+            seconds = latencies(predict, timed, args.repeat)
+            results[name] = np.median(seconds)
+            p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1e6
+            print(f'{name:<12}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{len(seconds) / seconds.sum():>10.0f}')
+    print(f"compiled median is {results['sklearn'] / results['compiled']:.1f}x faster than sklearn, "
+          f"{results['mapped'] / results['compiled']:.1f}x faster than mapped")
+
+
+if __name__ == '__main__':
+    main()
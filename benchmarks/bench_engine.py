@@ -0,0 +1,54 @@
+"""Throughput scaling of the multi-process ScoringEngine.
+
+Scores data/raw/spam.csv replicated ``--scale`` times with 1, 2, 4, ... up to
+``--max-workers`` processes and reports messages per second, speedup and
+parallel efficiency relative to a single process. Near-linear scaling needs
+as many physical cores as workers.
+
+    python -m benchmarks.bench_engine [--scale 20] [--max-workers 8]
+"""
+import argparse
+import csv
+import os
+import time
+
+from src.model.engine import ScoringEngine
+from src.model.spam_filter import SpamFilter, default_model_path
+
+
+def worker_counts(max_workers):
+    count = 1
+    while count < max_workers:
+        yield count
+        count *= 2
+    yield max_workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='data/raw/spam.csv')
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--scale', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with open(args.data, encoding='utf-8', newline='') as f:
+        messages = [row[1] for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)] * args.scale
+    model = SpamFilter.load_model(args.model or default_model_path())
+
+    print(f'{len(messages)} messages, {os.cpu_count()} CPUs, chunk size {args.chunk_size}')
+    print(f"{'workers':>8}{'msg/s':>12}{'speedup':>10}{'efficiency':>12}")
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        with ScoringEngine(model, workers=workers, chunk_size=args.chunk_size) as engine:
+            start = time.perf_counter()
+            scored = sum(1 for _ in engine.score_many(messages))
+            throughput = scored / (time.perf_counter() - start)
+        baseline = baseline or throughput
+        speedup = throughput / baseline
+        print(f'{workers:>8}{throughput:>12.0f}{speedup:>9.2f}x{speedup / workers:>11.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""Load test of the HTTP scoring endpoints against a local server.
+
+Each target app is started in its own process on a free local port, warmed
+up, then sent ``--requests`` single-message requests sampled from
+data/raw/spam.csv by ``--concurrency`` keep-alive clients. Reports
+throughput and p50/p95/p99 latency (median of ``--repeat`` rounds) and the
+server's resident memory (read from /proc), and compares them with a stored
+baseline; the exit status is 1 when a metric regresses by more than
+``--max-regression`` (``--max-tail-regression`` for p95/p99).
+
+    python -m benchmarks.bench_http [--targets app api asgi] [--concurrency 16]
+    python -m benchmarks.bench_http --save-baseline    # after an intended change
+
+Absolute numbers depend on the machine, so only compare against a baseline
+recorded on the same hardware.
+"""
+import argparse
+import csv
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from statistics import median
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'http.json')
+
+SERVER_SCRIPT = 'from {module} import app; app.run(host="127.0.0.1", port={port}, threaded=True)'
+
+# name: (server command, readiness path, scoring path)
+TARGETS = {
+    'app': (lambda port: [sys.executable, '-c', SERVER_SCRIPT.format(module='src.web.app', port=port)],
+            '/ready', '/check_spam'),
+    'api': (lambda port: [sys.executable, '-c', SERVER_SCRIPT.format(module='api.index', port=port)],
+            '/api/health', '/api/check_spam'),
+    'asgi': (lambda port: [sys.executable, '-m', 'uvicorn', 'src.web.asgi:app', '--port', str(port),
+                           '--log-level', 'warning'],
+             '/ready', '/check_spam'),
+}
+
+# Metrics compared with the baseline: (name, higher is better, is a tail latency)
+COMPARED = (
+    ('throughput', True, False),
+    ('p50_ms', False, False),
+    ('p95_ms', False, True),
+    ('p99_ms', False, True),
+    ('rss_mb', False, False),
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid):
+    """Current and peak resident set size of a process in MiB."""
+    values = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(value.split()[0]) / 1024
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def wait_until_ready(port, path, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', path)
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'Server was not ready after {timeout}s')
+
+
+def replay(port, path, messages, concurrency):
+    """Send every message once from concurrency clients; returns (latencies in s, errors, elapsed s)."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    shares = [messages[i::concurrency] for i in range(concurrency)]
+
+    def client(share):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        failed = 0
+        for message in share:
+            body = json.dumps({'message': message})
+            start = time.perf_counter()
+            try:
+                connection.request('POST', path, body, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except OSError:
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(share,)) for share in shares if share]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def run_target(name, messages, args):
+    command, ready_path, score_path = TARGETS[name]
+    port = free_port()
+    env = dict(os.environ, SPAM_WARMUP='eager')
+    process = subprocess.Popen(command(port), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, ready_path, process, args.startup_timeout)
+        startup_rss, _ = rss_mb(process.pid)
+        replay(port, score_path, messages[:args.warmup], args.concurrency)
+        rounds = [summarize(*replay(port, score_path, messages, args.concurrency)) for _ in range(args.repeat)]
+        current_rss, peak_rss = rss_mb(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    # The median round damps noise from other processes sharing the machine
+    result = {metric: median(r[metric] for r in rounds) for metric in rounds[0]}
+    result.update({
+        'requests': len(messages),
+        'errors': sum(r['errors'] for r in rounds),
+        'concurrency': args.concurrency,
+        'rounds': args.repeat,
+        'startup_rss_mb': startup_rss,
+        'rss_mb': current_rss,
+        'peak_rss_mb': peak_rss,
+    })
+    return result
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        'errors': errors,
+        'throughput': len(latencies) / elapsed,
+        'mean_ms': 1000 * sum(latencies) / len(latencies),
+        'p50_ms': 1000 * percentile(latencies, 50),
+        'p95_ms': 1000 * percentile(latencies, 95),
+        'p99_ms': 1000 * percentile(latencies, 99),
+    }
+
+
+def compare(results, baseline, max_regression, max_tail_regression):
+    """Print the change of every compared metric; returns the list of regressions."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f'{name}: no baseline')
+            continue
+        for metric, higher_is_better, tail in COMPARED:
+            if previous.get(metric) is None or result.get(metric) is None:
+                continue
+            change = result[metric] / previous[metric] - 1
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > (max_tail_regression if tail else max_regression):
+                flag = '  REGRESSION'
+                regressions.append(f'{name} {metric}')
+            print(f'{name:>6} {metric:>10} {previous[metric]:>10.2f} -> {result[metric]:>10.2f} ({change:+.0%}){flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='data/raw/spam.csv')
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=['app', 'api'])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=200, help='requests sent before measuring')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5, help='measured rounds; the median is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed relative slowdown or memory growth before failing')
+    parser.add_argument('--max-tail-regression', type=float, default=0.5,
+                        help='allowed relative growth of p95/p99 latency, which is noisier')
+    parser.add_argument('--output', help='also write the results as JSON here')
+    args = parser.parse_args()
+
+    with open(args.data, encoding='utf-8', newline='') as f:
+        corpus = [row[1] for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)]
+    messages = random.Random(args.seed).choices(corpus, k=args.requests)
+
+    results = {}
+    for name in args.targets:
+        results[name] = result = run_target(name, messages, args)
+        print(f"{name}: {result['throughput']:.0f} req/s, p50 {result['p50_ms']:.2f} ms, "
+              f"p95 {result['p95_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+              f"RSS {result['rss_mb']:.0f} MiB (peak {result['peak_rss_mb']:.0f}), {result['errors']} errors")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --save-baseline to create one')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression, args.max_tail_regression)
+    failed = [name for name, result in results.items() if result['errors']]
+    if regressions or failed:
+        print('Failed: ' + ', '.join(regressions + [f'{name} had errors' for name in failed]))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
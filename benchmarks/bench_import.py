@@ -0,0 +1,166 @@
+"""Cold-start cost of the web entry points: import time and first request.
+
+Each target is imported in a fresh ``python -X importtime`` process, which
+then serves one request through the Flask test client. The benchmark reports
+the median of ``--repeat`` runs of the import time and the time to the first
+response, the packages that took longest to import (self time from the
+``-X importtime`` trace), and whether any of the training-only dependencies
+(pandas, scikit-learn, SciPy, NLTK) were imported, which the inference path
+should not need. Results are compared with a stored baseline as
+``bench_http`` does; the exit status is 1 when a time regresses by more than
+``--max-regression`` or a target starts importing a training dependency.
+
+    python -m benchmarks.bench_import [--targets app api model] [--repeat 5]
+    python -m benchmarks.bench_import --save-baseline    # after an intended change
+
+The model is loaded as the app loads it (``SPAM_WARMUP`` and the other
+``SPAM_*`` variables of the environment apply), so the app's import time
+includes loading the model.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'import.json')
+
+TRAINING_MODULES = ('pandas', 'sklearn', 'scipy', 'nltk')
+
+# Imports the target, answers one request and prints the timings as JSON on stdout
+PROBE_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module} as target
+imported = time.perf_counter()
+first_ms = None
+if {path!r}:
+    response = target.app.test_client().post({path!r}, json={{'message': 'WIN a free prize, call now'}})
+    assert response.status_code == 200, response.status_code
+    first_ms = 1000 * (time.perf_counter() - imported)
+print(json.dumps({{'import_ms': 1000 * (imported - start), 'first_request_ms': first_ms,
+                  'loaded': [name for name in {training!r} if name in sys.modules]}}))
+'''
+
+# name: (module, scoring path or None to only import)
+TARGETS = {
+    'app': ('src.web.app', '/check_spam'),
+    'api': ('api.index', '/api/check_spam'),
+    'model': ('src.model.spam_filter', None),
+}
+
+COMPARED = ('import_ms', 'first_request_ms')
+
+
+def parse_importtime(stderr):
+    """Microseconds spent importing each top-level package, from an -X importtime trace.
+
+    Sums the self time of every module by its root package, so a package is
+    charged for its own modules wherever in the tree they were imported.
+    """
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    return packages
+
+
+def probe(name):
+    module, path = TARGETS[name]
+    script = PROBE_SCRIPT.format(module=module, path=path, training=TRAINING_MODULES)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                               capture_output=True, text=True, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{name} probe failed:\n{completed.stderr[-2000:]}')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['packages'] = parse_importtime(completed.stderr)
+    return result
+
+
+def run_target(name, repeat, top):
+    runs = [probe(name) for _ in range(repeat)]
+    packages = {}
+    for run in runs:
+        for package, microseconds in run['packages'].items():
+            packages.setdefault(package, []).append(microseconds)
+    heaviest = sorted(((median(values) / 1000, package) for package, values in packages.items()), reverse=True)
+    first = [run['first_request_ms'] for run in runs if run['first_request_ms'] is not None]
+    return {
+        'import_ms': median(run['import_ms'] for run in runs),
+        'first_request_ms': median(first) if first else None,
+        'runs': repeat,
+        'training_modules': sorted({name for run in runs for name in run['loaded']}),
+        'heaviest_ms': {package: round(ms, 2) for ms, package in heaviest[:top]},
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Print the change of every compared metric; returns the list of regressions."""
+    regressions = []
+    for name, result in results.items():
+        if result['training_modules']:
+            regressions.append(f"{name} imports {', '.join(result['training_modules'])}")
+        previous = baseline.get(name)
+        if previous is None:
+            print(f'{name}: no baseline')
+            continue
+        for metric in COMPARED:
+            if previous.get(metric) is None or result.get(metric) is None:
+                continue
+            change = result[metric] / previous[metric] - 1
+            flag = ''
+            if change > max_regression:
+                flag = '  REGRESSION'
+                regressions.append(f'{name} {metric}')
+            print(f'{name:>6} {metric:>16} {previous[metric]:>10.1f} -> {result[metric]:>10.1f} ({change:+.0%}){flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=['app', 'api', 'model'])
+    parser.add_argument('--repeat', type=int, default=5, help='fresh processes per target; the median is reported')
+    parser.add_argument('--top', type=int, default=8, help='heaviest top-level packages to report')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline')
+    parser.add_argument('--max-regression', type=float, default=0.5,
+                        help='allowed relative growth of import or first-request time before failing')
+    parser.add_argument('--output', help='also write the results as JSON here')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.targets:
+        results[name] = result = run_target(name, args.repeat, args.top)
+        first = result['first_request_ms']
+        print(f"{name}: import {result['import_ms']:.1f} ms"
+              + (f', first request {first:.1f} ms' if first is not None else '')
+              + f", training modules imported: {', '.join(result['training_modules']) or 'none'}")
+        print('    heaviest: ' + ', '.join(f'{package} {ms:.1f} ms' for package, ms in result['heaviest_ms'].items()))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --save-baseline to create one')
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression)
+    if regressions:
+        print('Failed: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Microbenchmark for the shared text preprocessing pipeline.
+
+Compares the precompiled implementations in ``src/model/preprocessing.py``
+with the original per-call implementations of ``SpamFilter.clean_text`` and
+``LightweightSpamFilter.preprocess_text`` on ``data/raw/spam.csv``, after
+checking that both produce identical output for every message.
+
+    python -m benchmarks.bench_preprocessing [--repeat 5]
+"""
+import argparse
+import csv
+import re
+import string
+import timeit
+
+import pandas as pd
+
+from src.model.preprocessing import (
+    LIGHTWEIGHT_STOP_WORDS, clean_batch, clean_text, tokenize_lightweight, tokenize_lightweight_batch
+)
+from src.model.spam_filter import SpamFilter
+
+DATA_PATH = 'data/raw/spam.csv'
+
+
+def legacy_clean_text(text, stop_words):
+    nopunc = [char for char in text if char not in string.punctuation]
+    nopunc = ''.join(nopunc)
+    clean_words = [word.lower() for word in nopunc.split() if word.lower() not in stop_words]
+    return ' '.join(clean_words)
+
+
+def legacy_preprocess_text(text, stop_words):
+    text = text.lower()
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    text = re.sub(r'\d+', '', text)
+    return [word for word in text.split() if word not in stop_words and len(word) > 2]
+
+
+def load_messages(data_path):
+    with open(data_path, encoding='utf-8', newline='') as f:
+        return [row[1] for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)]
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    messages = load_messages(args.data)
+    series = pd.Series(messages)
+    stop_words = SpamFilter().stop_words
+
+    for message in messages:
+        assert clean_text(message, stop_words) == legacy_clean_text(message, stop_words), message
+        assert tokenize_lightweight(message) == legacy_preprocess_text(message, LIGHTWEIGHT_STOP_WORDS), message
+    assert list(clean_batch(series, stop_words)) == list(series.apply(legacy_clean_text, args=(stop_words,)))
+
+    cases = [
+        ('SpamFilter.clean_text',
+         lambda: [legacy_clean_text(m, stop_words) for m in messages],
+         lambda: [clean_text(m, stop_words) for m in messages]),
+        ('SpamFilter.clean_text (Series)',
+         lambda: series.apply(legacy_clean_text, args=(stop_words,)),
+         lambda: clean_batch(series, stop_words)),
+        ('LightweightSpamFilter.preprocess_text',
+         lambda: [legacy_preprocess_text(m, LIGHTWEIGHT_STOP_WORDS) for m in messages],
+         lambda: [tokenize_lightweight(m) for m in messages]),
+        ('LightweightSpamFilter.preprocess_text (Series)',
+         lambda: series.apply(legacy_preprocess_text, args=(LIGHTWEIGHT_STOP_WORDS,)),
+         lambda: tokenize_lightweight_batch(series)),
+    ]
+
+    print(f'{len(messages)} messages from {args.data}, outputs identical, best of {args.repeat}')
+    print(f"{'stage':<48}{'legacy ms':>12}{'shared ms':>12}{'speedup':>10}")
+    for name, legacy, shared in cases:
+        legacy_time = best_of(legacy, args.repeat)
+        shared_time = best_of(shared, args.repeat)
+        print(f'{name:<48}{legacy_time * 1000:>12.1f}{shared_time * 1000:>12.1f}{legacy_time / shared_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare SpamFilter feature modes: CountVectorizer vs feature hashing.
+
+For each configuration the model is trained on the 80% split used by
+``SpamFilter.train`` and the benchmark reports held-out accuracy, training
+time, pickled size, load time and the memory held by the loaded model.
+
+    python -m benchmarks.bench_vectorizers [--data data/raw/spam.csv]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from src.model.spam_filter import SpamFilter
+
+CONFIGURATIONS = [
+    ('count', {'feature_mode': 'count'}),
+    ('hashing 2^16', {'feature_mode': 'hashing', 'n_features': 2 ** 16}),
+    ('hashing 2^18', {'feature_mode': 'hashing', 'n_features': 2 ** 18}),
+    ('hashing 2^18 signed', {'feature_mode': 'hashing', 'n_features': 2 ** 18, 'alternate_sign': True}),
+    ('hashing 2^20', {'feature_mode': 'hashing', 'n_features': 2 ** 20}),
+]
+
+
+def loaded_model_bytes(model_path):
+    tracemalloc.start()
+    model = SpamFilter.load_model(model_path)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del model
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='data/raw/spam.csv')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<22}{'accuracy':>10}{'train s':>10}{'pickle KiB':>12}{'load ms':>10}{'heap KiB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, params in CONFIGURATIONS:
+            spam_filter = SpamFilter(**params)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                spam_filter.train(args.data)
+            train_time = time.perf_counter() - start
+
+            model_path = os.path.join(tmp, name.replace(' ', '_') + '.pkl')
+            spam_filter.save_model(model_path)
+            load_time = min(timeit.repeat(lambda: SpamFilter.load_model(model_path), number=1, repeat=args.repeat))
+            print(f"{name:<22}{spam_filter.evaluation['accuracy']:>10.4f}{train_time:>10.2f}"
+                  f"{os.path.getsize(model_path) / 1024:>12.1f}{load_time * 1000:>10.2f}"
+                  f"{loaded_model_bytes(model_path) / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
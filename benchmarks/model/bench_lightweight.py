@@ -0,0 +1,41 @@
+"""Stage timings of the serverless LightweightSpamFilter."""
+import pytest
+
+from api.index import MODEL_PATH, LightweightSpamFilter
+from conftest import batch_rounds
+
+MESSAGE = "URGENT! You have won a 1 week FREE membership in our £100,000 prize Jackpot! Txt CLAIM to 81010"
+
+
+@pytest.fixture(scope='module')
+def lightweight():
+    # A fresh instance without the app's prediction cache, so every call is scored
+    return LightweightSpamFilter().load(MODEL_PATH)
+
+
+@pytest.mark.benchmark(group='lightweight_preprocess')
+def bench_preprocess_text_single(benchmark, lightweight):
+    benchmark(lightweight.preprocess_text, MESSAGE)
+
+
+@pytest.mark.benchmark(group='lightweight_preprocess')
+def bench_preprocess_text_batch(benchmark, lightweight, corpus):
+    def preprocess():
+        return [lightweight.preprocess_text(message) for message in corpus.messages]
+
+    benchmark.pedantic(preprocess, rounds=batch_rounds(corpus.scale))
+
+
+@pytest.mark.benchmark(group='lightweight_predict')
+def bench_lightweight_predict_single(benchmark, lightweight):
+    benchmark(lightweight.predict, MESSAGE)
+
+
+@pytest.mark.benchmark(group='lightweight_predict')
+def bench_lightweight_predict_batch(benchmark, lightweight, corpus):
+    benchmark.pedantic(lightweight.predict_batch, (corpus.messages,), rounds=batch_rounds(corpus.scale))
+
+
+@pytest.mark.benchmark(group='lightweight_load')
+def bench_lightweight_load(benchmark):
+    benchmark.pedantic(lambda: LightweightSpamFilter().load(MODEL_PATH), rounds=10)
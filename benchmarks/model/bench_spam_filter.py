@@ -0,0 +1,84 @@
+"""Stage timings of SpamFilter for one message and for whole corpora."""
+import contextlib
+import io
+
+import pytest
+
+from conftest import batch_rounds
+from src.model.spam_filter import SpamFilter
+
+MESSAGE = "URGENT! You have won a 1 week FREE membership in our £100,000 prize Jackpot! Txt CLAIM to 81010"
+
+
+@pytest.mark.benchmark(group='clean_text')
+def bench_clean_text_single(benchmark, model):
+    benchmark(model.clean_text, MESSAGE)
+
+
+@pytest.mark.benchmark(group='clean_text')
+def bench_clean_batch(benchmark, model, corpus):
+    benchmark.pedantic(model.clean_batch, (corpus.messages,), rounds=batch_rounds(corpus.scale))
+
+
+@pytest.mark.benchmark(group='transform')
+def bench_transform_single(benchmark, model):
+    clean_message = model.clean_text(MESSAGE)
+    benchmark(model.vectorizer.transform, [clean_message])
+
+
+@pytest.mark.benchmark(group='transform')
+def bench_transform_batch(benchmark, model, clean_corpus, scale):
+    benchmark.pedantic(model.vectorizer.transform, (clean_corpus,), rounds=batch_rounds(scale))
+
+
+@pytest.mark.benchmark(group='classify')
+def bench_predict_proba_single(benchmark, model):
+    benchmark(model.classifier.predict_proba, model.vectorizer.transform([model.clean_text(MESSAGE)]))
+
+
+@pytest.mark.benchmark(group='classify')
+def bench_predict_proba_batch(benchmark, model, features, scale):
+    benchmark.pedantic(model.classifier.predict_proba, (features,), rounds=batch_rounds(scale))
+
+
+@pytest.mark.benchmark(group='classify')
+def bench_classifier_predict_batch(benchmark, model, features, scale):
+    benchmark.pedantic(model.classifier.predict, (features,), rounds=batch_rounds(scale))
+
+
+@pytest.mark.benchmark(group='end_to_end')
+def bench_predict_single(benchmark, model):
+    benchmark(model.predict, MESSAGE)
+
+
+@pytest.mark.benchmark(group='end_to_end')
+def bench_predict_batch(benchmark, model, corpus):
+    benchmark.pedantic(model.predict_batch, (corpus.messages,), rounds=batch_rounds(corpus.scale))
+
+
+@pytest.mark.benchmark(group='train')
+def bench_train(benchmark, corpus):
+    def train():
+        with contextlib.redirect_stdout(io.StringIO()):
+            SpamFilter().train(corpus.path)
+
+    benchmark.pedantic(train, rounds=min(batch_rounds(corpus.scale), 3))
+
+
+@pytest.mark.benchmark(group='persistence')
+def bench_save_model(benchmark, model, tmp_path):
+    benchmark.pedantic(model.save_model, (str(tmp_path / 'model.pkl'),), rounds=10)
+
+
+@pytest.mark.benchmark(group='persistence')
+def bench_load_model(benchmark, model, tmp_path):
+    path = str(tmp_path / 'model.pkl')
+    model.save_model(path)
+    benchmark.pedantic(SpamFilter.load_model, (path,), rounds=10)
+
+
+@pytest.mark.benchmark(group='persistence')
+def bench_load_mapped_model(benchmark, model, tmp_path):
+    path = str(tmp_path / 'model')
+    model.export_model(path)
+    benchmark.pedantic(SpamFilter.load_model, (path,), rounds=10)
@@ -0,0 +1,98 @@
+"""Fixtures for the model microbenchmarks (pytest-benchmark).
+
+    python -m pytest benchmarks/model                          # print timings
+    python -m pytest benchmarks/model --benchmark-compare      # fail on regressions
+    python -m pytest benchmarks/model --benchmark-save=baseline
+
+Results are stored in benchmarks/baselines/model/<machine id>/ and
+``--benchmark-compare`` compares with the latest file stored for this
+machine. Any stage whose fastest round is slower than the baseline by more
+than ``--max-regression`` fails the run. Batch stages run on
+data/raw/spam.csv and on synthetic corpora ``--corpus-scales`` times its
+size, whose extra copies shuffle the words of each message so they are not
+exact repeats.
+"""
+import contextlib
+import csv
+import io
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from src.model.spam_filter import DEFAULT_DATA_PATH, SpamFilter
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'baselines', 'model')
+
+# Timed rounds for batch stages; the 100x corpus takes seconds per round
+BATCH_ROUNDS = {1: 10, 10: 3}
+
+
+def pytest_addoption(parser):
+    parser.addoption('--corpus-scales', default='1,10,100',
+                     help='comma-separated multiples of spam.csv for the batch benchmarks')
+    parser.addoption('--max-regression', default='25%',
+                     help='allowed slowdown of the fastest round versus the baseline, e.g. 25%% or 0.002 (seconds)')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # Runs before pytest-benchmark reads its options
+    if not config.pluginmanager.hasplugin('benchmark'):
+        return
+    from pytest_benchmark.utils import parse_compare_fail
+    if config.option.benchmark_storage == 'file://./.benchmarks':
+        config.option.benchmark_storage = 'file://' + BASELINE_DIR
+    if config.option.benchmark_compare and not config.option.benchmark_compare_fail:
+        config.option.benchmark_compare_fail = [parse_compare_fail('min:' + config.option.max_regression)]
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        scales = [int(scale) for scale in metafunc.config.getoption('corpus_scales').split(',')]
+        metafunc.parametrize('scale', scales, ids=[f'{scale}x' for scale in scales], scope='session')
+
+
+def batch_rounds(scale):
+    return BATCH_ROUNDS.get(scale, 1)
+
+
+@pytest.fixture(scope='session')
+def rows():
+    with open(DEFAULT_DATA_PATH, encoding='utf-8', newline='') as f:
+        return [(row[0], row[1]) for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)]
+
+
+@pytest.fixture(scope='session')
+def model():
+    spam_filter = SpamFilter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        spam_filter.train(DEFAULT_DATA_PATH)
+    return spam_filter
+
+
+@pytest.fixture(scope='session')
+def corpus(rows, scale, tmp_path_factory):
+    rng = random.Random(scale)
+    labeled = list(rows)
+    for _ in range(scale - 1):
+        for label, message in rows:
+            words = message.split()
+            rng.shuffle(words)
+            labeled.append((label, ' '.join(words)))
+    path = tmp_path_factory.mktemp('corpus') / f'spam_{scale}x.tsv'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_NONE, quotechar=None).writerows(labeled)
+    return SimpleNamespace(scale=scale, path=str(path), labels=[label for label, _ in labeled],
+                           messages=[message for _, message in labeled])
+
+
+@pytest.fixture(scope='session')
+def clean_corpus(model, corpus):
+    return model.clean_batch(corpus.messages)
+
+
+@pytest.fixture(scope='session')
+def features(model, clean_corpus):
+    return model.vectorizer.transform(clean_corpus)
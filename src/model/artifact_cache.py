@@ -0,0 +1,140 @@
+"""Content-addressed cache of training artifacts (cleaned text, feature matrices).
+
+An artifact is stored under a key hashed from its stage name and inputs:
+the SHA-256 of the data file, the stop words, the vectorizer parameters and
+the keys of the artifacts it was derived from. Identical inputs always map
+to the same file, so a rebuild reuses every stage whose inputs did not change
+and recomputes only the rest; stale entries are never read and the whole
+directory can be deleted at any time. Bump ``ARTIFACT_VERSION`` when the
+cleaning code or the stored layout changes.
+
+Artifacts are dicts of NumPy arrays, SciPy sparse matrices and lists of
+strings, written as one uncompressed ``.npz`` file per artifact. SciPy is
+only imported to read or write one, so the web app can import this module
+without it.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+ARTIFACT_VERSION = 2
+DEFAULT_ARTIFACT_DIR = 'data/cache/artifacts'
+
+
+def file_digest(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pack_strings(strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data, offsets):
+    blob = data.tobytes()
+    return [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _encode(artifact):
+    from scipy import sparse
+    arrays, kinds = {}, {}
+    for name, value in artifact.items():
+        if sparse.issparse(value):
+            value = sparse.csr_matrix(value)
+            kinds[name] = 'csr'
+            arrays.update({f'{name}__data': value.data, f'{name}__indices': value.indices,
+                           f'{name}__indptr': value.indptr, f'{name}__shape': np.array(value.shape)})
+        elif isinstance(value, np.ndarray):
+            kinds[name] = 'array'
+            arrays[name] = value
+        else:
+            kinds[name] = 'strings'
+            arrays[f'{name}__utf8'], arrays[f'{name}__offsets'] = _pack_strings(value)
+    arrays['__kinds__'] = np.array(json.dumps(kinds))
+    return arrays
+
+
+def _decode(arrays):
+    from scipy import sparse
+    artifact = {}
+    for name, kind in json.loads(str(arrays['__kinds__'])).items():
+        if kind == 'csr':
+            artifact[name] = sparse.csr_matrix(
+                (arrays[f'{name}__data'], arrays[f'{name}__indices'], arrays[f'{name}__indptr']),
+                shape=tuple(arrays[f'{name}__shape'])
+            )
+        elif kind == 'array':
+            artifact[name] = arrays[name]
+        else:
+            artifact[name] = _unpack_strings(arrays[f'{name}__utf8'], arrays[f'{name}__offsets'])
+    return artifact
+
+
+class ArtifactCache:
+    def __init__(self, root=DEFAULT_ARTIFACT_DIR):
+        self.root = root
+        self.hits = []
+        self.misses = []
+        self.timings = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def file_digest(self, path):
+        """SHA-256 of a file, remembered while its size and mtime stay the same."""
+        stat = os.stat(path)
+        signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(signature)
+        if digest is None:
+            digest = file_digest(path)
+            with self._lock:
+                self._digests[signature] = digest
+        return digest
+
+    @staticmethod
+    def key(stage, inputs):
+        """Hex key of stage for JSON-serialisable inputs; other values are keyed by their repr."""
+        payload = json.dumps({'version': ARTIFACT_VERSION, 'stage': stage, 'inputs': inputs},
+                             sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, key[:32] + '.npz')
+
+    def get_or_build(self, stage, inputs, build):
+        """Return (key, artifact), loading it from disk or calling build() and storing the result."""
+        key = self.key(stage, inputs)
+        path = self.path(stage, key)
+        start = time.perf_counter()
+        try:
+            with np.load(path) as arrays:
+                artifact = _decode(arrays)
+        except (OSError, ValueError, KeyError):
+            # Missing, or left unreadable by an interrupted write: build it again
+            artifact = None
+        if artifact is not None:
+            self.hits.append(stage)
+        else:
+            artifact = build()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # np.savez appends .npz to names without it, so the temporary name keeps the suffix
+            tmp_path = f'{path[:-4]}.{os.getpid()}.tmp.npz'
+            np.savez(tmp_path, **_encode(artifact))
+            os.replace(tmp_path, path)
+            self.misses.append(stage)
+        self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+        return key, artifact
+
+    def stats(self):
+        return {'root': self.root, 'hits': list(self.hits), 'misses': list(self.misses),
+                'seconds': {stage: round(seconds, 4) for stage, seconds in self.timings.items()}}
@@ -0,0 +1,152 @@
+"""Stream a large TSV export through the spam filter in bounded memory.
+
+Input is read in chunks (``label<TAB>message`` like data/raw/spam.csv, or
+``message`` only with ``--no-label``), scored with ``predict_batch`` and
+written incrementally as TSV, NDJSON or Parquet. With ``--workers N`` chunks
+are scored by a ``ScoringEngine`` process pool with at most ``2 * N`` chunks
+in flight.
+
+    python -m src.model.batch_score export.tsv -o scores.ndjson --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+from src.model.engine import ScoringEngine
+from src.model.spam_filter import default_model_path
+
+FORMATS = ('tsv', 'ndjson', 'parquet')
+
+
+def read_chunks(path, chunk_size, has_label=True):
+    names = ['label', 'message'] if has_label else ['message']
+    source = sys.stdin if path == '-' else path
+    reader = pd.read_csv(source, sep='\t', header=None, names=names, chunksize=chunk_size,
+                         dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+    for chunk in reader:
+        labels = chunk['label'].tolist() if has_label else None
+        yield labels, chunk['message'].tolist()
+
+
+class TsvWriter:
+    def __init__(self, f, columns):
+        self.writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(zip(*rows.values()))
+
+    def close(self):
+        pass
+
+
+class NdjsonWriter:
+    def __init__(self, f, columns):
+        self.f = f
+
+    def write(self, rows):
+        columns = list(rows)
+        self.f.writelines(json.dumps(dict(zip(columns, values))) + '\n' for values in zip(*rows.values()))
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Parquet output requires pyarrow (pip install pyarrow)')
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.writer = None
+
+    def write(self, rows):
+        table = self.pa.table(rows)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(output, output_format, columns):
+    if output_format == 'parquet':
+        if output == '-':
+            raise SystemExit('Parquet output needs a file path')
+        return ParquetWriter(output, columns), None
+    f = sys.stdout if output == '-' else open(output, 'w', encoding='utf-8', newline='')
+    writer_cls = TsvWriter if output_format == 'tsv' else NdjsonWriter
+    return writer_cls(f, columns), f
+
+
+def infer_format(output):
+    extension = os.path.splitext(output)[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'ndjson'
+    if extension in ('parquet', 'pq'):
+        return 'parquet'
+    return 'tsv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a TSV export with the spam filter')
+    parser.add_argument('input', help="label<TAB>message file, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output file, or '-' for stdout")
+    parser.add_argument('-f', '--format', choices=FORMATS, help='output format (default: from the extension)')
+    parser.add_argument('-m', '--model', default=None, help='model directory or pickle')
+    parser.add_argument('--no-label', dest='has_label', action='store_false', help='input has only a message column')
+    parser.add_argument('--include-message', action='store_true', help='copy the message into the output')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('-w', '--workers', type=int, default=1)
+    parser.add_argument('--progress-every', type=float, default=5.0, help='seconds between progress reports')
+    args = parser.parse_args(argv)
+
+    model_path = args.model or default_model_path()
+    output_format = args.format or infer_format(args.output)
+    columns = ['row'] + (['label'] if args.has_label else []) + (['message'] if args.include_message else [])
+    columns += ['prediction', 'probability']
+    writer, f = open_writer(args.output, output_format, columns)
+
+    start = last_report = time.perf_counter()
+    rows = 0
+    try:
+        with ScoringEngine(model_path=model_path, workers=args.workers) as engine:
+            chunks = ((chunk, chunk[1]) for chunk in read_chunks(args.input, args.chunk_size, args.has_label))
+            for (labels, messages), predictions, probabilities in engine.map_batches(chunks):
+                output = {'row': list(range(rows, rows + len(messages)))}
+                if args.has_label:
+                    output['label'] = labels
+                if args.include_message:
+                    output['message'] = messages
+                output['prediction'] = predictions.tolist()
+                output['probability'] = probabilities.tolist()
+                writer.write(output)
+                rows += len(messages)
+
+                now = time.perf_counter()
+                if now - last_report >= args.progress_every:
+                    last_report = now
+                    print(f'{rows} messages, {rows / (now - start):.0f} msg/s', file=sys.stderr)
+    finally:
+        writer.close()
+        if f is not None and f is not sys.stdout:
+            f.close()
+
+    elapsed = time.perf_counter() - start
+    print(f'Scored {rows} messages in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):.0f} msg/s) with '
+          f'{args.workers} worker(s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
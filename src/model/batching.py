@@ -0,0 +1,100 @@
+"""Coalesce concurrent single-message requests into vectorized batches.
+
+Each ``await batcher.predict(message)`` joins a queue. A collector task takes
+the first waiting message, gathers more until ``max_batch_size`` messages
+are queued or ``max_wait`` seconds have passed, scores the batch with one
+call and resolves every caller's future. Scoring runs in an executor thread
+so the event loop keeps accepting requests, which then form the next batch.
+"""
+import asyncio
+
+
+class MicroBatcher:
+    """score(messages) must return one result per message, in order."""
+
+    def __init__(self, score, max_batch_size=64, max_wait=0.002, executor=None):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = executor
+        self.batches = 0
+        self.messages = 0
+        self.largest_batch = 0
+        self._queue = None
+        self._task = None
+
+    async def predict(self, message):
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._collect())
+        future = loop.create_future()
+        self._queue.put_nowait((message, future))
+        return await future
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError('Batcher closed'))
+        self._task = None
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'messages': self.messages,
+            'mean_batch_size': self.messages / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'max_batch_size': self.max_batch_size,
+            'max_wait': self.max_wait,
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._score(loop, batch)
+
+    async def _score(self, loop, batch):
+        # Callers that gave up (e.g. disconnected clients) are dropped before scoring
+        batch = [(message, future) for message, future in batch if not future.done()]
+        if not batch:
+            return
+        self.batches += 1
+        self.messages += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            results = await loop.run_in_executor(self.executor, self.score, [message for message, _ in batch])
+        except asyncio.CancelledError:
+            # close() while the batch is being scored: its callers would otherwise wait forever
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError('Batcher closed'))
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,137 @@
+"""Bounded LRU/TTL cache of predictions keyed on the cleaned message text.
+
+SMS spam campaigns repeat the same text many times, so a cache in front of
+the models skips vectorization and scoring for repeats. Keys are BLAKE2b
+digests of the cleaned text, entries are bounded by count and approximate
+bytes, and the cache is cleared whenever the model behind it changes.
+Only the standard library is used so the serverless app can import it.
+"""
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    def __init__(self, max_entries=10000, max_bytes=8 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # The model the cache currently belongs to (see attach)
+        self.owner = None
+
+    @staticmethod
+    def key(clean_text):
+        return hashlib.blake2b(clean_text.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def put(self, key, prediction, probability):
+        with self._lock:
+            self._put(key, prediction, probability)
+
+    def predict(self, clean_texts, score, owner=None):
+        """Return (predictions, probabilities) lists, scoring only the misses.
+
+        score is called once with the list of cleaned texts that were not
+        cached and must return (predictions, probabilities) for them. An
+        owner other than the one the cache is attached to scores everything
+        and neither reads nor stores entries.
+        """
+        keys = [self.key(text) for text in clean_texts]
+        results = [None] * len(keys)
+        with self._lock:
+            generation = self.invalidations
+            detached = owner is not None and owner is not self.owner
+            if not detached:
+                for i, key in enumerate(keys):
+                    results[i] = self._get(key)
+        if detached:
+            predictions, probabilities = score(list(clean_texts))
+            return list(predictions), [float(probability) for probability in probabilities]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            predictions, probabilities = score([clean_texts[i] for i in missing])
+            with self._lock:
+                # Scores from a model that was replaced meanwhile must not be stored
+                store = generation == self.invalidations
+                for i, prediction, probability in zip(missing, predictions, probabilities):
+                    results[i] = (prediction, float(probability))
+                    if store:
+                        self._put(keys[i], prediction, float(probability))
+        return [result[0] for result in results], [result[1] for result in results]
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def attach(self, owner):
+        """Empty the cache and hand it to owner; requests still running on the previous owner bypass it."""
+        with self._lock:
+            self._clear()
+            self.owner = owner
+
+    def _clear(self):
+        self._entries.clear()
+        self.bytes = 0
+        self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        prediction, probability, expires, size = entry
+        if expires is not None and expires < time.monotonic():
+            del self._entries[key]
+            self.bytes -= size
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return prediction, probability
+
+    def _put(self, key, prediction, probability):
+        if self.max_entries <= 0:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[3]
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        entry = (prediction, probability, expires, 0)
+        size = sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(probability)
+        self._entries[key] = entry[:3] + (size,)
+        self.bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted[3]
+            self.evictions += 1
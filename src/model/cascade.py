@@ -0,0 +1,165 @@
+"""Two-stage cascade: cheap checks decide confident messages, the full model the rest.
+
+The first stage runs on every message. A keyword/regex prefilter labels
+spam outright when a message matches a pattern that is practically only
+seen in spam (premium-rate numbers, "txt WIN to 80082" short codes, prices
+per message, "T&C"...), and the dependency-free ``LightweightSpamFilter``
+scores everything else. Only messages whose lightweight spam probability
+falls strictly inside the uncertainty band ``(low, high)`` are sent to the
+full model, which can be a ``SpamFilter``, ``MappedSpamFilter`` or
+``CompiledSpamFilter``. Widening the band sends more messages to the full
+model, trading throughput for agreement with it. A bound of 0 or 1 also
+takes the lightweight model's saturated probabilities on that side, so
+``(0, 1)`` sends all of them.
+
+A rule's regex is only searched when one of its trigger substrings occurs
+in the lowercased message, so most messages never reach the regex engine.
+Routing counts per stage and per rule are kept for ``stats()`` and the
+/metrics collector.
+
+    cascade = CascadeSpamFilter(LightweightSpamFilter().load(DEFAULT_LIGHTWEIGHT_MODEL),
+                                SpamFilter.load_model('data/processed/spam_filter_model'))
+    cascade.predict('URGENT! Call 09061701461 to claim your prize')
+"""
+import os
+import re
+import threading
+from functools import partial
+
+import numpy as np
+
+from src.model.lightweight import LightweightSpamFilter
+from src.model.metrics import registry as metrics
+from src.model.scoring import ScorerMixin
+
+DEFAULT_LIGHTWEIGHT_MODEL = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'api', 'lightweight_model.bin'
+)
+# Asymmetric: the lightweight model's ham calls hold up at lower confidence than its spam calls
+DEFAULT_BAND = (0.1, 0.999)
+STAGES = ('rules', 'lightweight', 'full')
+
+# (name, trigger substrings, pattern). Triggers are looked up in the lowercased
+# message; patterns are searched case-insensitively in the message itself, and
+# (?-i:...) marks the parts that are case-sensitive. The rules were chosen on
+# the 80% training split of SpamFilter.train, where none of them matches a ham
+# message; benchmarks/bench_cascade.py reports their precision on the held-out
+# 20%. Generic phrases ("claim ... now", "you have been selected", "16+") are
+# left to the lightweight model, since they also occur in ordinary messages.
+SPAM_RULES = (
+    # A keyword in capitals texted to a 5-digit short code: "Txt WIN to 80082"
+    ('short_code', ('txt', 'text', 'send', 'reply', 'sms'),
+     r'\b(?:txt|text|send|reply|sms)\b(?:\s+the\s+word)?:?\s+(?-i:[A-Z][A-Z0-9]+)\b[^.!?\n]{0,20}?'
+     r'\bto\s*:?\s*(?:no:?\s*)?\d{5}\b'),
+    ('premium_number', ('09', '087', '0845'), r'\b0(?:9\d{2}|87\d|845)\s?\d{3}\s?\d{3,4}\b'),
+    ('cash_prize', ('£', '$', '€'),
+     r'[£$€]\s?\d{3}[\d,]*(?:\.\d\d)?\s*(?:cash|prize|award|bonus|reward)|\b(?:prize|award)\b[^.\n]{0,30}[£$€]\s?\d{3}'),
+    ('terms_apply', ('&',), r'\bt\s?&\s?c'),
+    ('premium_rate', ('msg', 'min', 'txt', 'text', 'wk', 'week', 'sms', 'ppm'),
+     r'\b\d+(?:\.\d+)?p\s*(?:/|per)?\s*(?:msg|min|minute|txt|text|wk|week|sms)\b|\bp(?:er)?\s*msg\b'
+     r'|\b\d+ppm\b|£\d+(?:\.\d\d)?\s*/\s*(?:msg|min|wk|week)'),
+    ('opt_out', ('stop',), r'\b(?:txt|text|send|reply)\s+stop\b|\bstop\s+to\s+\d{5}\b'),
+)
+
+
+class CascadeSpamFilter(ScorerMixin):
+    """SpamFilter interface over a rule prefilter, a LightweightSpamFilter and a full model."""
+
+    def __init__(self, lightweight, full, band=DEFAULT_BAND, rules=SPAM_RULES, rule_probability=0.99):
+        low, high = band
+        if not 0.0 <= low <= high <= 1.0:
+            raise ValueError(f'band must satisfy 0 <= low <= high <= 1, got {band!r}')
+        self.lightweight = lightweight
+        self.full = full
+        self.band = (low, high)
+        self.rules = [(name, triggers, re.compile(pattern, re.IGNORECASE)) for name, triggers, pattern in rules]
+        self.rule_probability = rule_probability
+        self.prediction_cache = None
+        self.routed = dict.fromkeys(STAGES, 0)
+        self.rule_hits = dict.fromkeys((name for name, _, _ in self.rules), 0)
+        self._lock = threading.Lock()
+
+    @property
+    def near_duplicates(self):
+        return getattr(self.full, 'near_duplicates', None)
+
+    def match_rule(self, message):
+        """Name of the first spam rule message matches, or None."""
+        lowered = message.lower()
+        for name, triggers, pattern in self.rules:
+            for trigger in triggers:
+                if trigger in lowered:
+                    if pattern.search(message):
+                        return name
+                    break
+        return None
+
+    def clean_batch(self, texts):
+        # Cached and routed by the raw message: the rules see digits and symbols that cleaning removes
+        return list(texts)
+
+    def _predict_clean(self, messages):
+        predictions = [None] * len(messages)
+        probabilities = [0.0] * len(messages)
+        with metrics.stage('prefilter'):
+            matched = [self.match_rule(message) for message in messages]
+        rest = [i for i, rule in enumerate(matched) if rule is None]
+        uncertain = []
+        if rest:
+            low, high = self.band
+            cheap = self.lightweight.predict_batch([messages[i] for i in rest])
+            for i, prediction, probability in zip(rest, *cheap):
+                spam_probability = probability if prediction == 'spam' else 1.0 - probability
+                # A bound at 0 or 1 means no call on that side is confident enough
+                if (low == 0.0 or low < spam_probability) and (high == 1.0 or spam_probability < high):
+                    uncertain.append(i)
+                else:
+                    predictions[i], probabilities[i] = prediction, probability
+        if uncertain:
+            full = self.full.predict_batch([messages[i] for i in uncertain])
+            for i, prediction, probability in zip(uncertain, *full):
+                predictions[i], probabilities[i] = str(prediction), float(probability)
+        hits = [rule for rule in matched if rule is not None]
+        for i, rule in enumerate(matched):
+            if rule is not None:
+                predictions[i], probabilities[i] = 'spam', self.rule_probability
+        with self._lock:
+            self.routed['rules'] += len(hits)
+            self.routed['lightweight'] += len(rest) - len(uncertain)
+            self.routed['full'] += len(uncertain)
+            for rule in hits:
+                self.rule_hits[rule] += 1
+        return np.array(predictions, dtype=str), np.array(probabilities, dtype=np.float64)
+
+    def stats(self):
+        with self._lock:
+            routed = dict(self.routed)
+            rule_hits = {name: hits for name, hits in self.rule_hits.items() if hits}
+        total = sum(routed.values())
+        return {
+            'band': list(self.band),
+            'messages': total,
+            'routed': routed,
+            'fractions': {stage: count / total if total else 0.0 for stage, count in routed.items()},
+            'rule_hits': rule_hits,
+        }
+
+
+def parse_band(value):
+    """(low, high) from a 'low,high' string such as SPAM_CASCADE_BAND, or from a pair."""
+    if isinstance(value, str):
+        value = value.split(',')
+    low, high = (float(bound) for bound in value)
+    return low, high
+
+
+def load_cascade(load_full, lightweight_path, band, path):
+    return CascadeSpamFilter(LightweightSpamFilter().load(lightweight_path), load_full(path), band)
+
+
+def cascade_loader(load_full, lightweight_path=DEFAULT_LIGHTWEIGHT_MODEL, band=DEFAULT_BAND):
+    """Model loader for ModelReloader: load_full(path) wrapped in a cascade.
+
+    The loader pickles when load_full does, so spawned scoring workers can use it.
+    """
+    return partial(load_cascade, load_full, lightweight_path, band)
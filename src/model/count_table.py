@@ -0,0 +1,58 @@
+"""Compact, dependency-free on-disk format for LightweightSpamFilter counts.
+
+Layout (little-endian)::
+
+    header   magic b'SPMC', uint16 version, uint32 spam messages,
+             uint32 ham messages, uint32 vocabulary size, uint32 string bytes
+    strings  sorted vocabulary, UTF-8, newline separated
+    spam     uint32[vocabulary size] per-word counts in spam messages
+    ham      uint32[vocabulary size] per-word counts in ham messages
+
+Reading it only needs ``struct`` and ``array``, so the serverless app can load
+a model trained on the full corpus in a few milliseconds.
+"""
+import struct
+import sys
+from array import array
+
+MAGIC = b'SPMC'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIII')
+
+
+def write_count_table(path, spam_count, ham_count, spam_words, ham_words):
+    """Write message counts and per-class word counts to path."""
+    vocabulary = sorted(set(spam_words) | set(ham_words))
+    strings = '\n'.join(vocabulary).encode('utf-8')
+    spam = array('I', [spam_words.get(word, 0) for word in vocabulary])
+    ham = array('I', [ham_words.get(word, 0) for word in vocabulary])
+    if sys.byteorder == 'big':
+        spam.byteswap()
+        ham.byteswap()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, spam_count, ham_count, len(vocabulary), len(strings)))
+        f.write(strings)
+        spam.tofile(f)
+        ham.tofile(f)
+
+
+def read_count_table(path):
+    """Return (spam_count, ham_count, spam_words, ham_words) from a count table."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, spam_count, ham_count, size, string_bytes = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a version {VERSION} count table')
+    offset = HEADER.size
+    vocabulary = data[offset:offset + string_bytes].decode('utf-8').split('\n') if size else []
+    offset += string_bytes
+    spam = array('I')
+    spam.frombytes(data[offset:offset + 4 * size])
+    ham = array('I')
+    ham.frombytes(data[offset + 4 * size:offset + 8 * size])
+    if sys.byteorder == 'big':
+        spam.byteswap()
+        ham.byteswap()
+    spam_words = {word: count for word, count in zip(vocabulary, spam) if count}
+    ham_words = {word: count for word, count in zip(vocabulary, ham) if count}
+    return spam_count, ham_count, spam_words, ham_words
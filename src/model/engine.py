@@ -0,0 +1,150 @@
+"""Multi-process scoring engine sharing one read-only model across workers.
+
+The model is loaded once in the parent. Where ``fork`` is available the
+workers inherit it copy-on-write; the garbage collector is frozen first so
+collections do not dirty the shared pages, and a memory-mapped model
+(``SpamFilter.export_model``) is shared entirely through the page cache.
+Elsewhere, or with ``start_method='spawn'`` or ``'forkserver'``, each worker
+loads the model from ``model_path`` with ``loader``. Forking copies the
+parent's locks in whatever state other threads hold them, so a process that
+is already serving requests on several threads should use ``forkserver``.
+Such workers load the model when the pool starts them, possibly after a
+newer model was published at ``model_path``; given the ``version``
+(``model_version``) the parent loaded, they load a private copy checked to
+hold exactly that version instead.
+
+    from src.model.engine import score_many
+    for prediction, probability in score_many(messages, workers=4):
+        ...
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from itertools import islice
+
+from src.model.near_duplicate import index_path
+from src.model.reloader import ModelValidationError, model_version
+from src.model.spam_filter import SpamFilter, default_model_path
+
+_worker_model = None
+
+
+def _init_worker(loader, model_path):
+    global _worker_model
+    _worker_model = loader(model_path)
+
+
+def _score(messages):
+    return _worker_model.predict_batch(messages)
+
+
+class ScoringEngine:
+    def __init__(self, model=None, model_path=None, workers=None, chunk_size=1000,
+                 start_method=None, loader=SpamFilter.load_model, version=None):
+        self.model_path = model_path or default_model_path()
+        self.loader = loader
+        self.version = version
+        self.snapshot_dir = None
+        self.model = model if model is not None else loader(self.model_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        methods = multiprocessing.get_all_start_methods()
+        if start_method is None:
+            start_method = 'fork' if 'fork' in methods else 'spawn'
+        elif start_method not in methods:
+            start_method = 'spawn'
+        self.start_method = start_method
+        self.pool = None
+        if self.workers > 1:
+            self.pool = self._start_pool()
+
+    def _start_pool(self):
+        global _worker_model
+        if self.start_method == 'fork':
+            _worker_model = self.model
+            gc.freeze()
+            try:
+                return multiprocessing.get_context('fork').Pool(self.workers)
+            finally:
+                gc.unfreeze()
+        model_path = self.model_path if self.version is None else self._snapshot()
+        try:
+            return multiprocessing.get_context(self.start_method).Pool(
+                self.workers, initializer=_init_worker, initargs=(self.loader, model_path)
+            )
+        except BaseException:
+            self._remove_snapshot()
+            raise
+
+    def _snapshot(self):
+        # Copied once, so workers started (or restarted) later still load the validated version
+        self.snapshot_dir = tempfile.mkdtemp(prefix='spam-model-')
+        path = os.path.join(self.snapshot_dir, os.path.basename(os.path.normpath(self.model_path)))
+        try:
+            if os.path.isdir(self.model_path):
+                shutil.copytree(self.model_path, path)
+            else:
+                shutil.copy2(self.model_path, path)
+                if os.path.exists(index_path(self.model_path)):
+                    shutil.copy2(index_path(self.model_path), index_path(path))
+            if model_version(path) != self.version:
+                raise ModelValidationError(f'{self.model_path} changed after model {self.version} was loaded')
+        except BaseException:
+            self._remove_snapshot()
+            raise
+        return path
+
+    def _remove_snapshot(self):
+        if self.snapshot_dir is not None:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self.snapshot_dir = None
+
+    def map_batches(self, batches):
+        """Score (context, messages) pairs, yielding (context, predictions, probabilities) in order.
+
+        The context never leaves this process; at most 2 * workers batches are
+        in flight, so arbitrarily long iterables are scored in bounded memory.
+        """
+        if self.pool is None:
+            for context, messages in batches:
+                yield (context,) + tuple(self.model.predict_batch(messages))
+            return
+        pending = deque()
+        for context, messages in batches:
+            pending.append((context, self.pool.apply_async(_score, (messages,))))
+            if len(pending) >= 2 * self.workers:
+                context, result = pending.popleft()
+                yield (context,) + tuple(result.get())
+        while pending:
+            context, result = pending.popleft()
+            yield (context,) + tuple(result.get())
+
+    def score_many(self, messages, chunk_size=None):
+        """Yield (prediction, probability) for every message, in input order."""
+        chunk_size = chunk_size or self.chunk_size
+        messages = iter(messages)
+        chunks = iter(lambda: list(islice(messages, chunk_size)), [])
+        for _, predictions, probabilities in self.map_batches((None, chunk) for chunk in chunks):
+            yield from zip(predictions, probabilities)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self._remove_snapshot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def score_many(messages, workers=None, model=None, model_path=None, chunk_size=1000):
+    """Score an iterable of messages across worker processes, yielding (prediction, probability)."""
+    with ScoringEngine(model=model, model_path=model_path, workers=workers, chunk_size=chunk_size) as engine:
+        yield from engine.score_many(messages)
@@ -0,0 +1,156 @@
+"""Dependency-free multinomial Naive Bayes used by the serverless app.
+
+Word counts come from a count table built offline
+(``python -m src.training.build_lightweight_model``, see
+``src/model/count_table.py``) or from the small built-in training set, and are
+compiled into per-word log-probability dicts. Only the standard library is
+needed, so ``api/index.py`` deploys without NumPy or scikit-learn.
+"""
+import math
+
+from src.model.count_table import read_count_table
+from src.model.metrics import registry as metrics
+from src.model.preprocessing import LIGHTWEIGHT_STOP_WORDS as STOP_WORDS, tokenize_lightweight
+
+
+class LightweightSpamFilter:
+    def __init__(self):
+        self.spam_words = {}
+        self.ham_words = {}
+        self.spam_count = 0
+        self.ham_count = 0
+        self.vocabulary = set()
+        self.is_trained = False
+        self.prediction_cache = None
+    
+    def preprocess_text(self, text):
+        """Clean and preprocess text"""
+        return tokenize_lightweight(text, STOP_WORDS)
+    
+    def train(self):
+        """Train the spam filter with a lightweight dataset"""
+        # Training data: (message, label)
+        training_data = [
+            ("free money now click here urgent", "spam"),
+            ("congratulations you won million dollars", "spam"),
+            ("limited time offer click now", "spam"),
+            ("urgent your account will be closed", "spam"),
+            ("winner notification click claim prize", "spam"),
+            ("call now free consultation", "spam"),
+            ("credit card has been charged", "spam"),
+            ("act now limited time", "spam"),
+            ("earn money fast", "spam"),
+            ("guarantee profit investment", "spam"),
+            ("hello how are you today", "ham"),
+            ("meeting tomorrow afternoon", "ham"),
+            ("can you send report", "ham"),
+            ("thanks for help yesterday", "ham"),
+            ("looking forward weekend", "ham"),
+            ("see you conference", "ham"),
+            ("happy birthday great day", "ham"),
+            ("project deadline next week", "ham"),
+            ("lunch plans today", "ham"),
+            ("good morning everyone", "ham")
+        ]
+        
+        # Process training data
+        for text, label in training_data:
+            words = self.preprocess_text(text)
+            self.vocabulary.update(words)
+            
+            if label == "spam":
+                self.spam_count += 1
+                for word in words:
+                    self.spam_words[word] = self.spam_words.get(word, 0) + 1
+            else:
+                self.ham_count += 1
+                for word in words:
+                    self.ham_words[word] = self.ham_words.get(word, 0) + 1
+        
+        self.compile()
+        self.is_trained = True
+    
+    def load(self, path):
+        """Load word counts from a count table built offline and compile them"""
+        return self.load_counts(*read_count_table(path))
+    
+    def load_counts(self, spam_count, ham_count, spam_words, ham_words):
+        """Use message counts and per-class word counts, e.g. from count_messages, and compile them"""
+        self.spam_count, self.ham_count, self.spam_words, self.ham_words = spam_count, ham_count, spam_words, ham_words
+        self.vocabulary = set(self.spam_words) | set(self.ham_words)
+        self.compile()
+        self.is_trained = True
+        return self
+    
+    def compile(self):
+        """Freeze the word counts into log-prior and per-word log-likelihood tables"""
+        total_messages = self.spam_count + self.ham_count
+        self.spam_log_prior = math.log(self.spam_count / total_messages)
+        self.ham_log_prior = math.log(self.ham_count / total_messages)
+        
+        # Laplace smoothing; words never seen in a class share the unseen default
+        vocab_size = len(self.vocabulary)
+        spam_denominator = sum(self.spam_words.values()) + vocab_size
+        ham_denominator = sum(self.ham_words.values()) + vocab_size
+        self.spam_unseen_log_prob = math.log(1 / spam_denominator)
+        self.ham_unseen_log_prob = math.log(1 / ham_denominator)
+        self.spam_log_probs = {
+            word: math.log((count + 1) / spam_denominator) for word, count in self.spam_words.items()
+        }
+        self.ham_log_probs = {
+            word: math.log((count + 1) / ham_denominator) for word, count in self.ham_words.items()
+        }
+        
+        # Cached predictions belong to the previous tables
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+    
+    def predict(self, text):
+        """Predict if a text is spam or ham using Naive Bayes"""
+        predictions, probabilities = self.predict_batch([text])
+        return predictions[0], probabilities[0]
+    
+    def predict_batch(self, texts):
+        """Predict a batch of texts from the compiled log-probability tables"""
+        if not self.is_trained:
+            self.train()
+        
+        prediction_cache = self.prediction_cache
+        with metrics.stage('preprocess'):
+            word_lists = [self.preprocess_text(text) for text in texts]
+        if prediction_cache is not None and word_lists:
+            return prediction_cache.predict([' '.join(words) for words in word_lists], self._score_clean)
+        return self._score_words(word_lists)
+    
+    def _score_clean(self, clean_texts):
+        """Score cache misses given as space-joined token strings"""
+        return self._score_words([text.split() for text in clean_texts])
+    
+    def _score_words(self, word_lists):
+        """Score preprocessed token lists with the compiled tables"""
+        spam_log_probs, spam_unseen = self.spam_log_probs, self.spam_unseen_log_prob
+        ham_log_probs, ham_unseen = self.ham_log_probs, self.ham_unseen_log_prob
+        
+        predictions = []
+        probabilities = []
+        with metrics.stage('classify'):
+            for words in word_lists:
+                spam_score = sum([spam_log_probs.get(word, spam_unseen) for word in words], self.spam_log_prior)
+                ham_score = sum([ham_log_probs.get(word, ham_unseen) for word in words], self.ham_log_prior)
+                
+                # Normalise in log space so long messages cannot underflow to 0/0
+                evidence = _log_sum_exp(spam_score, ham_score)
+                if spam_score > ham_score:
+                    predictions.append("spam")
+                    probabilities.append(math.exp(spam_score - evidence))
+                else:
+                    predictions.append("ham")
+                    probabilities.append(math.exp(ham_score - evidence))
+        
+        return predictions, probabilities
+
+
+def _log_sum_exp(a, b):
+    """Numerically stable log(exp(a) + exp(b))"""
+    high = max(a, b)
+    return high + math.log(math.exp(a - high) + math.exp(b - high))
@@ -0,0 +1,393 @@
+"""Pickle-free, memory-mappable export format for SpamFilter models.
+
+A model directory contains:
+
+    meta.json               format version, classes, tokenizer settings, stop words,
+                            storage dtype, dequantization scale/offset and the
+                            UTF-8 length of the longest term
+    vocabulary_hashes.npy   uint64 [n_features], sorted 64-bit hashes of the terms
+    vocabulary_offsets.npy  [n_features + 1], where each term starts in the blob
+    vocabulary_blob.npy     uint8, the UTF-8 terms concatenated in hash order, zero-padded
+    feature_log_prob.npy    [n_classes, n_features], columns in hash order
+    class_log_prior.npy     float64 [n_classes]
+    near_duplicates.npz     optional near-duplicate spam index (see near_duplicate.py)
+
+The arrays are opened with ``numpy.load(mmap_mode='r')`` so every worker that
+loads the same directory shares the pages through the OS page cache, and
+nothing is unpickled. Only NumPy is needed to score. A token is looked up by
+binary search on the hashes and its bytes are compared with the blob, so the
+vocabulary costs its UTF-8 size plus 12 bytes a term. Versions 1 and 2 stored
+the vocabulary as a sorted fixed-width ``S`` array (``vocabulary.npy``) and
+still load.
+
+An export is written to a sibling temporary directory and renamed into
+place, so a process that loads the directory sees either the old or the new
+model, never a mix, and processes that already mapped the old files keep
+reading them: the old files are unlinked, not overwritten.
+
+For small deployments the export can drop terms that barely move the
+prediction (seen fewer than ``min_count`` times in training, or whose
+log-probabilities differ between classes by less than ``min_log_odds``; a
+dropped term is scored like any unknown token) and store the
+log-probabilities as float16 or int8. Quantized rows hold
+``(log_prob - offset) / scale`` with one scale and offset per class, and the
+scorer dequantizes only the columns a message uses.
+"""
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+from src.model.compiled import CompiledSpamFilter
+from src.model.metrics import registry as metrics
+from src.model.near_duplicate import NearDuplicateIndex, index_path
+from src.model.preprocessing import clean_batch, clean_text
+from src.model.scoring import ScorerMixin
+
+# Version 3 replaced the fixed-width vocabulary with hashes, offsets and a UTF-8 blob;
+# version 2 added the storage dtype, scale and offset; version 1 is float64 only
+FORMAT_VERSION = 3
+SUPPORTED_FORMAT_VERSIONS = (1, 2, 3)
+META_FILE = 'meta.json'
+VOCABULARY_FILE = 'vocabulary.npy'
+HASHES_FILE = 'vocabulary_hashes.npy'
+OFFSETS_FILE = 'vocabulary_offsets.npy'
+BLOB_FILE = 'vocabulary_blob.npy'
+FEATURE_LOG_PROB_FILE = 'feature_log_prob.npy'
+CLASS_LOG_PRIOR_FILE = 'class_log_prior.npy'
+STORAGE_DTYPES = ('float64', 'float16', 'int8')
+# The blob ends in 8 zero bytes so every term can be read as whole 8-byte words
+BLOB_PADDING = bytes(8)
+# WORD_MASKS[n] keeps the first n bytes of a little-endian word
+WORD_MASKS = np.array([(1 << (8 * n)) - 1 for n in range(9)], dtype=np.uint64)
+HASH_SEED = np.uint64(0x9e3779b97f4a7c15)
+HASH_MULTIPLIER = np.uint64(0xff51afd7ed558ccd)
+WORD_BITS = (1 << 64) - 1
+# Up to this many tokens a lookup hashes and compares them in Python, which for a
+# single message is faster than the vectorized path's fixed cost per NumPy call
+SMALL_LOOKUP_TOKENS = 64
+
+
+def term_words(terms):
+    """(words, lengths) of a numpy 'S' array: each term as zero-padded little-endian 8-byte words."""
+    width = -(-terms.itemsize // 8)
+    codes = np.zeros((len(terms), 8 * width), dtype=np.uint8)
+    codes[:, :terms.itemsize] = terms.view(np.uint8).reshape(len(terms), terms.itemsize)
+    return codes.view('<u8'), np.char.str_len(terms)
+
+
+def term_hashes(terms):
+    """64-bit hash of every UTF-8 byte string of terms (a numpy 'S' array), independent of its width."""
+    return hash_words(*term_words(terms))
+
+
+def hash_words(words, lengths):
+    hashes = HASH_SEED ^ lengths.astype(np.uint64)
+    for i in range(words.shape[1]):
+        # Words past a term's end are padding and leave its hash unchanged
+        mixed = (hashes ^ words[:, i]) * HASH_MULTIPLIER
+        hashes = np.where(lengths > 8 * i, mixed ^ (mixed >> np.uint64(29)), hashes)
+    return hashes
+
+
+def token_hash(token):
+    """hash_words of one UTF-8 byte string, with Python integers."""
+    value = int(HASH_SEED) ^ len(token)
+    for i in range(0, len(token), 8):
+        mixed = ((value ^ int.from_bytes(token[i:i + 8], 'little')) * int(HASH_MULTIPLIER)) & WORD_BITS
+        value = mixed ^ (mixed >> 29)
+    return value
+
+
+def pack_terms(terms):
+    """(hashes, offsets, blob, order): the vocabulary arrays of terms sorted by hash.
+
+    order[i] is the index in terms of the i-th stored term.
+    """
+    encoded = np.array([term.encode('utf-8') for term in terms], dtype=bytes)
+    hashes = term_hashes(encoded)
+    order = np.argsort(hashes, kind='stable')
+    hashes = hashes[order]
+    if len(hashes) and (hashes[1:] == hashes[:-1]).any():
+        raise ValueError('Two vocabulary terms have the same 64-bit hash')
+    blob = b''.join(encoded[i] for i in order)
+    offsets = np.zeros(len(terms) + 1, dtype=np.uint32 if len(blob) < 2 ** 32 else np.uint64)
+    np.cumsum(np.char.str_len(encoded[order]), out=offsets[1:])
+    return hashes, offsets, np.frombuffer(blob + BLOB_PADDING, dtype=np.uint8), order
+
+
+def kept_terms(classifier, min_count=0, min_log_odds=0.0):
+    """Boolean mask of the feature columns an export keeps."""
+    log_prob = classifier.feature_log_prob_
+    log_odds = log_prob.max(axis=0) - log_prob.min(axis=0)
+    return (classifier.feature_count_.sum(axis=0) >= min_count) & (log_odds >= min_log_odds)
+
+
+def quantize(feature_log_prob, dtype):
+    """(stored array, scale, offset) with feature_log_prob ~= stored * scale + offset per class row."""
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f'dtype must be one of {STORAGE_DTYPES}, got {dtype!r}')
+    if dtype == 'float64' or not feature_log_prob.size:
+        return np.ascontiguousarray(feature_log_prob, dtype=np.float64), None, None
+    low = feature_log_prob.min(axis=1)
+    high = feature_log_prob.max(axis=1)
+    # Centering each row keeps the values small, where float16 is most precise
+    offset = (low + high) / 2
+    if dtype == 'float16':
+        scale = np.ones_like(offset)
+    else:
+        scale = (high - low) / 254
+        scale[scale == 0] = 1.0
+    stored = (feature_log_prob - offset[:, None]) / scale[:, None]
+    if dtype == 'int8':
+        stored = np.rint(stored)
+    return np.ascontiguousarray(stored, dtype=dtype), scale, offset
+
+
+def export_mapped_model(spam_filter, path, dtype='float64', min_count=0, min_log_odds=0.0):
+    """Write a fitted SpamFilter to the directory path in the mapped format.
+
+    min_count and min_log_odds prune terms and dtype sets how the
+    log-probabilities are stored; the defaults keep the model exact.
+    """
+    vectorizer = spam_filter.vectorizer
+    if not hasattr(vectorizer, 'vocabulary_'):
+        raise ValueError('Only a fitted CountVectorizer can be exported to the mapped format')
+    if vectorizer.analyzer != 'word' or tuple(vectorizer.ngram_range) != (1, 1) or vectorizer.tokenizer is not None:
+        raise ValueError('The mapped format supports word unigrams with the default tokenizer only')
+
+    classifier = spam_filter.classifier
+    keep = kept_terms(classifier, min_count, min_log_odds)
+    terms = [term for term, column in vectorizer.vocabulary_.items() if keep[column]]
+    hashes, offsets, blob, order = pack_terms(terms)
+    columns = [vectorizer.vocabulary_[terms[i]] for i in order]
+    feature_log_prob, scale, offset = quantize(classifier.feature_log_prob_[:, columns], dtype)
+
+    path = os.path.normpath(path)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        for name, array in ((HASHES_FILE, hashes), (OFFSETS_FILE, offsets), (BLOB_FILE, blob)):
+            np.save(os.path.join(tmp_path, name), array, allow_pickle=False)
+        np.save(os.path.join(tmp_path, FEATURE_LOG_PROB_FILE), feature_log_prob, allow_pickle=False)
+        np.save(os.path.join(tmp_path, CLASS_LOG_PRIOR_FILE),
+                np.asarray(classifier.class_log_prior_, dtype=np.float64), allow_pickle=False)
+        write_meta(tmp_path, {
+            'format_version': FORMAT_VERSION,
+            'classes': [str(label) for label in classifier.classes_],
+            'token_pattern': vectorizer.token_pattern,
+            'lowercase': vectorizer.lowercase,
+            'stop_words': sorted(spam_filter.stop_words),
+            'dtype': str(feature_log_prob.dtype),
+            'scale': None if scale is None else scale.tolist(),
+            'offset': None if offset is None else offset.tolist(),
+            'max_term_bytes': longest_term(offsets),
+            'pruning': {'min_count': min_count, 'min_log_odds': min_log_odds,
+                        'terms': len(terms), 'fitted_terms': len(vectorizer.vocabulary_)},
+        })
+        if spam_filter.near_duplicates is not None:
+            spam_filter.near_duplicates.save(index_path(tmp_path))
+        replace_directory(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def write_meta(path, meta):
+    with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+def replace_directory(new_path, path):
+    """Rename the directory new_path to path, removing the directory path held before.
+
+    A directory cannot be renamed over a non-empty one, so the old directory
+    is first renamed aside; a load that runs between the two renames fails
+    and is retried by the reloader rather than reading a mixed model.
+    """
+    old_path = None
+    if os.path.isdir(path):
+        old_path = f'{path}.old-{os.getpid()}'
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.rename(path, old_path)
+    try:
+        os.rename(new_path, path)
+    except OSError:
+        if old_path is not None:
+            os.rename(old_path, path)
+        raise
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def longest_term(offsets):
+    """UTF-8 length of the longest term of a vocabulary's offsets."""
+    return int(np.diff(offsets).max()) if len(offsets) > 1 else 0
+
+
+def unpack_fixed_width(vocabulary):
+    """(hashes, offsets, blob, hash_columns) of a version 1 or 2 sorted 'S' vocabulary array."""
+    vocabulary = np.asarray(vocabulary)
+    hashes = term_hashes(vocabulary)
+    hash_columns = np.argsort(hashes, kind='stable')
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.char.str_len(vocabulary), out=offsets[1:])
+    blob = np.frombuffer(b''.join(vocabulary.tolist()) + BLOB_PADDING, dtype=np.uint8)
+    return hashes[hash_columns], offsets, blob, hash_columns
+
+
+def is_mapped_model(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+class MappedSpamFilter(ScorerMixin):
+    """Scores messages from a mapped model directory with the SpamFilter interface."""
+
+    def __init__(self, classes, hashes, offsets, blob, feature_log_prob, class_log_prior,
+                 token_pattern, lowercase, stop_words, scale=None, offset=None, hash_columns=None,
+                 max_term_bytes=None):
+        self.classes_ = np.asarray(classes)
+        # Term i is blob[offsets[i]:offsets[i + 1]]; hashes are sorted and belong to
+        # columns 0, 1, ... unless hash_columns maps them (version 1 and 2 exports)
+        # np.asarray keeps the memory map but skips the np.memmap subclass overhead on every index
+        self.hashes = np.asarray(hashes)
+        self.offsets = np.asarray(offsets)
+        self.blob = np.asarray(blob)
+        self.hash_columns = hash_columns
+        # Longer tokens cannot be terms; dropping them first bounds the token array's width
+        self.max_term_bytes = longest_term(offsets) if max_term_bytes is None else max_term_bytes
+        # Unaligned 8-byte words starting at every byte of the blob
+        self.blob_words = np.ndarray((len(blob) - 7,), dtype='<u8', buffer=blob, strides=(1,))
+        self.blob_view = memoryview(self.blob)
+        self.feature_log_prob = np.asarray(feature_log_prob)
+        self.class_log_prior = np.asarray(class_log_prior)
+        # Set for quantized models: log_prob = stored * scale + offset, per class
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.offset = None if offset is None else np.asarray(offset, dtype=np.float64)
+        self.token_re = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.stop_words = frozenset(stop_words)
+        self.prediction_cache = None
+        self.near_duplicates = None
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') not in SUPPORTED_FORMAT_VERSIONS:
+            raise ValueError(f'{path} has unsupported format version {meta.get("format_version")}')
+        mmap_mode = 'r' if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode, allow_pickle=False)
+
+        hash_columns = None
+        if meta['format_version'] < 3:
+            hashes, offsets, blob, hash_columns = unpack_fixed_width(load_array(VOCABULARY_FILE))
+        else:
+            hashes, offsets, blob = (load_array(name) for name in (HASHES_FILE, OFFSETS_FILE, BLOB_FILE))
+        model = cls(meta['classes'], hashes, offsets, blob, load_array(FEATURE_LOG_PROB_FILE),
+                    load_array(CLASS_LOG_PRIOR_FILE), meta['token_pattern'], meta['lowercase'], meta['stop_words'],
+                    meta.get('scale'), meta.get('offset'), hash_columns, meta.get('max_term_bytes'))
+        if os.path.exists(index_path(path)):
+            model.near_duplicates = NearDuplicateIndex.load(index_path(path))
+        return model
+
+    def compile(self):
+        return CompiledSpamFilter.from_mapped(self)
+
+    def terms(self):
+        """The vocabulary as strings, in column order."""
+        blob = self.blob.tobytes()
+        bounds = self.offsets.tolist()
+        return [blob[start:end].decode('utf-8') for start, end in zip(bounds, bounds[1:])]
+
+    def log_probabilities(self, columns=slice(None)):
+        """float64 log-probabilities [n_classes, len(columns)], dequantized if stored quantized."""
+        log_prob = np.asarray(self.feature_log_prob[:, columns], dtype=np.float64)
+        if self.scale is not None:
+            log_prob = log_prob * self.scale[:, None] + self.offset[:, None]
+        return log_prob
+
+    def clean_text(self, text):
+        return clean_text(text, self.stop_words)
+
+    def clean_batch(self, texts):
+        return clean_batch(texts, self.stop_words)
+
+    def tokenize(self, clean_message):
+        if self.lowercase:
+            clean_message = clean_message.lower()
+        return self.token_re.findall(clean_message)
+
+    def lookup(self, clean_messages):
+        """(row, vocabulary column) pairs of every known token, as two arrays."""
+        owners = []
+        tokens = []
+        for row, clean_message in enumerate(clean_messages):
+            message_tokens = [token.encode('utf-8') for token in self.tokenize(clean_message)]
+            message_tokens = [token for token in message_tokens if len(token) <= self.max_term_bytes]
+            owners.extend([row] * len(message_tokens))
+            tokens.extend(message_tokens)
+        if not tokens or not len(self.hashes):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        if len(tokens) <= SMALL_LOOKUP_TOKENS:
+            return self._lookup_small(owners, tokens)
+        words, lengths = term_words(np.array(tokens, dtype=bytes))
+        hashes = hash_words(words, lengths)
+        positions = np.searchsorted(self.hashes, hashes)
+        np.minimum(positions, len(self.hashes) - 1, out=positions)
+        known = self.hashes[positions] == hashes
+        columns = positions if self.hash_columns is None else self.hash_columns[positions]
+        # An unknown token whose hash matches a term's must not be scored as that term
+        known[known] = self.matches(columns[known], words[known], lengths[known])
+        return np.asarray(owners)[known], columns[known]
+
+    def _lookup_small(self, owners, tokens):
+        hashes = np.fromiter(map(token_hash, tokens), dtype=np.uint64, count=len(tokens))
+        positions = np.searchsorted(self.hashes, hashes)
+        np.minimum(positions, len(self.hashes) - 1, out=positions)
+        found = (self.hashes[positions] == hashes).tolist()
+        columns = positions if self.hash_columns is None else self.hash_columns[positions]
+        starts = self.offsets[columns].tolist()
+        ends = self.offsets[columns + 1].tolist()
+        rows, known = [], []
+        for owner, token, hit, column, start, end in zip(owners, tokens, found, columns.tolist(), starts, ends):
+            if hit and self.blob_view[start:end] == token:
+                rows.append(owner)
+                known.append(column)
+        return np.array(rows, dtype=np.intp), np.array(known, dtype=np.intp)
+
+    def matches(self, columns, words, token_lengths):
+        """Whether each term of columns has exactly the bytes of the token beside it (as term_words)."""
+        starts = self.offsets[columns].astype(np.intp)
+        lengths = self.offsets[columns + 1].astype(np.intp) - starts
+        steps = 8 * np.arange(words.shape[1])
+        stored = self.blob_words[np.minimum(starts[:, None] + steps, len(self.blob_words) - 1)]
+        # Keep only the bytes of each word that belong to the term
+        mask = WORD_MASKS[np.minimum(np.maximum(lengths[:, None] - steps, 0), 8)]
+        return (lengths == token_lengths) & ((stored & mask) == words).all(axis=1)
+
+    def joint_log_likelihood(self, clean_messages):
+        with metrics.stage('vectorize'):
+            owners, columns = self.lookup(clean_messages)
+        with metrics.stage('classify'):
+            jll = np.tile(self.class_log_prior, (len(clean_messages), 1))
+            log_prob = self.log_probabilities(columns)
+            for k in range(len(self.classes_)):
+                jll[:, k] += np.bincount(owners, weights=log_prob[k], minlength=len(clean_messages))
+        return jll
+
+    def predict_proba(self, clean_messages):
+        jll = self.joint_log_likelihood(clean_messages)
+        highest = jll.max(axis=1, keepdims=True)
+        log_evidence = highest + np.log(np.exp(jll - highest).sum(axis=1, keepdims=True))
+        return np.exp(jll - log_evidence)
+
+    def _score_clean(self, clean_messages):
+        probabilities = self.predict_proba(clean_messages)
+        best = probabilities.argmax(axis=1)
+        return self.classes_[best], probabilities[np.arange(len(best)), best]
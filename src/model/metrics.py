@@ -0,0 +1,213 @@
+"""In-process latency histograms and counters in the Prometheus text format.
+
+Scoring code times its stages with ``registry.stage('vectorize')``; the web
+apps add request timings, prediction counts and scrape-time collectors
+(cache statistics, model load time) and serve ``registry.render()`` on
+``/metrics``. Set ``SPAM_METRICS=0`` to disable recording: timers then
+return a shared no-op context manager and counters return immediately.
+Only the standard library is used so the serverless app can import it.
+"""
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, from 50 microseconds (one cached message) to 10 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs ending with +Inf."""
+        total = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            yield bound, total
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class _Timer:
+    __slots__ = ('registry', 'key', 'start')
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._descriptions = {}
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+        self._stage_keys = {}
+
+    def describe(self, name, kind, help_text):
+        self._descriptions[name] = (kind, help_text)
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self._observe(_key(name, labels), value)
+
+    def _observe(self, key, value):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self._gauges[_key(name, labels)] = value
+
+    def stage(self, stage):
+        """Time one stage of scoring (preprocess, vectorize, classify, json_decode, ...)."""
+        if not self.enabled:
+            return _NULL_TIMER
+        key = self._stage_keys.get(stage)
+        if key is None:
+            key = self._stage_keys[stage] = _key('spam_stage_seconds', {'stage': stage})
+        return _Timer(self, key)
+
+    def add_collector(self, collect):
+        """collect() is called on every render and yields (name, kind, help, labels, value)."""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        families = {}
+        with self._lock:
+            for (name, labels), histogram in self._histograms.items():
+                samples = families.setdefault(name, ('histogram', []))[1]
+                for bound, count in histogram.cumulative():
+                    samples.append((name + '_bucket', labels + (('le', _format_value(bound)),), count))
+                samples.append((name + '_sum', labels, histogram.sum))
+                samples.append((name + '_count', labels, histogram.count))
+            for (name, labels), value in self._counters.items():
+                families.setdefault(name, ('counter', []))[1].append((name, labels, value))
+        for (name, labels), value in list(self._gauges.items()):
+            families.setdefault(name, ('gauge', []))[1].append((name, labels, value))
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                self._descriptions.setdefault(name, (kind, help_text))
+                families.setdefault(name, (kind, []))[1].append(_key(name, labels) + (value,))
+
+        lines = []
+        for name in sorted(families):
+            kind, samples = families[name]
+            help_text = self._descriptions.get(name, (kind, ''))[1]
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def cache_collector(prediction_cache):
+    """Collector exporting the statistics of a PredictionCache."""
+    def collect():
+        stats = prediction_cache.stats()
+        yield 'spam_cache_hits_total', 'counter', 'Prediction cache hits', {}, stats['hits']
+        yield 'spam_cache_misses_total', 'counter', 'Prediction cache misses', {}, stats['misses']
+        yield 'spam_cache_evictions_total', 'counter', 'Entries evicted to stay within the limits', {}, stats['evictions']
+        yield 'spam_cache_expirations_total', 'counter', 'Entries dropped after their TTL', {}, stats['expirations']
+        yield 'spam_cache_entries', 'gauge', 'Cached predictions', {}, stats['entries']
+        yield 'spam_cache_bytes', 'gauge', 'Approximate size of the cache in bytes', {}, stats['bytes']
+    return collect
+
+
+def near_duplicate_collector(index):
+    """Collector exporting the statistics of a NearDuplicateIndex."""
+    def collect():
+        stats = index.stats()
+        yield 'spam_near_duplicate_entries', 'gauge', 'Spam templates in the near-duplicate index', {}, stats['entries']
+        yield 'spam_near_duplicate_lookups_total', 'counter', 'Messages looked up in the near-duplicate index', {}, stats['lookups']
+        yield 'spam_near_duplicate_hits_total', 'counter', 'Lookups answered by the near-duplicate index', {}, stats['hits']
+    return collect
+
+
+def cascade_collector(cascade):
+    """Collector exporting how a CascadeSpamFilter routed its messages."""
+    def collect():
+        stats = cascade.stats()
+        for stage, count in stats['routed'].items():
+            yield 'spam_cascade_messages_total', 'counter', 'Messages decided by each cascade stage', {'stage': stage}, count
+        for rule, count in stats['rule_hits'].items():
+            yield 'spam_cascade_rule_hits_total', 'counter', 'Messages labelled spam by each prefilter rule', {'rule': rule}, count
+    return collect
+
+
+registry = MetricsRegistry(enabled=os.environ.get('SPAM_METRICS', '1') != '0')
+registry.describe('spam_stage_seconds', 'histogram', 'Time spent in each scoring stage')
+registry.describe('spam_request_seconds', 'histogram', 'Total request handling time by endpoint')
+registry.describe('spam_requests_total', 'counter', 'Requests by endpoint and status code')
+registry.describe('spam_predictions_total', 'counter', 'Predictions served by predicted label')
+registry.describe('spam_model_load_seconds', 'gauge', 'Time taken to load the active model')
@@ -0,0 +1,230 @@
+"""MinHash/LSH index of known spam templates for near-duplicate lookups.
+
+Campaigns send many variants of one template that differ only in numbers,
+prize amounts or URLs, so the exact-text PredictionCache misses them. Each
+message is reduced to the word shingles of its cleaned text, with every
+token containing a digit replaced by ``#``, and then to a MinHash
+signature whose agreement with another signature estimates the Jaccard
+similarity of the two sets. Signatures are split into bands; messages that
+share any band land in the same bucket and become candidates, and a
+candidate whose estimated similarity reaches ``threshold`` returns its label
+without the message being vectorized or scored. The probability reported for
+such a hit is the fixed ``hit_probability``, a confidence in the label like
+the cascade's ``rule_probability``; the similarity itself is not a
+probability and is only returned by ``query()``.
+
+The index is saved next to the model (``near_duplicates.npz`` in a mapped
+model directory, ``<name>.near_duplicates.npz`` beside a pickle) and loaded
+with it. Only NumPy is needed.
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from src.model.metrics import registry as metrics
+
+INDEX_FILE = 'near_duplicates.npz'
+
+_DIGIT_RE = re.compile(r'\d')
+
+
+def index_path(model_path):
+    """Where the index of the model at model_path is stored."""
+    if os.path.isdir(model_path):
+        return os.path.join(model_path, INDEX_FILE)
+    return os.path.splitext(model_path)[0] + '.' + INDEX_FILE
+
+
+def shingle_tokens(clean_message):
+    return [token if token.isalpha() or not _DIGIT_RE.search(token) else '#' for token in clean_message.split()]
+
+
+class NearDuplicateIndex:
+    def __init__(self, num_perm=64, bands=16, threshold=0.8, shingle_size=2, min_shingles=3, seed=1,
+                 hit_probability=0.99):
+        if num_perm % bands:
+            raise ValueError(f'num_perm ({num_perm}) must be a multiple of bands ({bands})')
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.hit_probability = hit_probability
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) >> 32 in wrapping 64-bit arithmetic
+        self._shingle_weights = rng.integers(1, 2 ** 63, shingle_size, dtype=np.uint64) | np.uint64(1)
+        self._a = (rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1))[:, None]
+        self._b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)[:, None]
+        # Folds the rows of a band into one bucket key; weights differ per band
+        # so all bands can share one table
+        self._band_weights = rng.integers(1, 2 ** 63, (bands, self.rows), dtype=np.uint64)
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._storage = None
+        self._labels = []
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.skipped = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self):
+        return len(self._labels)
+
+    def signatures(self, clean_messages):
+        """MinHash signatures of the messages with at least min_shingles shingles, and their positions."""
+        token_hashes, lengths, rows = [], [], []
+        for row, clean_message in enumerate(clean_messages):
+            tokens = shingle_tokens(clean_message)
+            if len(tokens) - self.shingle_size + 1 < self.min_shingles:
+                continue
+            token_hashes.extend([zlib.crc32(token.encode('utf-8')) for token in tokens])
+            lengths.append(len(tokens))
+            rows.append(row)
+        if not rows:
+            return np.empty((0, self.num_perm), dtype=np.uint32), np.empty(0, dtype=np.intp)
+
+        # Hash every run of shingle_size consecutive tokens, then drop the runs
+        # that cross from one message into the next
+        token_hashes = np.array(token_hashes, dtype=np.uint64)
+        count = len(token_hashes) - self.shingle_size + 1
+        shingle_hashes = np.zeros(count, dtype=np.uint64)
+        for offset, weight in enumerate(self._shingle_weights):
+            shingle_hashes += token_hashes[offset:offset + count] * weight
+        lengths = np.array(lengths)
+        message_of = np.repeat(np.arange(len(lengths)), lengths)
+        shingle_hashes = shingle_hashes[message_of[:count] == message_of[self.shingle_size - 1:]] >> np.uint64(32)
+
+        permuted = (self._a * shingle_hashes + self._b) >> np.uint64(32)
+        starts = np.concatenate(([0], np.cumsum(lengths - self.shingle_size + 1)[:-1]))
+        signatures = np.minimum.reduceat(permuted, starts, axis=1).T.astype(np.uint32)
+        return signatures, np.array(rows, dtype=np.intp)
+
+    def _band_keys(self, signatures):
+        bands = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (bands * self._band_weights).sum(axis=2).tolist()
+
+    def _best_match(self, signature, band_keys):
+        buckets = [bucket for bucket in map(self._buckets.get, band_keys) if bucket]
+        if not buckets:
+            return None, 0.0
+        candidates = set().union(*buckets)
+        candidates = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        similarities = (self._signatures[candidates] == signature).mean(axis=1)
+        best = similarities.argmax()
+        return int(candidates[best]), float(similarities[best])
+
+    def add(self, clean_messages, labels=None):
+        """Index cleaned messages (labelled 'spam' unless labels are given); returns how many were added.
+
+        Messages too short to shingle and exact signature duplicates of an
+        indexed message are skipped.
+        """
+        clean_messages = list(clean_messages)
+        labels = ['spam'] * len(clean_messages) if labels is None else [str(label) for label in labels]
+        signatures, rows = self.signatures(clean_messages)
+        added = 0
+        with self._lock:
+            for signature, band_keys, row in zip(signatures, self._band_keys(signatures), rows):
+                if self._best_match(signature, band_keys)[1] == 1.0:
+                    continue
+                entry = len(self._labels)
+                for key in band_keys:
+                    self._buckets.setdefault(key, []).append(entry)
+                self._labels.append(labels[row])
+                self._append_signature(signature)
+                added += 1
+        return added
+
+    def _append_signature(self, signature):
+        # Grows by doubling; _signatures is a view of the filled rows
+        count = len(self._signatures)
+        storage = self._storage
+        if storage is None or count == len(storage):
+            storage = np.empty((max(64, 2 * count), self.num_perm), dtype=np.uint32)
+            storage[:count] = self._signatures
+            self._storage = storage
+        storage[count] = signature
+        self._signatures = storage[:count + 1]
+
+    def query(self, clean_messages):
+        """(label, similarity) of the best match at or above threshold per message, else None."""
+        start = time.perf_counter()
+        results = [None] * len(clean_messages)
+        signatures, rows = self.signatures(clean_messages)
+        hits = 0
+        with self._lock:
+            for signature, band_keys, row in zip(signatures, self._band_keys(signatures), rows):
+                entry, similarity = self._best_match(signature, band_keys)
+                if entry is not None and similarity >= self.threshold:
+                    results[row] = (self._labels[entry], similarity)
+                    hits += 1
+            self.lookups += len(clean_messages)
+            self.hits += hits
+            self.skipped += len(clean_messages) - len(rows)
+            self.lookup_seconds += time.perf_counter() - start
+        return results
+
+    def predict(self, clean_messages, score):
+        """Return (predictions, probabilities) arrays, scoring only the messages without a near duplicate.
+
+        score is called as in PredictionCache.predict. A hit is reported with
+        probability hit_probability.
+        """
+        with metrics.stage('near_duplicate'):
+            matches = self.query(clean_messages)
+        missing = [i for i, match in enumerate(matches) if match is None]
+        predictions = [match[0] if match else None for match in matches]
+        probabilities = [self.hit_probability if match else None for match in matches]
+        if missing:
+            scored_predictions, scored_probabilities = score([clean_messages[i] for i in missing])
+            for i, prediction, probability in zip(missing, scored_predictions, scored_probabilities):
+                predictions[i] = prediction
+                probabilities[i] = float(probability)
+        return np.asarray(predictions), np.asarray(probabilities, dtype=np.float64)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._labels),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'too_short': self.skipped,
+                'lookup_seconds': self.lookup_seconds,
+                'mean_lookup_us': 1e6 * self.lookup_seconds / self.lookups if self.lookups else 0.0,
+            }
+
+    def params(self):
+        return {'num_perm': self.num_perm, 'bands': self.bands, 'threshold': self.threshold,
+                'shingle_size': self.shingle_size, 'min_shingles': self.min_shingles, 'seed': self.seed,
+                'hit_probability': self.hit_probability}
+
+    def save(self, path):
+        with self._lock:
+            signatures = self._signatures.copy()
+            labels = np.array(self._labels, dtype=str)
+        # np.savez appends .npz to names without it, so the temporary name keeps the suffix
+        tmp_path = f'{path[:-4]}.tmp.npz'
+        np.savez(tmp_path, signatures=signatures, labels=labels, params=np.array(json.dumps(self.params())))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            index = cls(**json.loads(str(arrays['params'])))
+            signatures = arrays['signatures']
+            labels = arrays['labels'].tolist()
+        for entry, band_keys in enumerate(index._band_keys(signatures)):
+            for key in band_keys:
+                index._buckets.setdefault(key, []).append(entry)
+        index._signatures = signatures
+        index._labels = labels
+        return index
@@ -0,0 +1,67 @@
+"""Shared text preprocessing for the spam filter models.
+
+Only the standard library is used here so the serverless app in ``api/`` can
+import it without pulling in pandas, NLTK or scikit-learn. The character
+classes are compiled once at import time; deleting them in a single regex pass
+is faster than filtering characters or ``str.translate`` and gives the same
+result.
+"""
+import re
+import string
+import sys
+
+PUNCTUATION_RE = re.compile('[%s]+' % re.escape(string.punctuation))
+PUNCTUATION_DIGITS_RE = re.compile(r'[\d%s]+' % re.escape(string.punctuation))
+
+# Common English stop words used by the lightweight (serverless) filter
+LIGHTWEIGHT_STOP_WORDS = frozenset({
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', 'your', 'yours',
+    'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', 'her', 'hers',
+    'herself', 'it', 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves',
+    'what', 'which', 'who', 'whom', 'this', 'that', 'these', 'those', 'am', 'is', 'are',
+    'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does',
+    'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until',
+    'while', 'of', 'at', 'by', 'for', 'with', 'through', 'during', 'before', 'after',
+    'above', 'below', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again',
+    'further', 'then', 'once'
+})
+
+
+def clean_text(text, stop_words):
+    """Strip punctuation, lowercase and drop stop words (SpamFilter cleaning)."""
+    words = PUNCTUATION_RE.sub('', text).lower().split()
+    return ' '.join([word for word in words if word not in stop_words])
+
+
+def tokenize_lightweight(text, stop_words=LIGHTWEIGHT_STOP_WORDS):
+    """Lowercase, strip punctuation and digits, and keep non-stop words longer than two characters."""
+    text = PUNCTUATION_DIGITS_RE.sub('', text.lower())
+    return [word for word in text.split() if word not in stop_words and len(word) > 2]
+
+
+def clean_batch(texts, stop_words):
+    """Apply clean_text to a pandas Series, NumPy array or iterable of strings.
+
+    A Series comes back as a Series with the same index and name, an array as
+    an object array, and anything else as a list.
+    """
+    return _like(texts, [clean_text(text, stop_words) for text in texts])
+
+
+def tokenize_lightweight_batch(texts, stop_words=LIGHTWEIGHT_STOP_WORDS):
+    """Apply tokenize_lightweight to a pandas Series, NumPy array or iterable of strings."""
+    return _like(texts, [tokenize_lightweight(text, stop_words) for text in texts])
+
+
+def _like(texts, values):
+    # pandas/numpy are only consulted if the caller already imported them
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(texts, pd.Series):
+        return pd.Series(values, index=texts.index, name=texts.name, dtype=object)
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(texts, np.ndarray):
+        result = np.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            result[i] = value
+        return result
+    return values
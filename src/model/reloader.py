@@ -0,0 +1,227 @@
+"""Zero-downtime model reloading with an atomic swap of the active model.
+
+``ModelReloader`` loads a model file or mapped-model directory, validates and
+warms it up, and only then replaces the active model in a single reference
+assignment. Requests take the active model once (``use()``) and finish on it
+even if a newer model is swapped in meanwhile. A model that fails to load or
+validate is rejected and the previous one keeps serving.
+
+The model can be reloaded explicitly (e.g. from an admin endpoint) or by a
+background thread polling the path for changes.
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.model.spam_filter import CLASSES, SpamFilter
+
+logger = logging.getLogger(__name__)
+
+
+class ModelValidationError(ValueError):
+    pass
+
+
+def model_fingerprint(path):
+    """Cheap change detector: (name, size, mtime) of the file or of every file in the directory."""
+    if os.path.isdir(path):
+        entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+        return tuple((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                     for entry in entries if entry.is_file())
+    stat = os.stat(path)
+    return ((os.path.basename(path), stat.st_size, stat.st_mtime_ns),)
+
+
+def model_version(path):
+    """Content hash identifying a model file or directory."""
+    digest = hashlib.sha256()
+    names = sorted(os.listdir(path)) if os.path.isdir(path) else [None]
+    for name in names:
+        file_path = os.path.join(path, name) if name else path
+        if name:
+            digest.update(name.encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def validate_model(model, messages):
+    predictions, probabilities = model.predict_batch(messages)
+    if len(predictions) != len(messages) or len(probabilities) != len(messages):
+        raise ModelValidationError('Model returned the wrong number of predictions')
+    unknown = set(str(prediction) for prediction in predictions) - set(CLASSES)
+    if unknown:
+        raise ModelValidationError(f'Model predicted unknown labels {sorted(unknown)}')
+    if not all(math.isfinite(p) and 0.0 <= p <= 1.0 for p in probabilities):
+        raise ModelValidationError('Model returned probabilities outside [0, 1]')
+
+
+class ActiveModel:
+    """A loaded model plus its version; closes its resources once retired and idle."""
+
+    def __init__(self, model, version, path, resources=None, load_seconds=None):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.resources = resources
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self._users = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            close = self._users == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        if self.resources is not None:
+            self.resources.close()
+
+
+class ModelReloader:
+    """Owns the active model and replaces it atomically when the model at path changes.
+
+    prepare(model, version) is called on a validated model before it goes live
+    and may return a resource with a close() method (e.g. a ScoringEngine)
+    that is closed once the model is retired and no request uses it any more.
+    A model whose files change while it is loaded is rejected.
+    retire(model) is called when a model stops being the active one.
+    """
+
+    def __init__(self, path, loader=SpamFilter.load_model, warmup_messages=(), prepare=None, retire=None):
+        self.path = path
+        self.loader = loader
+        self.warmup_messages = list(warmup_messages)
+        self.prepare = prepare
+        self.retire = retire
+        self.active = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+        self._reload_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @contextmanager
+    def use(self):
+        active = self.acquire()
+        try:
+            yield active
+        finally:
+            active.release()
+
+    def acquire(self):
+        with self._swap_lock:
+            if self.active is None:
+                raise RuntimeError('No model has been loaded')
+            return self.active.acquire()
+
+    def reload(self, force=False):
+        """Load, validate and swap in the model at path; returns True if a new model went live."""
+        with self._reload_lock:
+            try:
+                version = model_version(self.path)
+                if not force and self.active is not None and version == self.active.version:
+                    # The path holds the serving model again, so an earlier rejection no longer applies
+                    self.last_error = None
+                    return False
+                start = time.perf_counter()
+                model = self.loader(self.path)
+                # A model published while this one loaded may have been read instead
+                if model_version(self.path) != version:
+                    raise ModelValidationError(f'{self.path} changed while it was being loaded')
+                if self.warmup_messages:
+                    validate_model(model, self.warmup_messages)
+                    for message in self.warmup_messages:
+                        model.predict(message)
+                resources = self.prepare(model, version) if self.prepare else None
+            except Exception as e:
+                self.failed_reloads += 1
+                self.last_error = f'{type(e).__name__}: {e}'
+                logger.exception('Rejected model at %s', self.path)
+                raise
+
+            new = ActiveModel(model, version, self.path, resources, time.perf_counter() - start)
+            with self._swap_lock:
+                old, self.active = self.active, new
+            self.reloads += 1
+            self.last_error = None
+            logger.info('Model %s is now active', version)
+            if old is not None:
+                if self.retire:
+                    self.retire(old.model)
+                old.retire()
+            return True
+
+    def watch(self, interval=5.0):
+        """Poll path every interval seconds and reload once a change has settled."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        # Fingerprinted here, not in the thread, so a model published right after watch() returns is seen
+        self._watcher = threading.Thread(target=self._watch, args=(interval, self._fingerprint()),
+                                         name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval, seen):
+        pending = None
+        while not self._stop.wait(interval):
+            current = self._fingerprint()
+            if current == seen:
+                pending = None
+                continue
+            # Wait for one unchanged poll so a model that is still being written is not loaded
+            if current != pending:
+                pending = current
+                continue
+            seen, pending = current, None
+            try:
+                self.reload()
+            except Exception:
+                pass
+
+    def _fingerprint(self):
+        try:
+            return model_fingerprint(self.path)
+        except OSError:
+            return None
+
+    def status(self):
+        active = self.active
+        return {
+            'model_version': active.version if active else None,
+            'model_path': self.path,
+            'loaded_at': active.loaded_at if active else None,
+            'load_seconds': active.load_seconds if active else None,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'last_error': self.last_error,
+        }
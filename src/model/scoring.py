@@ -0,0 +1,60 @@
+"""Prediction interface shared by the spam filter scorers.
+
+A scorer provides ``clean_batch(texts)``, ``_score_clean(clean_messages)``
+returning ``(predictions, probabilities)`` arrays for a non-empty list, and a
+``classes_`` array. ``ScorerMixin`` builds the rest of the SpamFilter
+interface on top: single and batch prediction, chunked scoring of long
+iterators, the prediction cache and the near-duplicate index in front of
+``_score_clean``.
+"""
+from itertools import islice
+
+import numpy as np
+
+from src.model.metrics import registry as metrics
+
+
+class ScorerMixin:
+    prediction_cache = None
+    near_duplicates = None
+
+    def predict(self, message):
+        predictions, probabilities = self.predict_batch([message])
+        return predictions[0], probabilities[0]
+
+    def set_cache(self, prediction_cache):
+        # A cache is only valid for one model, so attaching it starts it empty
+        # and stops the model it belonged to from reading or storing entries
+        self.prediction_cache = prediction_cache
+        if prediction_cache is not None:
+            prediction_cache.attach(self)
+
+    def _invalidate_cache(self):
+        if self.prediction_cache is not None:
+            self.prediction_cache.clear()
+
+    def predict_batch(self, messages):
+        # Read once: a reload can detach the cache from this model while the request runs
+        prediction_cache = self.prediction_cache
+        with metrics.stage('preprocess'):
+            clean_messages = self.clean_batch(list(messages))
+        if prediction_cache is not None and clean_messages:
+            predictions, probabilities = prediction_cache.predict(clean_messages, self._predict_clean, owner=self)
+            return np.asarray(predictions), np.asarray(probabilities)
+        return self._predict_clean(clean_messages)
+
+    def _predict_clean(self, clean_messages):
+        if not clean_messages:
+            return np.empty(0, dtype=self.classes_.dtype), np.empty(0)
+        # Near duplicates of indexed spam are answered without vectorizing
+        if self.near_duplicates is not None:
+            return self.near_duplicates.predict(clean_messages, self._score_clean)
+        return self._score_clean(clean_messages)
+
+    def predict_batch_chunked(self, messages, chunk_size=1000):
+        messages = iter(messages)
+        while True:
+            chunk = list(islice(messages, chunk_size))
+            if not chunk:
+                break
+            yield self.predict_batch(chunk)
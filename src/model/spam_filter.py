@@ -1,40 +1,115 @@
-import pandas as pd
+# Only NumPy is imported eagerly: scoring a mapped or compiled model needs
+# nothing else, and unpickling a model imports the sklearn classes it uses.
+# pandas and the sklearn training/evaluation modules are imported by the
+# functions that train.
+import csv
 import numpy as np
-import string
-import nltk
-from nltk.corpus import stopwords
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.model_selection import train_test_split
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.metrics import classification_report, confusion_matrix
+import os
 import pickle
+import threading
+from itertools import islice
+from src.model.compiled import CompiledSpamFilter
+from src.model.mapped_model import MappedSpamFilter, export_mapped_model, is_mapped_model
+from src.model.metrics import registry as metrics
+from src.model.near_duplicate import NearDuplicateIndex, index_path
+from src.model.preprocessing import clean_batch, clean_text
+from src.model.scoring import ScorerMixin
 
-# Download required NLTK data
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
+STOP_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'stopwords_english.txt')
 
-class SpamFilter:
-    def __init__(self):
-        self.vectorizer = CountVectorizer()
+_stop_words = None
+_stop_words_lock = threading.Lock()
+
+def load_stop_words():
+    # NLTK's English list, bundled so nothing is downloaded; read once per process
+    global _stop_words
+    with _stop_words_lock:
+        if _stop_words is None:
+            with open(STOP_WORDS_PATH, encoding='utf-8') as f:
+                _stop_words = frozenset(line.strip() for line in f if line.strip())
+    return _stop_words
+
+FEATURE_MODES = ('count', 'hashing')
+CLASSES = np.array(['ham', 'spam'])
+
+DEFAULT_DATA_PATH = 'data/raw/spam.csv'
+DEFAULT_MODEL_DIR = 'data/processed/spam_filter_model'
+DEFAULT_MODEL_PATH = 'data/processed/spam_filter_model.pkl'
+
+def default_model_path():
+    # Prefer the memory-mapped export; the pickle is kept as a fallback
+    return DEFAULT_MODEL_DIR if os.path.isdir(DEFAULT_MODEL_DIR) else DEFAULT_MODEL_PATH
+
+def iter_labeled_chunks(source, chunk_size=10000):
+    # source is a label<TAB>message file or an iterable of (label, message) pairs
+    if isinstance(source, (str, os.PathLike)):
+        import pandas as pd
+        # Read as text so messages such as 'NA' or empty ones are not turned into NaN
+        reader = pd.read_csv(source, sep='\t', header=None, names=['label', 'message'], chunksize=chunk_size,
+                             dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+        for chunk in reader:
+            yield chunk['label'].tolist(), chunk['message'].tolist()
+        return
+    pairs = iter(source)
+    while True:
+        chunk = list(islice(pairs, chunk_size))
+        if not chunk:
+            break
+        labels, messages = zip(*chunk)
+        yield list(labels), list(messages)
+
+def split_corpus(corpus):
+    # The 80/20 split train() fits on and reports the held-out evaluation of
+    from sklearn.model_selection import train_test_split
+    return train_test_split(corpus['clean_messages'], corpus['labels'], test_size=0.2, random_state=42)
+
+def build_vectorizer(feature_mode='count', n_features=2 ** 18, alternate_sign=False):
+    from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import FunctionTransformer
+    if feature_mode == 'count':
+        return CountVectorizer()
+    if feature_mode != 'hashing':
+        raise ValueError(f'feature_mode must be one of {FEATURE_MODES}, got {feature_mode!r}')
+    # Raw counts, no normalisation, so MultinomialNB sees term frequencies
+    vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=alternate_sign, norm=None)
+    if not alternate_sign:
+        return vectorizer
+    # MultinomialNB needs non-negative features: keep the signed hashing to
+    # let colliding terms cancel, then take magnitudes
+    return make_pipeline(vectorizer, FunctionTransformer(abs, accept_sparse=True))
+
+class SpamFilter(ScorerMixin):
+    def __init__(self, feature_mode='count', n_features=2 ** 18, alternate_sign=False):
+        from sklearn.naive_bayes import MultinomialNB
+        self.feature_mode = feature_mode
+        self.vectorizer = build_vectorizer(feature_mode, n_features, alternate_sign)
         self.classifier = MultinomialNB()
-        self.stop_words = set(stopwords.words('english'))
+        self.stop_words = load_stop_words()
+        self.evaluation = None
+        self.prediction_cache = None
+        self.near_duplicates = None
         
     def clean_text(self, text):
-        nopunc = [char for char in text if char not in string.punctuation]
-        nopunc = ''.join(nopunc)
-        clean_words = [word.lower() for word in nopunc.split() if word.lower() not in self.stop_words]
-        return ' '.join(clean_words)
-    
-    def train(self, data_path):
-        df = pd.read_csv(data_path, sep='\t', header=None, names=['label', 'message'])
-        df['clean_message'] = df['message'].apply(self.clean_text)
-        X_train, X_test, y_train, y_test = train_test_split(df['clean_message'], df['label'], test_size=0.2, random_state=42)
-        X_train_counts = self.vectorizer.fit_transform(X_train)
-        X_test_counts = self.vectorizer.transform(X_test)
+        return clean_text(text, self.stop_words)
+    
+    def clean_batch(self, texts):
+        return clean_batch(texts, self.stop_words)
+    
+    def train(self, data_path, artifact_cache=None):
+        from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+        if artifact_cache is None:
+            X_train_counts, X_test_counts, y_train, y_test = self._features(self.load_corpus(data_path))
+        else:
+            X_train_counts, X_test_counts, y_train, y_test = self._cached_features(data_path, artifact_cache)
         self.classifier.fit(X_train_counts, y_train)
+        self._invalidate_cache()
         y_pred = self.classifier.predict(X_test_counts)
+        self.evaluation = {
+            'accuracy': accuracy_score(y_test, y_pred),
+            'classification_report': classification_report(y_test, y_pred, output_dict=True),
+            'confusion_matrix': confusion_matrix(y_test, y_pred).tolist()
+        }
         print("\nModel Evaluation:")
         print("\nClassification Report:")
         print(classification_report(y_test, y_pred))
@@ -42,33 +117,140 @@ class SpamFilter:
         print(confusion_matrix(y_test, y_pred))
         return self
     
-    def predict(self, message):
-        clean_message = self.clean_text(message)
-        message_counts = self.vectorizer.transform([clean_message])
-        prediction = self.classifier.predict(message_counts)[0]
-        probability = self.classifier.predict_proba(message_counts).max()
-        return prediction, probability
+    def load_corpus(self, data_path, artifact_cache=None):
+        # Labels and cleaned messages of a label<TAB>message file
+        if artifact_cache is not None:
+            return artifact_cache.get_or_build('corpus', self.corpus_inputs(data_path, artifact_cache),
+                                               lambda: self.load_corpus(data_path))[1]
+        import pandas as pd
+        # One message per line: a '"' is part of the message, not a quote spanning lines
+        df = pd.read_csv(data_path, sep='\t', header=None, names=['label', 'message'],
+                         dtype=str, keep_default_na=False, quoting=csv.QUOTE_NONE)
+        return {'labels': df['label'].tolist(), 'clean_messages': self.clean_batch(df['message'].tolist())}
+    
+    def corpus_inputs(self, data_path, artifact_cache):
+        return {'data': artifact_cache.file_digest(data_path), 'stop_words': sorted(self.stop_words)}
+    
+    def _features(self, corpus):
+        X_train, X_test, y_train, y_test = split_corpus(corpus)
+        X_train_counts = self.vectorizer.fit_transform(X_train)
+        X_test_counts = self.vectorizer.transform(X_test)
+        return X_train_counts, X_test_counts, y_train, y_test
+    
+    def _cached_features(self, data_path, artifact_cache):
+        import sklearn
+        from sklearn.feature_extraction.text import CountVectorizer
+        # The features are keyed by the corpus key rather than its contents, so
+        # an unchanged setup skips reading the data file, and a vectorizer
+        # change still reuses the cleaned corpus
+        feature_inputs = {
+            'corpus': artifact_cache.key('corpus', self.corpus_inputs(data_path, artifact_cache)),
+            'split': {'test_size': 0.2, 'random_state': 42},
+            'vectorizer': self.vectorizer.get_params(),
+            'sklearn': sklearn.__version__
+        }
+        
+        def build_features():
+            X_train_counts, X_test_counts, y_train, y_test = self._features(self.load_corpus(data_path, artifact_cache))
+            features = {'X_train': X_train_counts, 'X_test': X_test_counts, 'y_train': y_train, 'y_test': y_test}
+            if isinstance(self.vectorizer, CountVectorizer):
+                features['terms'] = sorted(self.vectorizer.vocabulary_, key=self.vectorizer.vocabulary_.get)
+            return features
+        
+        features = artifact_cache.get_or_build('features', feature_inputs, build_features)[1]
+        if 'terms' in features:
+            self.vectorizer.vocabulary_ = {term: column for column, term in enumerate(features['terms'])}
+            self.vectorizer.fixed_vocabulary_ = False
+        return features['X_train'], features['X_test'], features['y_train'], features['y_test']
+    
+    def partial_train(self, messages, labels):
+        # A count vectorizer keeps the vocabulary it was fitted with, so new
+        # terms are ignored; the hashing vectorizer needs no fitting at all
+        if self.feature_mode == 'count' and not hasattr(self.vectorizer, 'vocabulary_'):
+            raise ValueError("Incremental training needs a fitted vocabulary: call train() or load a model "
+                             "first, or use feature_mode='hashing'")
+        message_counts = self.vectorizer.transform(self.clean_batch(list(messages)))
+        self.classifier.partial_fit(message_counts, list(labels), classes=CLASSES)
+        self._invalidate_cache()
+        return self
+    
+    def train_incremental(self, source, chunk_size=10000, checkpoint_path=None, checkpoint_every=10):
+        chunks = 0
+        for labels, messages in iter_labeled_chunks(source, chunk_size):
+            self.partial_train(messages, labels)
+            chunks += 1
+            if checkpoint_path and chunks % checkpoint_every == 0:
+                self.save_model(checkpoint_path)
+        if checkpoint_path and chunks % checkpoint_every:
+            self.save_model(checkpoint_path)
+        return self
+    
+    @property
+    def classes_(self):
+        return self.classifier.classes_
+    
+    def _score_clean(self, clean_messages):
+        with metrics.stage('vectorize'):
+            message_counts = self.vectorizer.transform(clean_messages)
+        with metrics.stage('classify'):
+            probabilities = self.classifier.predict_proba(message_counts)
+        best = probabilities.argmax(axis=1)
+        predictions = self.classifier.classes_[best]
+        return predictions, probabilities[np.arange(len(best)), best]
     
     def save_model(self, model_path='spam_filter_model.pkl'):
-        model_data = {'vectorizer': self.vectorizer, 'classifier': self.classifier}
-        with open(model_path, 'wb') as f:
+        model_data = {'vectorizer': self.vectorizer, 'classifier': self.classifier, 'feature_mode': self.feature_mode}
+        # Write next to the target and rename so readers never see a partial file
+        tmp_path = f'{model_path}.tmp'
+        with open(tmp_path, 'wb') as f:
             pickle.dump(model_data, f)
+        os.replace(tmp_path, model_path)
+        if self.near_duplicates is not None:
+            self.near_duplicates.save(index_path(model_path))
+    
+    def compile(self):
+        # Scorer that skips sklearn's transform and validation, for low-latency single messages
+        return CompiledSpamFilter.from_spam_filter(self)
+    
+    def export_model(self, model_dir='spam_filter_model', dtype='float64', min_count=0, min_log_odds=0.0):
+        # Pruning (min_count, min_log_odds) and float16/int8 storage make a smaller, approximate model
+        # The directory, near-duplicate index included, is replaced in one rename
+        export_mapped_model(self, model_dir, dtype, min_count, min_log_odds)
+    
+    def publish(self, model_path):
+        # A .pkl path is pickled, anything else exported as a mapped directory; both
+        # are replaced atomically, so a server watching model_path can reload it
+        if str(model_path).endswith('.pkl'):
+            self.save_model(model_path)
+        else:
+            self.export_model(model_path)
     
     @classmethod
     def load_model(cls, model_path='spam_filter_model.pkl'):
+        # Directories hold the pickle-free mapped format; files are legacy pickles
+        if os.path.isdir(model_path) and is_mapped_model(model_path):
+            return MappedSpamFilter.load(model_path)
         with open(model_path, 'rb') as f:
             model_data = pickle.load(f)
         spam_filter = cls()
         spam_filter.vectorizer = model_data['vectorizer']
         spam_filter.classifier = model_data['classifier']
+        spam_filter.feature_mode = model_data.get('feature_mode', 'count')
+        if os.path.exists(index_path(model_path)):
+            spam_filter.near_duplicates = NearDuplicateIndex.load(index_path(model_path))
         return spam_filter
 
+def load_compiled_model(model_path):
+    # Either model format, converted to the sklearn-free compiled scorer
+    return SpamFilter.load_model(model_path).compile()
+
 def main():
-    # Example usage
-    spam_filter = SpamFilter()
-    
-    # Train the model (uncomment and modify the path as needed)
-    # spam_filter.train('path_to_your_dataset/SMSSpamCollection')
+    # Example usage: load the shipped model, or train one from the raw dataset
+    model_path = default_model_path()
+    if os.path.exists(model_path):
+        spam_filter = SpamFilter.load_model(model_path)
+    else:
+        spam_filter = SpamFilter().train(DEFAULT_DATA_PATH)
     
     # Example messages to test
     test_messages = [
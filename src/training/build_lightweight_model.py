@@ -0,0 +1,55 @@
+"""Build the count table loaded by the serverless LightweightSpamFilter.
+
+Reads a ``label<TAB>message`` corpus, tokenizes it exactly like
+``LightweightSpamFilter.preprocess_text`` and writes the per-class word counts
+with ``src.model.count_table``.
+
+    python -m src.training.build_lightweight_model [--data data/raw/spam.csv] [--output api/lightweight_model.bin]
+"""
+import argparse
+import csv
+import os
+import time
+
+from src.model.count_table import write_count_table
+from src.model.preprocessing import tokenize_lightweight
+
+DEFAULT_OUTPUT = os.path.join('api', 'lightweight_model.bin')
+
+
+def count_messages(pairs):
+    """Per-class message and word counts of (label, message) pairs."""
+    counts = {'spam': [0, {}], 'ham': [0, {}]}
+    for label, message in pairs:
+        totals = counts[label]
+        totals[0] += 1
+        words = totals[1]
+        for word in tokenize_lightweight(message):
+            words[word] = words.get(word, 0) + 1
+    return counts
+
+
+def count_corpus(data_path):
+    with open(data_path, encoding='utf-8', newline='') as f:
+        return count_messages(csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the LightweightSpamFilter count table')
+    parser.add_argument('--data', default='data/raw/spam.csv')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = count_corpus(args.data)
+    spam_count, spam_words = counts['spam']
+    ham_count, ham_words = counts['ham']
+    write_count_table(args.output, spam_count, ham_count, spam_words, ham_words)
+    vocabulary_size = len(set(spam_words) | set(ham_words))
+    print(f'Wrote {args.output}: {spam_count} spam / {ham_count} ham messages, '
+          f'{vocabulary_size} words, {os.path.getsize(args.output) / 1024:.1f} KiB '
+          f'in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Build the near-duplicate spam index stored next to a model.
+
+Indexes the spam messages of a ``label<TAB>message`` corpus, cleaned with the
+model's stop words, and saves the index where ``SpamFilter.load_model`` picks
+it up. ``--add`` inserts confirmed spam (one message per line) into the
+model's existing index instead of rebuilding it.
+
+    python -m src.training.build_near_duplicate_index [--model data/processed/spam_filter_model]
+    python -m src.training.build_near_duplicate_index --add confirmed_spam.txt
+"""
+import argparse
+import os
+import time
+
+from src.model.near_duplicate import NearDuplicateIndex, index_path
+from src.model.spam_filter import DEFAULT_DATA_PATH, SpamFilter, default_model_path, iter_labeled_chunks
+
+
+def build_index(model, source, **params):
+    """Index the spam messages of a label<TAB>message file or iterable of (label, message) pairs."""
+    index = NearDuplicateIndex(**params)
+    for labels, messages in iter_labeled_chunks(source):
+        index.add(model.clean_batch([message for label, message in zip(labels, messages) if label == 'spam']))
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the near-duplicate spam index of a model')
+    parser.add_argument('--model', default=default_model_path(), help='model directory or .pkl file')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help='label<TAB>message corpus to index')
+    parser.add_argument('--add', metavar='FILE', help='insert confirmed spam from FILE (one message per line)')
+    parser.add_argument('--threshold', type=float, default=0.8, help='estimated Jaccard similarity of a match')
+    parser.add_argument('--hit-probability', type=float, default=0.99,
+                        help='spam probability reported for a match')
+    parser.add_argument('--num-perm', type=int, default=64)
+    parser.add_argument('--bands', type=int, default=16)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = SpamFilter.load_model(args.model)
+    path = index_path(args.model)
+    if args.add:
+        index = model.near_duplicates
+        if index is None:
+            parser.error(f'{path} does not exist; build the index before adding to it')
+        with open(args.add, encoding='utf-8') as f:
+            added = index.add(model.clean_batch([line.rstrip('\n') for line in f if line.strip()]))
+    else:
+        index = build_index(model, args.data, num_perm=args.num_perm, bands=args.bands, threshold=args.threshold,
+                            hit_probability=args.hit_probability)
+        added = len(index)
+    index.save(path)
+    print(f'Wrote {path}: {len(index)} entries ({added} added), '
+          f'{os.path.getsize(path) / 1024:.1f} KiB in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Export a pruned, quantized mapped model for memory-constrained deployments.
+
+Trains a SpamFilter on a ``label<TAB>message`` corpus exactly as
+``SpamFilter.train`` does, writes it in the mapped format with terms pruned by
+training count and/or log-odds and the log-probabilities stored as float16
+or int8, and reports size and accuracy on train()'s held-out split next to
+the exact float64 export. The result loads with ``SpamFilter.load_model`` (or
+``MappedSpamFilter.load``) and scores with NumPy only.
+
+    python -m src.training.export_compact_model -o data/processed/spam_filter_model_int8 \\
+        [--dtype int8] [--min-count 2] [--min-log-odds 0.5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.model.artifact_cache import ArtifactCache
+from src.model.mapped_model import STORAGE_DTYPES, MappedSpamFilter
+from src.model.spam_filter import DEFAULT_DATA_PATH, SpamFilter, split_corpus
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def evaluate_export(path, clean_messages, labels, reference=None):
+    """Size and held-out metrics of the mapped model in path; agreement with reference probabilities."""
+    from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+    model = MappedSpamFilter.load(path)
+    predictions, _ = model._score_clean(clean_messages)
+    probabilities = model.predict_proba(clean_messages)
+    precision, recall, _, _ = precision_recall_fscore_support(
+        labels, predictions, pos_label='spam', average='binary', zero_division=0)
+    report = {
+        'path': path,
+        'terms': len(model.hashes),
+        'bytes': directory_size(path),
+        'accuracy': accuracy_score(labels, predictions),
+        'spam_precision': precision,
+        'spam_recall': recall,
+    }
+    if reference is not None:
+        report['agreement'] = float(np.mean(model.classes_[probabilities.argmax(axis=1)]
+                                            == model.classes_[reference.argmax(axis=1)]))
+        report['max_probability_error'] = float(np.abs(probabilities - reference).max())
+    return report, probabilities
+
+
+def train_with_held_out(data_path, cache_dir=None):
+    """A SpamFilter trained as train() does, with the cleaned held-out messages and labels."""
+    artifact_cache = ArtifactCache(cache_dir) if cache_dir else None
+    model = SpamFilter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.train(data_path, artifact_cache)
+    _, test_messages, _, test_labels = split_corpus(model.load_corpus(data_path, artifact_cache))
+    return model, test_messages, test_labels
+
+
+def print_reports(reports):
+    print(f"{'export':<28}{'terms':>7}{'KiB':>9}{'accuracy':>10}{'precision':>11}{'recall':>8}"
+          f"{'agree':>8}{'max |dp|':>10}")
+    for name, report in reports:
+        print(f"{name:<28}{report['terms']:>7}{report['bytes'] / 1024:>9.1f}{report['accuracy']:>10.4f}"
+              f"{report['spam_precision']:>11.4f}{report['spam_recall']:>8.4f}"
+              f"{report.get('agreement', 1.0):>8.4f}{report.get('max_probability_error', 0.0):>10.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a pruned, quantized mapped model')
+    parser.add_argument('-o', '--output', required=True, help='model directory to write')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH)
+    parser.add_argument('--dtype', choices=STORAGE_DTYPES, default='int8', help='log-probability storage')
+    parser.add_argument('--min-count', type=int, default=0, help='drop terms seen fewer times in training')
+    parser.add_argument('--min-log-odds', type=float, default=0.0,
+                        help='drop terms whose class log-probabilities differ by less')
+    parser.add_argument('--cache-dir', help='artifact cache for the cleaned corpus and features')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model, test_messages, test_labels = train_with_held_out(args.data, args.cache_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        model.export_model(tmp)
+        exact, reference = evaluate_export(tmp, test_messages, test_labels)
+        model.export_model(args.output, args.dtype, args.min_count, args.min_log_odds)
+        compact, _ = evaluate_export(args.output, test_messages, test_labels, reference)
+    print_reports([('float64 (exact)', exact),
+                   (f'{args.dtype} count>={args.min_count} odds>={args.min_log_odds:g}', compact)])
+    print(f"Wrote {args.output}: {compact['bytes'] / exact['bytes']:.1%} of the exact export's size, "
+          f"accuracy {compact['accuracy'] - exact['accuracy']:+.4f} on {len(test_labels)} held-out messages "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
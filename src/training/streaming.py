@@ -0,0 +1,174 @@
+"""Train a SpamFilter on corpora too large to load into memory.
+
+The corpus is read in chunks. Worker processes clean and tokenize each chunk
+and return per-class message and token counts, which the parent adds up; at
+most ``2 * workers`` chunks are in flight, so peak memory is bounded by the
+chunk size and the vocabulary rather than the corpus. MultinomialNB needs
+nothing but these sums, so the final classifier is fitted on one aggregate
+row per class and matches a ``fit`` on the whole corpus.
+
+    python -m src.training.streaming corpus.tsv -o data/processed/spam_filter_model --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from collections import Counter, deque
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from src.model.preprocessing import clean_batch
+from src.model.spam_filter import CLASSES, FEATURE_MODES, SpamFilter, iter_labeled_chunks
+
+_worker_state = None
+
+
+def _init_worker(stop_words, vectorizer):
+    global _worker_state
+    _worker_state = (stop_words, vectorizer)
+
+
+def _count_worker(labels, messages):
+    return count_chunk(labels, messages, *_worker_state)
+
+
+def count_chunk(labels, messages, stop_words, vectorizer):
+    """Per-class message counts and token counts of one chunk.
+
+    Token counts are a Counter per class for a CountVectorizer, or a sparse
+    [n_classes, n_features] matrix of summed features for hashing.
+    """
+    classes = np.searchsorted(CLASSES, labels)
+    classes = np.minimum(classes, len(CLASSES) - 1)
+    unknown = CLASSES[classes] != np.asarray(labels, dtype=object)
+    if unknown.any():
+        raise ValueError(f'Unknown labels {sorted(set(np.asarray(labels, dtype=object)[unknown]))}')
+    class_counts = np.bincount(classes, minlength=len(CLASSES))
+    clean_messages = clean_batch(messages, stop_words)
+
+    if isinstance(vectorizer, CountVectorizer):
+        analyzer = vectorizer.build_analyzer()
+        token_counts = [Counter() for _ in CLASSES]
+        for k, clean_message in zip(classes, clean_messages):
+            token_counts[k].update(analyzer(clean_message))
+        return class_counts, token_counts
+
+    features = vectorizer.transform(clean_messages)
+    membership = sparse.csr_matrix(
+        (np.ones(len(classes)), (classes, np.arange(len(classes)))), shape=(len(CLASSES), len(classes))
+    )
+    return class_counts, membership @ features
+
+
+class ClassTotals:
+    """Running sum of the counts returned by count_chunk."""
+
+    def __init__(self):
+        self.class_counts = np.zeros(len(CLASSES), dtype=np.int64)
+        self.token_counts = None
+        self.chunks = 0
+
+    def add(self, part):
+        class_counts, token_counts = part
+        self.class_counts += class_counts
+        self.chunks += 1
+        if self.token_counts is None:
+            self.token_counts = token_counts
+        elif isinstance(token_counts, list):
+            for total, counts in zip(self.token_counts, token_counts):
+                total.update(counts)
+        else:
+            self.token_counts = self.token_counts + token_counts
+
+    def fit(self, spam_filter):
+        """Fit spam_filter's vectorizer and classifier from the totals."""
+        if not self.class_counts.all():
+            raise ValueError(f'Training data needs messages of every class {CLASSES.tolist()}, '
+                             f'got counts {self.class_counts.tolist()}')
+        if isinstance(self.token_counts, list):
+            # CountVectorizer.fit numbers its vocabulary in sorted term order
+            terms = sorted(set().union(*self.token_counts))
+            vocabulary = {term: column for column, term in enumerate(terms)}
+            rows, columns, values = [], [], []
+            for k, counts in enumerate(self.token_counts):
+                rows.append(np.full(len(counts), k))
+                columns.append(np.fromiter((vocabulary[term] for term in counts), dtype=np.int64, count=len(counts)))
+                values.append(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+            features = sparse.csr_matrix(
+                (np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                shape=(len(CLASSES), len(terms))
+            )
+            spam_filter.vectorizer.vocabulary_ = vocabulary
+            spam_filter.vectorizer.fixed_vocabulary_ = False
+        else:
+            features = self.token_counts
+
+        # One aggregate row per class gives the right feature counts; the
+        # class counts, and the prior derived from them, are set from the totals
+        classifier = spam_filter.classifier
+        classifier.fit(features, CLASSES)
+        classifier.class_count_ = self.class_counts.astype(np.float64)
+        classifier.class_log_prior_ = np.log(classifier.class_count_) - np.log(classifier.class_count_.sum())
+        return spam_filter
+
+
+def _bounded_map(pool, chunks, max_pending):
+    pending = deque()
+    for labels, messages in chunks:
+        pending.append(pool.apply_async(_count_worker, (labels, messages)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def train_streaming(spam_filter, source, chunk_size=10000, workers=None):
+    """Train spam_filter on a label<TAB>message file or an iterable of (label, message) pairs."""
+    workers = workers or os.cpu_count() or 1
+    chunks = iter_labeled_chunks(source, chunk_size)
+    totals = ClassTotals()
+    if workers == 1:
+        for labels, messages in chunks:
+            totals.add(count_chunk(labels, messages, spam_filter.stop_words, spam_filter.vectorizer))
+    else:
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        with multiprocessing.get_context(method).Pool(
+            workers, initializer=_init_worker, initargs=(spam_filter.stop_words, spam_filter.vectorizer)
+        ) as pool:
+            for part in _bounded_map(pool, chunks, 2 * workers):
+                totals.add(part)
+    totals.fit(spam_filter)
+    spam_filter.evaluation = None
+    spam_filter._invalidate_cache()
+    return spam_filter
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a spam filter by streaming a large TSV corpus')
+    parser.add_argument('input', help='label<TAB>message file')
+    parser.add_argument('-o', '--output', required=True, help='model directory (mapped format) or .pkl file')
+    parser.add_argument('--feature-mode', choices=FEATURE_MODES, default='count')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    args = parser.parse_args()
+    if args.feature_mode == 'hashing' and not args.output.endswith('.pkl'):
+        parser.error('hashing models can only be saved as a .pkl file')
+
+    start = time.perf_counter()
+    spam_filter = train_streaming(SpamFilter(feature_mode=args.feature_mode), args.input,
+                                  chunk_size=args.chunk_size, workers=args.workers)
+    spam_filter.publish(args.output)
+
+    class_counts = dict(zip(CLASSES.tolist(), spam_filter.classifier.class_count_.astype(int).tolist()))
+    peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    worker_peak_mib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f'Trained on {sum(class_counts.values())} messages {class_counts} in '
+          f'{time.perf_counter() - start:.1f}s, peak RSS {peak_mib:.0f} MiB '
+          f'(largest worker {worker_peak_mib:.0f} MiB); wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Cross-validation and hyperparameter sweeps on cached feature matrices.
+
+The corpus is cleaned once and each n-gram range is vectorized once over all
+messages; both are kept in the artifact cache (``src/model/artifact_cache.py``)
+so later sweeps on the same data skip straight to fitting. A fold never needs
+its own vectorizer: fitting CountVectorizer on the training rows keeps exactly
+the columns of the full matrix whose document frequency in those rows reaches
+``min_df``, in the same sorted order, so each fold is a column slice of the
+cached matrix. Folds and ``min_df`` values are spread
+over worker processes and each worker fits every ``alpha`` on its slice.
+
+    python -m src.training.tuning --alpha 0.1 0.5 1 --ngram 1,1 1,2 --min-df 1 2 -o report.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import sklearn
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.metrics import accuracy_score, log_loss, precision_recall_fscore_support
+from sklearn.model_selection import StratifiedKFold
+from sklearn.naive_bayes import MultinomialNB
+
+from src.model.artifact_cache import DEFAULT_ARTIFACT_DIR, ArtifactCache
+from src.model.spam_filter import CLASSES, DEFAULT_DATA_PATH, SpamFilter
+
+METRICS = ('accuracy', 'precision', 'recall', 'f1', 'log_loss')
+
+_worker_state = None
+
+
+def load_features(data_path, ngram_ranges, artifact_cache):
+    """Class codes and a full-corpus count matrix per n-gram range, built or loaded from the cache."""
+    spam_filter = SpamFilter()
+    corpus_key = artifact_cache.key('corpus', spam_filter.corpus_inputs(data_path, artifact_cache))
+    corpus = spam_filter.load_corpus(data_path, artifact_cache)
+    labels = np.asarray(corpus['labels'], dtype=object)
+    y = np.minimum(np.searchsorted(CLASSES, labels), len(CLASSES) - 1)
+    if (CLASSES[y] != labels).any():
+        raise ValueError(f'{data_path} has labels other than {CLASSES.tolist()}')
+
+    counts = {}
+    for ngram_range in ngram_ranges:
+        inputs = {'corpus': corpus_key, 'ngram_range': list(ngram_range), 'sklearn': sklearn.__version__}
+        counts[ngram_range] = artifact_cache.get_or_build('counts', inputs, lambda: {
+            'counts': CountVectorizer(ngram_range=ngram_range).fit_transform(corpus['clean_messages'])
+        })[1]['counts']
+    return y, counts
+
+
+def _init_worker(counts, y):
+    global _worker_state
+    _worker_state = (counts, y)
+
+
+def _fold_worker(task):
+    counts, y = _worker_state
+    return evaluate_fold(counts[task['ngram_range']], y, **task)
+
+
+def evaluate_fold(counts, y, ngram_range, min_df, alphas, fold, train_index, test_index):
+    """Scores of every alpha on one fold; counts is the full-corpus matrix for ngram_range."""
+    start = time.perf_counter()
+    # Same rule as CountVectorizer: an int min_df is a document count, a float a fraction
+    min_count = min_df if isinstance(min_df, int) else min_df * len(train_index)
+    train_counts = counts[train_index]
+    # Each row lists a column at most once, so counting column indices counts documents
+    document_frequency = np.bincount(train_counts.indices, minlength=counts.shape[1])
+    columns = np.flatnonzero(document_frequency >= min_count)
+    X_train = train_counts[:, columns]
+    X_test = counts[test_index][:, columns]
+    y_train, y_test = y[train_index], y[test_index]
+    slice_seconds = time.perf_counter() - start
+
+    results = []
+    for alpha in alphas:
+        start = time.perf_counter()
+        classifier = MultinomialNB(alpha=alpha).fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - start
+        probabilities = classifier.predict_proba(X_test)
+        y_pred = classifier.classes_[probabilities.argmax(axis=1)]
+        precision, recall, f1, _ = precision_recall_fscore_support(
+            y_test, y_pred, labels=[1], average='binary', zero_division=0)
+        results.append({
+            'ngram_range': list(ngram_range),
+            'min_df': min_df,
+            'alpha': alpha,
+            'fold': fold,
+            'n_features': len(columns),
+            'accuracy': accuracy_score(y_test, y_pred),
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'log_loss': log_loss(y_test, probabilities, labels=classifier.classes_),
+            'fit_seconds': fit_seconds + slice_seconds / len(alphas),
+        })
+    return results
+
+
+def summarize(fold_results, metric='f1'):
+    """Mean and standard deviation across folds per configuration, best first by metric."""
+    configurations = {}
+    for result in fold_results:
+        key = (tuple(result['ngram_range']), result['min_df'], result['alpha'])
+        configurations.setdefault(key, []).append(result)
+    summary = []
+    for (ngram_range, min_df, alpha), results in configurations.items():
+        entry = {'params': {'ngram_range': list(ngram_range), 'min_df': min_df, 'alpha': alpha},
+                 'n_features': int(np.mean([r['n_features'] for r in results]))}
+        for name in METRICS + ('fit_seconds',):
+            values = [r[name] for r in results]
+            entry[name] = {'mean': float(np.mean(values)), 'std': float(np.std(values))}
+        summary.append(entry)
+    # log_loss is the only metric where lower is better
+    sign = 1 if metric == 'log_loss' else -1
+    summary.sort(key=lambda entry: sign * entry[metric]['mean'])
+    for rank, entry in enumerate(summary, 1):
+        entry['rank'] = rank
+    return summary
+
+
+def tune(data_path=DEFAULT_DATA_PATH, alphas=(1.0,), ngram_ranges=((1, 1),), min_dfs=(1,), folds=5,
+         seed=42, metric='f1', workers=None, cache_dir=DEFAULT_ARTIFACT_DIR):
+    """Run k-fold CV over the parameter grid and return the report as a dict."""
+    if metric not in METRICS:
+        raise ValueError(f'metric must be one of {METRICS}, got {metric!r}')
+    start = time.perf_counter()
+    artifact_cache = ArtifactCache(cache_dir)
+    ngram_ranges = [tuple(ngram_range) for ngram_range in ngram_ranges]
+    y, counts = load_features(data_path, ngram_ranges, artifact_cache)
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(np.zeros(len(y)), y))
+    tasks = [
+        {'ngram_range': ngram_range, 'min_df': min_df, 'alphas': list(alphas), 'fold': fold,
+         'train_index': train_index, 'test_index': test_index}
+        for ngram_range, min_df, (fold, (train_index, test_index))
+        in itertools.product(ngram_ranges, min_dfs, enumerate(splits))
+    ]
+
+    sweep_start = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers == 1:
+        _init_worker(counts, y)
+        fold_results = [_fold_worker(task) for task in tasks]
+    else:
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        with multiprocessing.get_context(method).Pool(
+            workers, initializer=_init_worker, initargs=(counts, y)
+        ) as pool:
+            fold_results = pool.map(_fold_worker, tasks)
+    fold_results = list(itertools.chain.from_iterable(fold_results))
+    summary = summarize(fold_results, metric)
+
+    return {
+        'data': {'path': data_path, 'sha256': artifact_cache.file_digest(data_path), 'messages': len(y),
+                 'class_counts': dict(zip(CLASSES.tolist(), np.bincount(y, minlength=len(CLASSES)).tolist()))},
+        'cv': {'folds': folds, 'seed': seed, 'metric': metric},
+        'grid': {'alpha': list(alphas), 'ngram_range': [list(n) for n in ngram_ranges], 'min_df': list(min_dfs)},
+        'best': summary[0],
+        'results': summary,
+        'folds': fold_results,
+        'cache': artifact_cache.stats(),
+        'timings': {'workers': workers, 'sweep_seconds': time.perf_counter() - sweep_start,
+                    'total_seconds': time.perf_counter() - start},
+    }
+
+
+def _ngram_range(value):
+    try:
+        low, high = (int(n) for n in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected MIN,MAX such as 1,2, got {value!r}')
+    return low, high
+
+
+def _min_df(value):
+    return float(value) if '.' in value else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validate the spam filter over a parameter grid')
+    parser.add_argument('data', nargs='?', default=DEFAULT_DATA_PATH, help='label<TAB>message file')
+    parser.add_argument('--alpha', type=float, nargs='+', default=[1.0], help='MultinomialNB smoothing values')
+    parser.add_argument('--ngram', type=_ngram_range, nargs='+', default=[(1, 1)], metavar='MIN,MAX',
+                        help='CountVectorizer n-gram ranges')
+    parser.add_argument('--min-df', type=_min_df, nargs='+', default=[1],
+                        help='minimum document frequency: a count, or a fraction such as 0.001')
+    parser.add_argument('-k', '--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--metric', choices=METRICS, default='f1', help='metric used to rank configurations')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    parser.add_argument('--cache-dir', default=DEFAULT_ARTIFACT_DIR)
+    parser.add_argument('-o', '--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = tune(args.data, args.alpha, args.ngram, args.min_df, folds=args.folds, seed=args.seed,
+                  metric=args.metric, workers=args.workers, cache_dir=args.cache_dir)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,224 @@
-from flask import Flask, render_template, request, jsonify
-from src.model.spam_filter import SpamFilter
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from src.model.artifact_cache import DEFAULT_ARTIFACT_DIR, ArtifactCache
+from src.model.cascade import DEFAULT_BAND, DEFAULT_LIGHTWEIGHT_MODEL, cascade_loader, parse_band
+from src.model.engine import ScoringEngine
+from src.model.metrics import cache_collector, registry as metrics
+from src.model.reloader import ModelReloader
+from src.model.spam_filter import (
+    DEFAULT_DATA_PATH, DEFAULT_MODEL_DIR, DEFAULT_MODEL_PATH, SpamFilter, default_model_path, load_compiled_model,
+    load_stop_words
+)
+from src.web.batch import NDJSON_MIMETYPE, batch_chunks, read_batch, result_lines
+from src.web.serving import WARMUP_MESSAGES, cache_from_env, detach_cache, model_collector
+import hmac
 import os
+import threading
+import time
 
 app = Flask(__name__)
+app.config['MAX_BATCH_SIZE'] = int(os.environ.get('SPAM_MAX_BATCH_SIZE', 1000))
+app.config['BATCH_CHUNK_SIZE'] = int(os.environ.get('SPAM_BATCH_CHUNK_SIZE', 256))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('SPAM_MAX_CONTENT_LENGTH', 5 * 1024 * 1024))
+app.config['SCORING_WORKERS'] = int(os.environ.get('SPAM_SCORING_WORKERS', 1))
+# eager: load before the module finishes importing; background: load in a thread; off: call warm_up() yourself
+app.config['WARMUP'] = os.environ.get('SPAM_WARMUP', 'eager')
+app.config['MODEL_PATH'] = os.environ.get('SPAM_MODEL_PATH')
+app.config['MODEL_WATCH_INTERVAL'] = float(os.environ.get('SPAM_MODEL_WATCH_INTERVAL', 0))
+# Serve the compiled scorer (src/model/compiled.py) instead of the loaded model itself
+app.config['COMPILED_MODEL'] = os.environ.get('SPAM_COMPILED_MODEL', '0') == '1'
+# Rule prefilter and lightweight model first; the full model only scores messages inside the band
+app.config['CASCADE'] = os.environ.get('SPAM_CASCADE', '0') == '1'
+app.config['CASCADE_BAND'] = parse_band(os.environ.get('SPAM_CASCADE_BAND') or DEFAULT_BAND)
+app.config['LIGHTWEIGHT_MODEL'] = os.environ.get('SPAM_LIGHTWEIGHT_MODEL', DEFAULT_LIGHTWEIGHT_MODEL)
+app.config['ADMIN_TOKEN'] = os.environ.get('SPAM_ADMIN_TOKEN')
+# Cleaned corpus and feature matrices reused when the model has to be trained; empty disables
+app.config['ARTIFACT_CACHE_DIR'] = os.environ.get('SPAM_ARTIFACT_CACHE_DIR', DEFAULT_ARTIFACT_DIR)
 
-spam_filter = None
+reloader = None
+prediction_cache = cache_from_env()
+
+metrics.add_collector(cache_collector(prediction_cache))
+
+model_lock = threading.Lock()
+model_ready = threading.Event()
+warmup_info = {}
 
 def load_or_train_model():
-    global spam_filter
-    model_path = 'data/processed/spam_filter_model.pkl'
+    # Returns the path of the model to serve, training one if none exists yet
+    model_path = app.config['MODEL_PATH'] or default_model_path()
     
-    if os.path.exists(model_path):
-        spam_filter = SpamFilter.load_model(model_path)
-    else:
+    if not os.path.exists(model_path):
         spam_filter = SpamFilter()
-        spam_filter.train('data/raw/spam.csv')
-        spam_filter.save_model(model_path)
+        artifact_cache = ArtifactCache(app.config['ARTIFACT_CACHE_DIR']) if app.config['ARTIFACT_CACHE_DIR'] else None
+        spam_filter.train(DEFAULT_DATA_PATH, artifact_cache)
+        if app.config['MODEL_PATH']:
+            spam_filter.publish(model_path)
+        else:
+            spam_filter.save_model(DEFAULT_MODEL_PATH)
+            spam_filter.export_model(DEFAULT_MODEL_DIR)
+            model_path = default_model_path()
+    elif model_path == DEFAULT_MODEL_DIR and os.path.exists(DEFAULT_MODEL_PATH) \
+            and os.path.getmtime(DEFAULT_MODEL_PATH) > os.path.getmtime(DEFAULT_MODEL_DIR):
+        # Only the served path is reloaded; a newer pickle is ignored until it is exported
+        app.logger.warning('Serving %s although %s is newer; publish new models to the served path',
+                           DEFAULT_MODEL_DIR, DEFAULT_MODEL_PATH)
+    return model_path
+
+def _prepare_model(model, version):
+    # Batch requests are spread over worker processes that load a copy of the validated
+    # version. Reloads run while request threads hold locks a fork would copy, so the
+    # workers come from a forkserver rather than being forked from this process
+    engine = None
+    if app.config['SCORING_WORKERS'] > 1:
+        engine = ScoringEngine(model, model_path=reloader.path, workers=app.config['SCORING_WORKERS'],
+                               start_method='forkserver', loader=reloader.loader, version=version)
+    model.set_cache(prediction_cache)
+    return engine
+
+def warm_up():
+    # Runs once per process; concurrent callers wait for the first one instead of loading again
+    global reloader
+    with model_lock:
+        if model_ready.is_set():
+            return
+        start = time.perf_counter()
+        load_stop_words()
+        # The reloader validates the model on the warm-up messages before it goes live
+        loader = load_compiled_model if app.config['COMPILED_MODEL'] else SpamFilter.load_model
+        if app.config['CASCADE']:
+            loader = cascade_loader(loader, app.config['LIGHTWEIGHT_MODEL'], app.config['CASCADE_BAND'])
+        reloader = ModelReloader(load_or_train_model(), loader=loader, warmup_messages=WARMUP_MESSAGES,
+                                 prepare=_prepare_model, retire=detach_cache(prediction_cache))
+        reloader.reload()
+        if app.config['MODEL_WATCH_INTERVAL'] > 0:
+            reloader.watch(app.config['MODEL_WATCH_INTERVAL'])
+        warmup_info['seconds'] = time.perf_counter() - start
+        model_ready.set()
+
+def _not_ready():
+    return jsonify({'error': 'Model is not ready'}), 503
+
+def _collect_ready():
+    yield 'spam_model_ready', 'gauge', 'Whether the model is loaded and warmed up', {}, model_ready.is_set()
+
+metrics.add_collector(_collect_ready)
+metrics.add_collector(model_collector(lambda: reloader))
+
+@app.before_request
+def _start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unknown'
+        metrics.observe('spam_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc('spam_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+@app.route('/health')
+def health():
+    # Liveness: the process is up, whether or not the model has loaded
+    return jsonify({
+        'status': 'ok',
+        'ready': model_ready.is_set(),
+        'model': reloader.status() if reloader else None,
+        'cache': prediction_cache.stats()
+    })
+
+@app.route('/ready')
+def ready():
+    # Readiness: only route traffic here once the model is loaded and warmed up
+    if not model_ready.is_set():
+        return jsonify({'ready': False}), 503
+    return jsonify({
+        'ready': True,
+        'warmup_seconds': warmup_info.get('seconds'),
+        'model_version': reloader.active.version
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        return jsonify({'error': 'Admin endpoint is disabled (set SPAM_ADMIN_TOKEN)'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not model_ready.is_set():
+        return _not_ready()
+    
+    # A rejected model leaves the current one serving
+    try:
+        reloaded = reloader.reload(force=request.args.get('force') == '1')
+    except Exception as e:
+        return jsonify({'reloaded': False, 'error': str(e), **reloader.status()}), 422
+    return jsonify({'reloaded': reloaded, **reloader.status()})
+
 @app.route('/check_spam', methods=['POST'])
 def check_spam():
-    if not spam_filter:
-        load_or_train_model()
+    if not model_ready.is_set():
+        return _not_ready()
     
-    data = request.get_json()
+    with metrics.stage('json_decode'):
+        data = request.get_json()
     message = data.get('message', '')
     
     if not message:
         return jsonify({'error': 'No message provided'}), 400
     
-    prediction, probability = spam_filter.predict(message)
+    # Requests finish on the model they started with, even if a reload swaps it
+    with reloader.use() as active:
+        prediction, probability = active.model.predict(message)
+    metrics.inc('spam_predictions_total', label=prediction)
     
-    return jsonify({
-        'prediction': prediction,
-        'probability': float(probability),
-        'is_spam': prediction == 'spam'
-    })
+    with metrics.stage('json_encode'):
+        return jsonify({
+            'prediction': prediction,
+            'probability': float(probability),
+            'is_spam': prediction == 'spam',
+            'model_version': active.version
+        })
+
+def _score_chunks(active, chunks):
+    # (messages, predictions, probabilities) per chunk, on the worker pool when there is one
+    if active.resources is not None:
+        return active.resources.map_batches(chunks)
+    return ((messages,) + tuple(active.model.predict_batch(valid)) for messages, valid in chunks)
+
+@app.route('/check_spam_batch', methods=['POST'])
+def check_spam_batch():
+    if not model_ready.is_set():
+        return _not_ready()
+    
+    items, error = read_batch(request, app.config['MAX_BATCH_SIZE'])
+    if error is not None:
+        return error
+    
+    # Held until the streamed response is closed so a reload cannot retire it mid-stream
+    active = reloader.acquire()
+    stream = result_lines(_score_chunks(active, batch_chunks(items, app.config['BATCH_CHUNK_SIZE'])))
+    response = Response(stream_with_context(stream), mimetype=NDJSON_MIMETYPE)
+    response.headers['X-Model-Version'] = active.version
+    response.call_on_close(active.release)
+    return response
+
+if __name__ == '__mp_main__':
+    # Imported as the main module of a scoring worker or forkserver: the worker loads its own model
+    pass
+elif app.config['WARMUP'] == 'eager':
+    warm_up()
+elif app.config['WARMUP'] == 'background':
+    threading.Thread(target=warm_up, name='model-warmup', daemon=True).start()
 
 if __name__ == '__main__':
-    load_or_train_model()
     app.run(debug=True) 
\ No newline at end of file
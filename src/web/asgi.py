@@ -0,0 +1,244 @@
+"""Asynchronous ASGI serving path with micro-batched scoring.
+
+Concurrent ``POST /check_spam`` requests are coalesced by a ``MicroBatcher``
+into one ``predict_batch`` call, so under load the vectorizer and classifier
+run once per batch instead of once per request. The JSON contract matches
+``/check_spam`` of the Flask apps.
+
+    uvicorn src.web.asgi:app --port 8000
+
+``SPAM_ASGI_MODEL=full`` (default) serves the scikit-learn model from
+``SPAM_MODEL_PATH`` with the same reloader as ``src/web/app.py`` (behind the
+cascade of ``src/model/cascade.py`` with ``SPAM_CASCADE=1``);
+``lightweight`` serves the count-table model of ``api/index.py``.
+"""
+import asyncio
+import json
+import os
+import time
+
+from src.model.batching import MicroBatcher
+from src.model.cascade import DEFAULT_BAND, DEFAULT_LIGHTWEIGHT_MODEL, cascade_loader, parse_band
+from src.model.metrics import cache_collector, registry as metrics
+from src.model.reloader import ModelReloader
+from src.model.spam_filter import SpamFilter, default_model_path, load_compiled_model, load_stop_words
+from src.web.serving import WARMUP_MESSAGES, cache_from_env, detach_cache, model_collector
+
+config = {
+    'MODEL': os.environ.get('SPAM_ASGI_MODEL', 'full'),
+    'MODEL_PATH': os.environ.get('SPAM_MODEL_PATH'),
+    'MODEL_WATCH_INTERVAL': float(os.environ.get('SPAM_MODEL_WATCH_INTERVAL', 0)),
+    'COMPILED_MODEL': os.environ.get('SPAM_COMPILED_MODEL', '0') == '1',
+    'CASCADE': os.environ.get('SPAM_CASCADE', '0') == '1',
+    'CASCADE_BAND': parse_band(os.environ.get('SPAM_CASCADE_BAND') or DEFAULT_BAND),
+    'LIGHTWEIGHT_MODEL': os.environ.get('SPAM_LIGHTWEIGHT_MODEL', DEFAULT_LIGHTWEIGHT_MODEL),
+    'MICROBATCH_MAX_SIZE': int(os.environ.get('SPAM_MICROBATCH_MAX_SIZE', 64)),
+    'MICROBATCH_MAX_WAIT': float(os.environ.get('SPAM_MICROBATCH_MAX_WAIT_MS', 2)) / 1000,
+    'MAX_CONTENT_LENGTH': int(os.environ.get('SPAM_MAX_CONTENT_LENGTH', 5 * 1024 * 1024)),
+}
+
+class SpamService:
+    """Owns the model and the batcher; score() runs in the batcher's executor thread."""
+
+    def __init__(self, model_kind, model_path=None):
+        self.model_kind = model_kind
+        self.model_path = model_path
+        self.reloader = None
+        self.lightweight = None
+        self.batcher = MicroBatcher(self.score, config['MICROBATCH_MAX_SIZE'], config['MICROBATCH_MAX_WAIT'])
+        self.prediction_cache = cache_from_env()
+        self.collect_cache = True
+        self.collect_model = model_collector(lambda: self.reloader)
+        self.ready = False
+
+    def load(self):
+        if self.model_kind == 'lightweight':
+            from api.index import spam_filter
+            if not spam_filter.is_trained:
+                spam_filter.train()
+            self.lightweight = spam_filter
+            # api.index already registered a collector for its cache
+            self.prediction_cache = spam_filter.prediction_cache
+            self.collect_cache = False
+        elif self.model_kind == 'full':
+            load_stop_words()
+            loader = load_compiled_model if config['COMPILED_MODEL'] else SpamFilter.load_model
+            if config['CASCADE']:
+                loader = cascade_loader(loader, config['LIGHTWEIGHT_MODEL'], config['CASCADE_BAND'])
+            self.reloader = ModelReloader(self.model_path or default_model_path(), loader=loader,
+                                          warmup_messages=WARMUP_MESSAGES, prepare=self._prepare_model,
+                                          retire=detach_cache(self.prediction_cache))
+            self.reloader.reload()
+            if config['MODEL_WATCH_INTERVAL'] > 0:
+                self.reloader.watch(config['MODEL_WATCH_INTERVAL'])
+        else:
+            raise ValueError(f"SPAM_ASGI_MODEL must be 'full' or 'lightweight', not {self.model_kind!r}")
+        self.ready = True
+
+    def _prepare_model(self, model, version):
+        model.set_cache(self.prediction_cache)
+
+    def collect(self):
+        if self.collect_cache:
+            yield from cache_collector(self.prediction_cache)()
+        stats = self.batcher.stats()
+        yield 'spam_microbatches_total', 'counter', 'Micro-batches scored', {}, stats['batches']
+        yield 'spam_microbatch_messages_total', 'counter', 'Messages scored in micro-batches', {}, stats['messages']
+        yield from self.collect_model()
+
+    def score(self, messages):
+        if self.lightweight is not None:
+            predictions, probabilities = self.lightweight.predict_batch(messages)
+            return [_result(prediction, probability) for prediction, probability in zip(predictions, probabilities)]
+        # The whole batch is scored by one model version, even if a reload swaps it meanwhile
+        with self.reloader.use() as active:
+            predictions, probabilities = active.model.predict_batch(messages)
+        return [_result(prediction, probability, active.version)
+                for prediction, probability in zip(predictions, probabilities)]
+
+    def status(self):
+        return {
+            'status': 'ok',
+            'ready': self.ready,
+            'model_kind': self.model_kind,
+            'model': self.reloader.status() if self.reloader else None,
+            'batching': self.batcher.stats(),
+        }
+
+    async def close(self):
+        await self.batcher.close()
+        if self.reloader is not None:
+            self.reloader.stop()
+
+
+def _result(prediction, probability, version=None):
+    prediction = str(prediction)
+    result = {'prediction': prediction, 'probability': float(probability), 'is_spam': prediction == 'spam'}
+    if version is not None:
+        result['model_version'] = version
+    return result
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def _read_body(receive, limit):
+    body = bytearray()
+    while True:
+        event = await receive()
+        if event['type'] == 'http.disconnect':
+            return None
+        body.extend(event.get('body', b''))
+        if len(body) > limit:
+            raise RequestTooLarge()
+        if not event.get('more_body', False):
+            return bytes(body)
+
+
+async def _send(send, body, content_type, status=200):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+
+async def _send_json(send, payload, status=200):
+    with metrics.stage('json_encode'):
+        body = json.dumps(payload).encode('utf-8')
+    return await _send(send, body, b'application/json', status)
+
+
+# (method, path) -> endpoint name used in metric labels
+ROUTES = {
+    ('GET', '/health'): 'health',
+    ('GET', '/ready'): 'ready',
+    ('GET', '/metrics'): 'metrics',
+    ('POST', '/check_spam'): 'check_spam',
+}
+
+
+class SpamApp:
+    def __init__(self, service):
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            event = await receive()
+            if event['type'] == 'lifespan.startup':
+                try:
+                    # Loading blocks for a while, so keep it off the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, self.service.load)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif event['type'] == 'lifespan.shutdown':
+                await self.service.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        endpoint = ROUTES.get((scope['method'], scope['path']))
+        if endpoint == 'health':
+            status = await _send_json(send, self.service.status())
+        elif endpoint == 'ready':
+            status = await _send_json(send, {'ready': self.service.ready}, 200 if self.service.ready else 503)
+        elif endpoint == 'metrics':
+            status = await _send(send, metrics.render().encode('utf-8'), b'text/plain; version=0.0.4')
+        elif endpoint == 'check_spam':
+            status = await self._check_spam(receive, send)
+        elif any(path == scope['path'] for _, path in ROUTES):
+            status = await _send_json(send, {'error': 'Method not allowed'}, 405)
+        else:
+            status = await _send_json(send, {'error': 'Not found'}, 404)
+        if status is not None and metrics.enabled:
+            endpoint = endpoint or 'unknown'
+            metrics.observe('spam_request_seconds', time.perf_counter() - start, endpoint=endpoint)
+            metrics.inc('spam_requests_total', endpoint=endpoint, status=status)
+
+    async def _check_spam(self, receive, send):
+        if not self.service.ready:
+            return await _send_json(send, {'error': 'Model is not ready'}, 503)
+        try:
+            body = await _read_body(receive, config['MAX_CONTENT_LENGTH'])
+        except RequestTooLarge:
+            return await _send_json(send, {'error': 'Request body too large'}, 413)
+        if body is None:
+            return None
+        with metrics.stage('json_decode'):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+        if not isinstance(data, dict):
+            return await _send_json(send, {'error': 'No JSON data provided'}, 400)
+        message = data.get('message', '')
+        if not message or not isinstance(message, str):
+            return await _send_json(send, {'error': 'No message provided'}, 400)
+
+        try:
+            result = await self.service.batcher.predict(message)
+        except Exception as e:
+            return await _send_json(send, {'error': f'Internal server error: {e}'}, 500)
+        metrics.inc('spam_predictions_total', label=result['prediction'])
+        return await _send_json(send, result)
+
+
+service = SpamService(config['MODEL'], config['MODEL_PATH'])
+metrics.add_collector(service.collect)
+app = SpamApp(service)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=int(os.environ.get('PORT', 8000)))
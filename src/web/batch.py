@@ -0,0 +1,91 @@
+"""Batch endpoint plumbing shared by ``src/web/app.py`` and ``api/index.py``.
+
+A batch is a JSON array (or ``{"messages": [...]}``) or an NDJSON request
+body of strings or ``{"message": ...}`` objects. Every non-empty string is
+scored as sent; anything else gets an error line. Results are streamed back
+as NDJSON, one line per input item, scored ``chunk_size`` items at a time.
+
+NDJSON bodies are read ahead up to ``max_batch_size + 1`` items before the
+response starts, so an oversized batch is refused with 413 in both formats
+rather than after results have been sent.
+"""
+import json
+from collections import Counter
+from itertools import islice
+
+from flask import jsonify
+
+from src.model.metrics import registry as metrics
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def batch_item_message(item):
+    """The message of a batch item (string or object), or None if it has none."""
+    if isinstance(item, dict):
+        item = item.get('message')
+    if isinstance(item, str) and item:
+        return item
+    return None
+
+
+def iter_ndjson(stream):
+    """Decode newline-delimited JSON items from a request stream; undecodable lines are None."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def read_batch(request, max_batch_size):
+    """(items, None) for a valid batch request, or (None, error response)."""
+    if request.mimetype == NDJSON_MIMETYPE:
+        items = list(islice(iter_ndjson(request.stream), max_batch_size + 1))
+    else:
+        with metrics.stage('json_decode'):
+            items = request.get_json(silent=True)
+        if isinstance(items, dict):
+            items = items.get('messages')
+        if not isinstance(items, list):
+            return None, (jsonify({'error': 'Expected a JSON array of messages'}), 400)
+    if len(items) > max_batch_size:
+        return None, (jsonify({'error': f'Batch exceeds maximum size of {max_batch_size} messages'}), 413)
+    return items, None
+
+
+def batch_chunks(items, chunk_size):
+    """(messages, valid messages) per chunk of items; messages has None for items without one."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        messages = [batch_item_message(item) for item in chunk]
+        yield messages, [message for message in messages if message is not None]
+
+
+def result_lines(results):
+    """NDJSON result lines from (messages, predictions, probabilities) per chunk."""
+    index = 0
+    for messages, predictions, probabilities in results:
+        scored = iter(zip(predictions, probabilities))
+        if metrics.enabled:
+            for label, count in Counter(predictions).items():
+                metrics.inc('spam_predictions_total', amount=count, label=label)
+        for message in messages:
+            if message is None:
+                result = {'index': index, 'error': 'No message provided'}
+            else:
+                prediction, probability = next(scored)
+                result = {
+                    'index': index,
+                    'prediction': str(prediction),
+                    'probability': float(probability),
+                    'is_spam': prediction == 'spam'
+                }
+            yield json.dumps(result) + '\n'
+            index += 1
@@ -0,0 +1,60 @@
+"""Setup shared by the web apps: ``src/web/app.py``, ``src/web/asgi.py`` and ``api/index.py``.
+
+The prediction cache is sized from the environment, models are warmed up on
+the same messages, and a retired model is detached from the cache the same
+way everywhere. Only the standard library and the dependency-free model
+modules are imported, so the serverless app can use it too.
+"""
+import os
+
+from src.model.cache import PredictionCache
+from src.model.metrics import cascade_collector, near_duplicate_collector
+
+WARMUP_MESSAGES = [
+    "Free entry in 2 a wkly comp to win FA Cup final tkts 21st May 2005. Text FA to 87121 to receive entry",
+    "Hey, are you coming to the meeting tomorrow?",
+    "URGENT! You have won a 1 week FREE membership in our £100,000 prize Jackpot! Txt CLAIM to 81010",
+    "Ok, I'll see you later then!"
+]
+
+
+def cache_from_env():
+    """PredictionCache sized by SPAM_CACHE_MAX_ENTRIES, SPAM_CACHE_MAX_BYTES and SPAM_CACHE_TTL."""
+    return PredictionCache(
+        max_entries=int(os.environ.get('SPAM_CACHE_MAX_ENTRIES', 10000)),
+        max_bytes=int(os.environ.get('SPAM_CACHE_MAX_BYTES', 8 * 1024 * 1024)),
+        ttl=float(os.environ.get('SPAM_CACHE_TTL', 0)) or None
+    )
+
+
+def detach_cache(prediction_cache):
+    """ModelReloader retire hook: the retired model stops using prediction_cache, which is emptied."""
+    def retire(model):
+        model.prediction_cache = None
+        prediction_cache.clear()
+    return retire
+
+
+def model_collector(get_reloader):
+    """Collector for the model of the ModelReloader get_reloader() returns (None until one exists)."""
+    def collect():
+        reloader = get_reloader()
+        if reloader is None:
+            return
+        # Read from the reloader so the gauge follows every reload
+        status = reloader.status()
+        if status['load_seconds'] is not None:
+            yield 'spam_model_load_seconds', 'gauge', 'Time taken to load the active model', {}, status['load_seconds']
+        yield 'spam_model_reloads_total', 'counter', 'Models swapped in', {}, status['reloads']
+        yield 'spam_model_failed_reloads_total', 'counter', 'Models rejected on reload', {}, status['failed_reloads']
+        active = reloader.active
+        if active is None:
+            return
+        index = getattr(active.model, 'near_duplicates', None)
+        if index is not None:
+            yield from near_duplicate_collector(index)()
+        # Imported here: a reloader means the model dependencies are loaded anyway
+        from src.model.cascade import CascadeSpamFilter
+        if isinstance(active.model, CascadeSpamFilter):
+            yield from cascade_collector(active.model)()
+    return collect
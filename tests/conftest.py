@@ -0,0 +1,69 @@
+"""Shared fixtures: the spam.csv corpus, models trained on it and the Flask app.
+
+    python -m pytest tests
+"""
+import contextlib
+import csv
+import importlib
+import io
+import os
+
+import pytest
+
+from src.model.spam_filter import DEFAULT_DATA_PATH, SpamFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(ROOT, DEFAULT_DATA_PATH)
+ADMIN_TOKEN = 'test-token'
+
+
+def train_quietly(spam_filter, data_path=DATA_PATH, artifact_cache=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return spam_filter.train(data_path, artifact_cache)
+
+
+@pytest.fixture(scope='session')
+def rows():
+    with open(DATA_PATH, encoding='utf-8', newline='') as f:
+        return [(row[0], row[1]) for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)]
+
+
+@pytest.fixture(scope='session')
+def messages(rows):
+    return [message for _, message in rows]
+
+
+@pytest.fixture(scope='session')
+def model():
+    return train_quietly(SpamFilter())
+
+
+@pytest.fixture(scope='session')
+def clean_messages(model, messages):
+    return model.clean_batch(messages)
+
+
+@pytest.fixture(scope='session')
+def web(model, tmp_path_factory):
+    """src/web/app.py serving a copy of model, loaded here instead of while the module is imported."""
+    warmup = os.environ.get('SPAM_WARMUP')
+    os.environ['SPAM_WARMUP'] = 'off'
+    try:
+        web = importlib.import_module('src.web.app')
+    finally:
+        if warmup is None:
+            del os.environ['SPAM_WARMUP']
+        else:
+            os.environ['SPAM_WARMUP'] = warmup
+    model_path = str(tmp_path_factory.mktemp('served') / 'spam_filter_model')
+    model.publish(model_path)
+    web.app.config.update(MODEL_PATH=model_path, ADMIN_TOKEN=ADMIN_TOKEN)
+    web.warm_up()
+    return web
+
+
+@pytest.fixture(scope='session')
+def other_model(rows):
+    # A second, different model to reload to: trained on the first 2000 messages only
+    from src.training.streaming import train_streaming
+    return train_streaming(SpamFilter(), rows[:2000], workers=1)
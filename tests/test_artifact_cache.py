@@ -0,0 +1,66 @@
+"""ArtifactCache (src/model/artifact_cache.py): training stages reused while their inputs are unchanged."""
+import numpy as np
+import pytest
+from scipy import sparse
+
+from src.model.artifact_cache import ArtifactCache
+from src.model.spam_filter import SpamFilter
+
+from tests.conftest import train_quietly
+
+
+@pytest.fixture
+def artifact_cache(tmp_path):
+    return ArtifactCache(str(tmp_path / 'artifacts'))
+
+
+def build_artifact():
+    return {
+        'matrix': sparse.random(20, 50, density=0.1, format='csr', random_state=0),
+        'labels': np.array(['ham', 'spam'] * 10),
+        'terms': ['free', 'café', '', '£1000'],
+    }
+
+
+def test_an_artifact_is_built_once_and_read_back(artifact_cache):
+    key, built = artifact_cache.get_or_build('features', {'size': 20}, build_artifact)
+    same_key, read = artifact_cache.get_or_build('features', {'size': 20}, pytest.fail)
+    assert same_key == key
+    assert (read['matrix'] != built['matrix']).nnz == 0
+    assert read['labels'].tolist() == built['labels'].tolist()
+    assert read['terms'] == built['terms']
+    assert (artifact_cache.misses, artifact_cache.hits) == (['features'], ['features'])
+
+
+def test_changed_inputs_are_rebuilt(artifact_cache):
+    first = artifact_cache.get_or_build('features', {'size': 20}, build_artifact)[0]
+    second = artifact_cache.get_or_build('features', {'size': 21}, build_artifact)[0]
+    assert first != second
+    assert artifact_cache.misses == ['features', 'features']
+
+
+def test_an_unreadable_artifact_is_rebuilt(artifact_cache):
+    key = artifact_cache.get_or_build('features', {}, build_artifact)[0]
+    with open(artifact_cache.path('features', key), 'wb') as f:
+        f.write(b'truncated')
+    artifact_cache.get_or_build('features', {}, build_artifact)
+    assert artifact_cache.misses == ['features', 'features']
+
+
+def test_file_digest_follows_the_contents(tmp_path, artifact_cache):
+    path = tmp_path / 'data.tsv'
+    path.write_text('ham\thello\n')
+    first = artifact_cache.file_digest(str(path))
+    path.write_text('spam\twin cash now\n')
+    assert artifact_cache.file_digest(str(path)) != first
+
+
+def test_cached_training_matches_uncached(artifact_cache, model, messages):
+    cold = train_quietly(SpamFilter(), artifact_cache=artifact_cache)
+    warm = train_quietly(SpamFilter(), artifact_cache=artifact_cache)
+    # The warm run finds the features and never needs the cleaned corpus
+    assert (artifact_cache.misses, artifact_cache.hits) == (['corpus', 'features'], ['features'])
+    for trained in (cold, warm):
+        assert trained.vectorizer.vocabulary_ == model.vectorizer.vocabulary_
+        assert np.array_equal(trained.classifier.feature_count_, model.classifier.feature_count_)
+        assert np.array_equal(trained.predict_batch(messages[:200])[0], model.predict_batch(messages[:200])[0])
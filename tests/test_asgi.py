@@ -0,0 +1,30 @@
+"""The ASGI service (src/web/asgi.py): reloads behind the shared prediction cache."""
+import pytest
+
+from src.web.asgi import SpamService
+
+MESSAGE = 'URGENT! You have won a 1 week FREE membership in our £100,000 prize Jackpot!'
+
+
+@pytest.fixture
+def service(tmp_path, model):
+    model_path = str(tmp_path / 'model')
+    model.publish(model_path)
+    service = SpamService('full', model_path)
+    service.load()
+    return service
+
+
+def test_reload_never_serves_the_old_models_predictions(service, other_model):
+    in_flight = service.reloader.acquire()
+    # Read by a request on the old model before the swap, used after it
+    cache = in_flight.model.prediction_cache
+    other_model.publish(service.model_path)
+    assert service.reloader.reload()
+
+    cache.predict(in_flight.model.clean_batch([MESSAGE]), in_flight.model._predict_clean, owner=in_flight.model)
+    in_flight.release()
+    result = service.score([MESSAGE])[0]
+    assert result['model_version'] == service.reloader.active.version
+    assert result['probability'] == pytest.approx(float(other_model.predict(MESSAGE)[1]), abs=1e-9)
+    assert service.prediction_cache.stats()['invalidations'] >= 2
@@ -0,0 +1,93 @@
+"""Batch endpoints of the Flask app (src/web/app.py) and the Vercel app (api/index.py)."""
+import importlib
+import json
+
+import pytest
+
+MAX_BATCH_SIZE = 5
+NDJSON = 'application/x-ndjson'
+
+
+@pytest.fixture(params=['app', 'api'])
+def endpoints(request, web, monkeypatch):
+    """(test client, single message URL, batch URL) for each app."""
+    if request.param == 'app':
+        flask_app, prefix = web.app, ''
+    else:
+        flask_app, prefix = importlib.import_module('api.index').app, '/api'
+    monkeypatch.setitem(flask_app.config, 'MAX_BATCH_SIZE', MAX_BATCH_SIZE)
+    monkeypatch.setitem(flask_app.config, 'BATCH_CHUNK_SIZE', 2)
+    return flask_app.test_client(), f'{prefix}/check_spam', f'{prefix}/check_spam_batch'
+
+
+def result_lines(response):
+    assert response.mimetype == NDJSON
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def ndjson(*lines):
+    return '\n'.join(lines) + '\n'
+
+
+@pytest.mark.parametrize('body', [json.dumps({'message': 'hi'}), json.dumps('hi'), '{"messages": [', 'null'])
+def test_batch_that_is_not_an_array_is_rejected(endpoints, body):
+    client, _, batch_url = endpoints
+    response = client.post(batch_url, data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('content_type', ['application/json', NDJSON])
+def test_oversized_batch_is_refused_before_scoring(endpoints, content_type):
+    client, _, batch_url = endpoints
+    items = ['see you later'] * (MAX_BATCH_SIZE + 1)
+    body = json.dumps(items) if content_type == 'application/json' else ndjson(*map(json.dumps, items))
+    response = client.post(batch_url, data=body, content_type=content_type)
+    assert response.status_code == 413
+    assert str(MAX_BATCH_SIZE) in response.get_json()['error']
+
+
+@pytest.mark.parametrize('content_type', ['application/json', NDJSON])
+def test_full_batch_is_scored_across_chunks(endpoints, content_type):
+    client, _, batch_url = endpoints
+    items = [f'message number {i}' for i in range(MAX_BATCH_SIZE)]
+    body = json.dumps({'messages': items}) if content_type == 'application/json' else ndjson(*map(json.dumps, items))
+    response = client.post(batch_url, data=body, content_type=content_type)
+    assert response.status_code == 200
+    results = result_lines(response)
+    assert [result['index'] for result in results] == list(range(MAX_BATCH_SIZE))
+    assert all(result['prediction'] in ('ham', 'spam') for result in results)
+
+
+def test_items_without_a_message_get_error_lines(endpoints):
+    client, single_url, batch_url = endpoints
+    items = ['Free entry! Win cash now, txt WIN', '', 5, {'message': 'see you at lunch'}, {'text': 'no message key'}]
+    results = result_lines(client.post(batch_url, json=items))
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert [i for i, result in enumerate(results) if 'error' in result] == [1, 2, 4]
+    # Scored items match the single message endpoint
+    for i, message in ((0, items[0]), (3, items[3]['message'])):
+        single = client.post(single_url, json={'message': message}).get_json()
+        assert results[i]['prediction'] == single['prediction']
+        assert results[i]['probability'] == pytest.approx(single['probability'], abs=1e-9)
+        assert results[i]['is_spam'] == single['is_spam']
+
+
+def test_undecodable_ndjson_lines_get_error_lines(endpoints):
+    client, _, batch_url = endpoints
+    body = ndjson('"hi there"', '{not json', '', '{"message": "win a prize"}', 'null')
+    results = result_lines(client.post(batch_url, data=body, content_type=NDJSON))
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert [i for i, result in enumerate(results) if 'error' in result] == [1, 3]
+
+
+def test_whitespace_messages_are_scored_like_single_requests(endpoints):
+    client, single_url, batch_url = endpoints
+    messages = ['   ', ' see you later ']
+    results = result_lines(client.post(batch_url, json=messages))
+    for message, result in zip(messages, results):
+        single = client.post(single_url, json={'message': message})
+        assert single.status_code == 200
+        assert 'error' not in result
+        assert result['probability'] == pytest.approx(single.get_json()['probability'], abs=1e-9)
+
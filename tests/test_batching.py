@@ -0,0 +1,107 @@
+"""MicroBatcher (src/model/batching.py): concurrent requests scored in batches."""
+import asyncio
+import threading
+
+import pytest
+
+from src.model.batching import MicroBatcher
+
+
+class Scorer:
+    """Upper-cases messages and records the size of every batch it is given."""
+
+    def __init__(self, release=None):
+        self.batches = []
+        self.release = release
+
+    def __call__(self, messages):
+        self.batches.append(len(messages))
+        if self.release is not None:
+            self.release.wait(5)
+        return [message.upper() for message in messages]
+
+
+def test_concurrent_requests_share_batches_and_get_their_own_result():
+    scorer = Scorer()
+    batcher = MicroBatcher(scorer, max_batch_size=4, max_wait=0.05)
+    messages = [f'message {i}' for i in range(10)]
+
+    async def run():
+        try:
+            return await asyncio.gather(*(batcher.predict(message) for message in messages))
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(run()) == [message.upper() for message in messages]
+    assert scorer.batches == [4, 4, 2]
+    stats = batcher.stats()
+    assert (stats['batches'], stats['messages'], stats['largest_batch']) == (3, 10, 4)
+    assert stats['mean_batch_size'] == pytest.approx(10 / 3)
+
+
+def test_a_lone_request_is_scored_after_max_wait():
+    scorer = Scorer()
+    batcher = MicroBatcher(scorer, max_batch_size=64, max_wait=0.01)
+
+    async def run():
+        try:
+            return await asyncio.wait_for(batcher.predict('hello'), 2)
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(run()) == 'HELLO'
+    assert scorer.batches == [1]
+
+
+def test_a_failing_batch_fails_its_callers_only():
+    calls = []
+
+    def score(messages):
+        calls.append(messages)
+        if len(calls) == 1:
+            raise ValueError('model unavailable')
+        return [len(message) for message in messages]
+
+    batcher = MicroBatcher(score, max_batch_size=2, max_wait=0.05)
+
+    async def run():
+        try:
+            failed = await asyncio.gather(batcher.predict('a'), batcher.predict('bb'), return_exceptions=True)
+            return failed, await batcher.predict('ccc')
+        finally:
+            await batcher.close()
+
+    failed, scored = asyncio.run(run())
+    assert [type(error) for error in failed] == [ValueError, ValueError]
+    assert scored == 3
+
+
+def test_close_fails_waiting_callers():
+    release = threading.Event()
+    scorer = Scorer(release)
+    batcher = MicroBatcher(scorer, max_batch_size=1, max_wait=0)
+
+    async def run():
+        requests = [asyncio.ensure_future(batcher.predict(message)) for message in ('first', 'second')]
+        while not scorer.batches:
+            await asyncio.sleep(0.001)
+        await batcher.close()
+        release.set()
+        return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 2)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [RuntimeError, RuntimeError]
+
+
+def test_predict_after_close_starts_a_new_collector():
+    batcher = MicroBatcher(Scorer(), max_wait=0)
+
+    async def run():
+        first = await batcher.predict('one')
+        await batcher.close()
+        try:
+            return first, await batcher.predict('two')
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(run()) == ('ONE', 'TWO')
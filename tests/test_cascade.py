@@ -0,0 +1,108 @@
+"""CascadeSpamFilter (src/model/cascade.py): rules, then the lightweight model, then the full model."""
+import pickle
+
+import numpy as np
+import pytest
+
+from src.model.cascade import (DEFAULT_LIGHTWEIGHT_MODEL, CascadeSpamFilter, cascade_loader, parse_band)
+from src.model.lightweight import LightweightSpamFilter
+from src.model.spam_filter import SpamFilter
+
+
+class Unused:
+    def predict_batch(self, messages):
+        raise AssertionError(f'scored {messages!r}')
+
+
+@pytest.fixture(scope='module')
+def lightweight():
+    return LightweightSpamFilter().load(DEFAULT_LIGHTWEIGHT_MODEL)
+
+
+@pytest.fixture(scope='module')
+def unmatched(messages):
+    """Corpus messages no rule matches, which the models decide."""
+    rules = CascadeSpamFilter(Unused(), Unused())
+    return [message for message in messages[:1000] if rules.match_rule(message) is None]
+
+
+@pytest.mark.parametrize('message, rule', [
+    ('Txt WIN to 80082 to claim your reward', 'short_code'),
+    ('URGENT! Call 09061701461 to claim your prize', 'premium_number'),
+    ('You have won a £1000 cash prize!', 'cash_prize'),
+    ('Entry is free, T&C apply', 'terms_apply'),
+    ('Only 150p per msg', 'premium_rate'),
+    ('To opt out reply STOP', 'opt_out'),
+    ('Text me when you get home, I am at 09 street', None),
+    ('Please stop by the shop at 5', None),
+])
+def test_rules(message, rule):
+    assert CascadeSpamFilter(Unused(), Unused()).match_rule(message) == rule
+
+
+def test_rule_matches_are_spam_without_scoring():
+    cascade = CascadeSpamFilter(Unused(), Unused(), rule_probability=0.95)
+    predictions, probabilities = cascade.predict_batch(['URGENT! Call 09061701461 now', 'Txt WIN to 80082'])
+    assert predictions.tolist() == ['spam', 'spam']
+    assert probabilities.tolist() == [0.95, 0.95]
+    stats = cascade.stats()
+    assert stats['routed'] == {'rules': 2, 'lightweight': 0, 'full': 0}
+    assert stats['rule_hits'] == {'short_code': 1, 'premium_number': 1}
+
+
+def test_the_widest_band_agrees_with_the_full_model(lightweight, model, unmatched):
+    cascade = CascadeSpamFilter(lightweight, model, band=(0.0, 1.0))
+    predictions, probabilities = cascade.predict_batch(unmatched)
+    expected_predictions, expected_probabilities = model.predict_batch(unmatched)
+    assert predictions.tolist() == expected_predictions.tolist()
+    assert np.allclose(probabilities, expected_probabilities, rtol=0, atol=1e-12)
+
+
+def test_an_empty_band_never_uses_the_full_model(lightweight, unmatched):
+    cascade = CascadeSpamFilter(lightweight, Unused(), band=(0.5, 0.5))
+    predictions, probabilities = cascade.predict_batch(unmatched)
+    expected_predictions, expected_probabilities = lightweight.predict_batch(unmatched)
+    assert predictions.tolist() == [str(prediction) for prediction in expected_predictions]
+    assert np.allclose(probabilities, expected_probabilities, rtol=0, atol=1e-12)
+
+
+def test_only_uncertain_messages_reach_the_full_model(lightweight, model, messages):
+    sent = []
+
+    class Full:
+        def predict_batch(self, batch):
+            sent.extend(batch)
+            return model.predict_batch(batch)
+
+    band = (0.1, 0.9)
+    cascade = CascadeSpamFilter(lightweight, Full(), band=band)
+    cascade.predict_batch(messages[:1000])
+    predictions, probabilities = (np.asarray(result) for result in lightweight.predict_batch(sent))
+    spam_probabilities = np.where(predictions == 'spam', probabilities, 1.0 - probabilities)
+    assert ((band[0] < spam_probabilities) & (spam_probabilities < band[1])).all()
+
+    stats = cascade.stats()
+    assert stats['messages'] == 1000
+    assert stats['routed']['full'] == len(sent)
+    assert sum(stats['fractions'].values()) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('band', [(0.9, 0.1), (-0.1, 0.5), (0.5, 1.5)])
+def test_invalid_bands_are_rejected(band):
+    with pytest.raises(ValueError):
+        CascadeSpamFilter(Unused(), Unused(), band=band)
+
+
+def test_parse_band():
+    assert parse_band('0.1,0.999') == (0.1, 0.999)
+    assert parse_band([0, 1]) == (0.0, 1.0)
+
+
+def test_cascade_loader_pickles(tmp_path, model):
+    model_path = str(tmp_path / 'spam_filter_model')
+    model.publish(model_path)
+    load = pickle.loads(pickle.dumps(cascade_loader(SpamFilter.load_model, band=(0.2, 0.8))))
+    cascade = load(model_path)
+    assert isinstance(cascade, CascadeSpamFilter)
+    assert cascade.band == (0.2, 0.8)
+    assert cascade.predict('URGENT! Call 09061701461 to claim your prize')[0] == 'spam'
@@ -0,0 +1,48 @@
+"""Count tables (src/model/count_table.py) of the serverless LightweightSpamFilter."""
+import os
+
+import pytest
+
+from src.model.count_table import read_count_table, write_count_table
+from src.model.lightweight import LightweightSpamFilter
+from src.training.build_lightweight_model import count_corpus, count_messages
+
+from tests.conftest import DATA_PATH, ROOT
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'counts.bin')
+    spam_words = {'free': 3, '£1000': 1, 'café': 2}
+    ham_words = {'free': 1, 'lunch': 4}
+    write_count_table(path, 2, 5, spam_words, ham_words)
+    assert read_count_table(path) == (2, 5, spam_words, ham_words)
+
+
+def test_empty_table(tmp_path):
+    path = str(tmp_path / 'counts.bin')
+    write_count_table(path, 0, 0, {}, {})
+    assert read_count_table(path) == (0, 0, {}, {})
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'counts.bin'
+    path.write_bytes(b'PK\x03\x04' + bytes(32))
+    with pytest.raises(ValueError):
+        read_count_table(str(path))
+
+
+def test_loaded_counts_score_like_the_counted_ones(tmp_path, rows, messages):
+    counts = count_messages(rows[:3000])
+    (spam_count, spam_words), (ham_count, ham_words) = counts['spam'], counts['ham']
+    path = str(tmp_path / 'counts.bin')
+    write_count_table(path, spam_count, ham_count, spam_words, ham_words)
+    loaded = LightweightSpamFilter().load(path)
+    counted = LightweightSpamFilter().load_counts(spam_count, ham_count, spam_words, ham_words)
+    assert loaded.predict_batch(messages[3000:]) == counted.predict_batch(messages[3000:])
+
+
+def test_the_shipped_table_matches_the_corpus():
+    counts = count_corpus(DATA_PATH)
+    (spam_count, spam_words), (ham_count, ham_words) = counts['spam'], counts['ham']
+    shipped = read_count_table(os.path.join(ROOT, 'api', 'lightweight_model.bin'))
+    assert shipped == (spam_count, ham_count, spam_words, ham_words)
@@ -0,0 +1,30 @@
+"""The Vercel function bundles every module of this repository it imports."""
+import fnmatch
+import json
+import os
+import subprocess
+import sys
+
+from tests.conftest import ROOT
+
+# Run in a fresh interpreter, so only what api/index.py imports is loaded
+LIST_IMPORTED_FILES = '''
+import sys
+import api.index
+for name, module in list(sys.modules.items()):
+    if name.startswith('src.') and getattr(module, '__file__', None):
+        print(module.__file__)
+'''
+
+
+def test_vercel_bundle_includes_imported_modules():
+    with open(os.path.join(ROOT, 'vercel.json'), encoding='utf-8') as f:
+        build = json.load(f)['builds'][0]
+    include = build['config']['includeFiles']
+    patterns = [include] if isinstance(include, str) else include
+    output = subprocess.run([sys.executable, '-c', LIST_IMPORTED_FILES], cwd=ROOT, capture_output=True,
+                            text=True, check=True).stdout
+    files = [os.path.relpath(path, ROOT).replace(os.sep, '/') for path in output.split()]
+    assert files
+    missing = [path for path in files if not any(fnmatch.fnmatch(path, pattern) for pattern in patterns)]
+    assert not missing, f'{missing} are imported by {build["src"]} but not bundled by includeFiles'
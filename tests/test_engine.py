@@ -0,0 +1,41 @@
+"""ScoringEngine: worker processes score exactly the model version the parent validated."""
+import os
+
+import numpy as np
+import pytest
+
+from src.model.engine import ScoringEngine
+from src.model.reloader import ModelValidationError, model_version
+from src.model.spam_filter import SpamFilter
+
+
+@pytest.fixture(params=['directory', 'pickle'])
+def model_path(request, tmp_path, model):
+    path = str(tmp_path / ('model.pkl' if request.param == 'pickle' else 'model'))
+    model.publish(path)
+    return path
+
+
+def test_workers_keep_the_validated_version(model_path, model, other_model, messages):
+    version = model_version(model_path)
+    engine = ScoringEngine(SpamFilter.load_model(model_path), model_path=model_path, workers=2,
+                           start_method='forkserver', version=version)
+    try:
+        # Published after the pool started: workers that have not loaded yet must not pick it up
+        other_model.publish(model_path)
+        scored = list(engine.score_many(messages[:400], chunk_size=50))
+        snapshot_dir = engine.snapshot_dir
+        assert os.path.isdir(snapshot_dir)
+    finally:
+        engine.close()
+    predictions, probabilities = model.predict_batch(messages[:400])
+    assert [prediction for prediction, _ in scored] == list(predictions)
+    assert np.allclose([probability for _, probability in scored], probabilities, rtol=0, atol=1e-12)
+    assert not os.path.exists(snapshot_dir)
+
+
+def test_changed_model_is_rejected_before_workers_start(model_path, model, other_model):
+    version = model_version(model_path)
+    other_model.publish(model_path)
+    with pytest.raises(ModelValidationError):
+        ScoringEngine(model, model_path=model_path, workers=2, start_method='forkserver', version=version)
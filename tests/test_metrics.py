@@ -0,0 +1,75 @@
+"""Metrics served on /metrics in the Prometheus text format."""
+import os
+import subprocess
+import sys
+from collections import Counter
+
+import pytest
+
+from src.model.metrics import MetricsRegistry
+
+from tests.conftest import ROOT
+
+RENDER_ASGI_METRICS = '''
+import src.web.asgi as asgi
+from src.model.metrics import registry
+asgi.service.load()
+print(registry.render())
+'''
+
+
+def duplicate_series(text):
+    series = Counter(line.rsplit(' ', 1)[0] for line in text.splitlines() if line and not line.startswith('#'))
+    return sorted(name for name, count in series.items() if count > 1)
+
+
+@pytest.mark.parametrize('model_kind', ['full', 'lightweight'])
+def test_asgi_metrics_have_no_duplicate_series(model_kind):
+    # A fresh interpreter, so only the ASGI app's collectors are registered
+    env = dict(os.environ, SPAM_ASGI_MODEL=model_kind)
+    output = subprocess.run([sys.executable, '-c', RENDER_ASGI_METRICS], cwd=ROOT, env=env, capture_output=True,
+                            text=True, check=True).stdout
+    assert 'spam_cache_hits_total' in output
+    assert duplicate_series(output) == []
+
+
+def test_render_histograms_are_cumulative_with_inclusive_bounds():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.describe('spam_request_seconds', 'histogram', 'Request latency')
+    for value in (0.05, 0.1, 0.5, 2.0):
+        registry.observe('spam_request_seconds', value, endpoint='/predict')
+    assert registry.render().splitlines() == [
+        '# HELP spam_request_seconds Request latency',
+        '# TYPE spam_request_seconds histogram',
+        'spam_request_seconds_bucket{endpoint="/predict",le="0.1"} 2',
+        'spam_request_seconds_bucket{endpoint="/predict",le="1.0"} 3',
+        'spam_request_seconds_bucket{endpoint="/predict",le="+Inf"} 4',
+        'spam_request_seconds_sum{endpoint="/predict"} 2.65',
+        'spam_request_seconds_count{endpoint="/predict"} 4',
+    ]
+
+
+def test_render_counters_gauges_and_collectors():
+    registry = MetricsRegistry()
+    registry.inc('spam_predictions_total', label='spam')
+    registry.inc('spam_predictions_total', 2, label='spam')
+    registry.set('spam_model_info', True, path='a "quoted"\\path')
+    registry.add_collector(lambda: iter([('spam_cache_entries', 'gauge', 'Cached predictions', {}, 7)]))
+    assert registry.render().splitlines() == [
+        '# HELP spam_cache_entries Cached predictions',
+        '# TYPE spam_cache_entries gauge',
+        'spam_cache_entries 7',
+        '# TYPE spam_model_info gauge',
+        'spam_model_info{path="a \\"quoted\\"\\\\path"} 1',
+        '# TYPE spam_predictions_total counter',
+        'spam_predictions_total{label="spam"} 3',
+    ]
+
+
+def test_a_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    registry.inc('spam_predictions_total')
+    registry.observe('spam_request_seconds', 0.1)
+    with registry.stage('vectorize'):
+        pass
+    assert registry.render() == '\n'
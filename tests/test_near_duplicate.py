@@ -0,0 +1,92 @@
+"""NearDuplicateIndex (src/model/near_duplicate.py): spam variants answered without scoring."""
+import copy
+import re
+
+import numpy as np
+import pytest
+
+from src.model.near_duplicate import NearDuplicateIndex
+from src.model.spam_filter import SpamFilter
+from src.training.build_near_duplicate_index import build_index
+
+HAM = 'Hey, are you coming to the meeting tomorrow? I will bring the notes from last week'
+
+
+@pytest.fixture(scope='module')
+def index(model, rows):
+    return build_index(model, rows, hit_probability=0.97)
+
+
+@pytest.fixture(scope='module')
+def variant(rows):
+    """A spam message from the corpus with every number changed, as a campaign would send it."""
+    template = next(message for label, message in rows
+                    if label == 'spam' and len(message.split()) >= 15 and re.search(r'\d{4}', message))
+    return re.sub(r'\d', lambda digit: str((int(digit.group()) + 3) % 10), template)
+
+
+def never_score(clean_messages):
+    raise AssertionError(f'scored {clean_messages!r}')
+
+
+def test_a_spam_variant_is_answered_by_the_index(model, index, variant):
+    (match,) = index.query(model.clean_batch([variant]))
+    assert match is not None and match[0] == 'spam' and match[1] >= index.threshold
+
+    predictions, probabilities = index.predict(model.clean_batch([variant]), never_score)
+    assert predictions.tolist() == ['spam']
+    assert probabilities.tolist() == [0.97]
+
+
+def test_only_messages_without_a_match_are_scored(model, index, variant):
+    scored = []
+
+    def score(clean_messages):
+        scored.extend(clean_messages)
+        return np.array(['ham'] * len(clean_messages)), np.full(len(clean_messages), 0.6)
+
+    clean = model.clean_batch([HAM, variant, 'ok'])
+    predictions, probabilities = index.predict(clean, score)
+    assert scored == [clean[0], clean[2]]
+    assert predictions.tolist() == ['ham', 'spam', 'ham']
+    assert probabilities.tolist() == [0.6, 0.97, 0.6]
+
+
+def test_short_messages_and_duplicates_are_not_indexed(model, variant):
+    index = NearDuplicateIndex()
+    clean = model.clean_batch([variant, 'win cash'])
+    assert index.add(clean) == 1
+    assert index.add(model.clean_batch([variant])) == 0
+    assert len(index) == 1
+    index.query(clean)
+    stats = index.stats()
+    assert (stats['lookups'], stats['hits'], stats['too_short']) == (2, 1, 1)
+
+
+def test_invalid_banding_is_rejected():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(num_perm=64, bands=10)
+
+
+def test_save_and_load_keep_matches(tmp_path, model, index, variant, messages):
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+    loaded = NearDuplicateIndex.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.params() == index.params()
+    clean = model.clean_batch(messages[:500] + [variant])
+    assert loaded.query(clean) == index.query(clean)
+
+
+@pytest.mark.parametrize('name', ['spam_filter_model', 'spam_filter_model.pkl'])
+def test_published_models_load_their_index(tmp_path, model, index, variant, name):
+    with_index = copy.copy(model)
+    with_index.near_duplicates = index
+    model_path = str(tmp_path / name)
+    with_index.publish(model_path)
+
+    loaded = SpamFilter.load_model(model_path)
+    assert len(loaded.near_duplicates) == len(index)
+    prediction, probability = loaded.predict(variant)
+    assert (prediction, float(probability)) == ('spam', 0.97)
+    assert loaded.near_duplicates.stats()['hits'] == 1
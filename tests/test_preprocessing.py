@@ -0,0 +1,43 @@
+"""The shared preprocessing module against the implementations it replaced."""
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_preprocessing import legacy_clean_text, legacy_preprocess_text
+from src.model.lightweight import LightweightSpamFilter
+from src.model.preprocessing import (
+    LIGHTWEIGHT_STOP_WORDS, clean_batch, clean_text, tokenize_lightweight, tokenize_lightweight_batch
+)
+from src.model.spam_filter import load_stop_words
+
+EDGE_CASES = ['', '   ', '!!!', "Don't", 'U.S.A. 4 £100', 'ÜBER café naïve', 'tab\tand\nnewline', 'NA', '1234']
+
+
+def test_clean_text_matches_legacy(messages):
+    stop_words = load_stop_words()
+    for message in messages + EDGE_CASES:
+        assert clean_text(message, stop_words) == legacy_clean_text(message, stop_words), message
+
+
+def test_tokenize_lightweight_matches_legacy(messages):
+    for message in messages + EDGE_CASES:
+        expected = legacy_preprocess_text(message, LIGHTWEIGHT_STOP_WORDS)
+        assert tokenize_lightweight(message) == expected, message
+        assert LightweightSpamFilter().preprocess_text(message) == expected, message
+
+
+def test_batches_keep_their_container_type(messages):
+    stop_words = load_stop_words()
+    expected = [clean_text(message, stop_words) for message in messages]
+    series = pd.Series(messages, index=range(10, 10 + len(messages)), name='message')
+
+    cleaned = clean_batch(series, stop_words)
+    assert isinstance(cleaned, pd.Series)
+    assert cleaned.index.equals(series.index) and cleaned.name == 'message'
+    assert cleaned.tolist() == expected
+
+    cleaned = clean_batch(np.array(messages, dtype=object), stop_words)
+    assert isinstance(cleaned, np.ndarray) and cleaned.dtype == object
+    assert cleaned.tolist() == expected
+
+    assert clean_batch(iter(messages), stop_words) == expected
+    assert tokenize_lightweight_batch(messages) == [tokenize_lightweight(message) for message in messages]
@@ -0,0 +1,287 @@
+"""ModelReloader and the app's reload endpoint: atomic swaps, rejected models, in-flight requests, the cache."""
+import copy
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.model.cache import PredictionCache
+from src.model.reloader import ModelReloader, ModelValidationError
+from src.model.spam_filter import SpamFilter
+from tests.conftest import ADMIN_TOKEN
+
+WARMUP_MESSAGES = ['Free entry in 2 a wkly comp to win FA Cup final tkts', 'Ok, see you later then!']
+MESSAGE = 'URGENT! You have won a 1 week FREE membership in our £100,000 prize Jackpot!'
+
+
+class Resource:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class BrokenModel:
+    def __init__(self, label='ham', probability=0.5):
+        self.label = label
+        self.probability = probability
+
+    def predict_batch(self, messages):
+        return np.array([self.label] * len(messages)), np.full(len(messages), self.probability)
+
+
+@pytest.fixture(params=['directory', 'pickle'])
+def model_path(request, tmp_path, model):
+    path = str(tmp_path / ('model.pkl' if request.param == 'pickle' else 'model'))
+    model.publish(path)
+    return path
+
+
+def probability(spam_filter, message=MESSAGE):
+    return float(spam_filter.predict(message)[1])
+
+
+def test_reload_swaps_changed_model_only(model_path, model, other_model):
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES)
+    assert reloader.reload()
+    first = reloader.active
+    assert probability(first.model) == pytest.approx(probability(model), abs=1e-9)
+
+    assert not reloader.reload()
+    assert reloader.active is first
+    assert reloader.reload(force=True)
+    assert reloader.active is not first and reloader.active.version == first.version
+
+    other_model.publish(model_path)
+    assert reloader.reload()
+    assert reloader.active.version != first.version
+    assert probability(reloader.active.model) == pytest.approx(probability(other_model), abs=1e-9)
+    assert reloader.status()['reloads'] == 3
+
+
+def test_failed_load_keeps_serving(model_path, model):
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES)
+    reloader.reload()
+    active = reloader.active
+    if model_path.endswith('.pkl'):
+        with open(model_path, 'wb') as f:
+            f.write(b'not a pickle')
+    else:
+        with open(f'{model_path}/meta.json', 'w') as f:
+            f.write('{"format_version": 99}')
+
+    with pytest.raises(Exception):
+        reloader.reload()
+    status = reloader.status()
+    assert reloader.active is active
+    assert status['failed_reloads'] == 1 and status['last_error']
+    assert probability(active.model) == pytest.approx(probability(model), abs=1e-9)
+
+    # Restoring the serving model clears the error without swapping anything
+    model.publish(model_path)
+    assert not reloader.reload()
+    assert reloader.active is active and reloader.status()['last_error'] is None
+
+
+@pytest.mark.parametrize('broken', [BrokenModel(label='eggs'), BrokenModel(probability=1.5),
+                                    BrokenModel(probability=float('nan'))])
+def test_invalid_model_is_rejected(model_path, broken):
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES)
+    reloader.reload()
+    active = reloader.active
+    reloader.loader = lambda path: broken
+    with pytest.raises(ModelValidationError):
+        reloader.reload(force=True)
+    assert reloader.active is active
+    assert reloader.failed_reloads == 1
+
+
+def test_model_published_while_loading_is_rejected(model_path, model, other_model):
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES)
+    reloader.reload()
+    active = reloader.active
+
+    def load_then_publish(path):
+        loaded = SpamFilter.load_model(path)
+        other_model.publish(path)
+        return loaded
+
+    reloader.loader = load_then_publish
+    with pytest.raises(ModelValidationError, match='changed while'):
+        reloader.reload(force=True)
+    assert reloader.active is active
+    # The newer model is picked up by the next reload
+    reloader.loader = SpamFilter.load_model
+    assert reloader.reload()
+    assert probability(reloader.active.model) == pytest.approx(probability(other_model), abs=1e-9)
+
+
+def test_no_model_loaded():
+    reloader = ModelReloader('missing-model')
+    with pytest.raises(RuntimeError):
+        reloader.acquire()
+    with pytest.raises(OSError):
+        reloader.reload()
+    assert reloader.active is None and reloader.failed_reloads == 1
+
+
+def test_in_flight_request_finishes_on_old_model(model_path, model, other_model):
+    resources, retired = [], []
+
+    def prepare(spam_filter, version):
+        resources.append(Resource())
+        return resources[-1]
+
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES, prepare=prepare, retire=retired.append)
+    reloader.reload()
+    in_flight = reloader.acquire()
+    other_model.publish(model_path)
+    reloader.reload()
+
+    assert reloader.active is not in_flight
+    assert retired == [in_flight.model]
+    # The retired model keeps scoring, and keeps its resources, until its last user releases it
+    assert probability(in_flight.model) == pytest.approx(probability(model), abs=1e-9)
+    assert not resources[0].closed
+    in_flight.release()
+    assert resources[0].closed and not resources[1].closed
+
+    # Without users a retired model is closed as soon as it is swapped out
+    model.publish(model_path)
+    reloader.reload()
+    assert resources[1].closed and not resources[2].closed
+
+
+def test_concurrent_requests_during_reloads(model_path, model, other_model):
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES)
+    reloader.reload()
+    expected = {reloader.active.version: probability(model)}
+    stop = threading.Event()
+    results, errors = [], []
+
+    def serve():
+        while not stop.is_set():
+            try:
+                with reloader.use() as active:
+                    results.append((active.version, probability(active.model)))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=serve) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for spam_filter in (other_model, model) * 3:
+            spam_filter.publish(model_path)
+            reloader.reload()
+            expected[reloader.active.version] = probability(spam_filter)
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert not errors
+    assert len(expected) == 2 and results
+    for version, result in results:
+        assert result == pytest.approx(expected[version], abs=1e-9)
+
+
+def test_watcher_reloads_once_change_settles(model_path, other_model):
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES)
+    reloader.reload()
+    version = reloader.active.version
+    reloader.watch(interval=0.02)
+    try:
+        other_model.publish(model_path)
+        deadline = time.monotonic() + 5
+        while reloader.active.version == version and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        reloader.stop()
+    assert reloader.active.version != version
+    assert reloader.status()['reloads'] == 2
+
+
+def test_prediction_cache_is_invalidated_by_reload(model_path, model, other_model):
+    cache = PredictionCache()
+
+    def retire(spam_filter):
+        spam_filter.prediction_cache = None
+        cache.clear()
+
+    reloader = ModelReloader(model_path, warmup_messages=WARMUP_MESSAGES,
+                             prepare=lambda spam_filter, version: spam_filter.set_cache(cache), retire=retire)
+    reloader.reload()
+    with reloader.use() as active:
+        first = probability(active.model)
+        assert probability(active.model) == first
+    assert cache.stats()['hits'] == 1
+
+    other_model.publish(model_path)
+    reloader.reload()
+    assert cache.stats()['entries'] == 0
+    with reloader.use() as active:
+        assert probability(active.model) == pytest.approx(probability(other_model), abs=1e-9)
+        assert probability(active.model) != pytest.approx(first, abs=1e-9)
+
+
+def test_request_survives_cache_detached_while_scoring(model):
+    cache = PredictionCache()
+    reads = []
+
+    class Retiring(type(model)):
+        @property
+        def prediction_cache(self):
+            # Retired by a reload right after the request first looked at its cache
+            reads.append(True)
+            return cache if len(reads) == 1 else None
+
+    scorer = copy.copy(model)
+    scorer.__class__ = Retiring
+    cache.attach(scorer)
+    assert scorer.predict(MESSAGE) == model.predict(MESSAGE)
+    assert cache.stats()['misses'] == 1
+
+
+def test_scores_from_replaced_model_are_not_cached():
+    cache = PredictionCache()
+
+    def score_during_reload(clean_texts):
+        cache.clear()
+        return ['spam'] * len(clean_texts), [0.9] * len(clean_texts)
+
+    assert cache.predict(['win cash now'], score_during_reload) == (['spam'], [0.9])
+    assert cache.stats()['entries'] == 0
+    assert cache.predict(['win cash now'], lambda texts: (['ham'], [0.6])) == (['ham'], [0.6])
+    assert cache.stats()['entries'] == 1
+
+
+def test_batch_reports_the_serving_model_version(web):
+    client = web.app.test_client()
+    response = client.post('/check_spam_batch', json=['see you later'])
+    assert response.headers['X-Model-Version'] == client.get('/ready').get_json()['model_version']
+
+
+def test_admin_reload_swaps_model_and_clears_cache(web, other_model):
+    client = web.app.test_client()
+    headers = {'Authorization': f'Bearer {ADMIN_TOKEN}'}
+    assert client.post('/admin/reload').status_code == 401
+
+    version = client.get('/ready').get_json()['model_version']
+    message = {'message': 'Call now to claim your free prize'}
+    before = client.post('/check_spam', json=message).get_json()
+    client.post('/check_spam', json=message)
+    assert client.get('/health').get_json()['cache']['entries'] >= 1
+
+    other_model.publish(web.app.config['MODEL_PATH'])
+    response = client.post('/admin/reload', headers=headers).get_json()
+    assert response['reloaded'] and response['model_version'] != version
+    assert client.get('/health').get_json()['cache']['entries'] == 0
+
+    after = client.post('/check_spam', json=message).get_json()
+    assert after['model_version'] == response['model_version']
+    assert after['probability'] == pytest.approx(float(other_model.predict(message['message'])[1]), abs=1e-9)
+    assert after['probability'] != pytest.approx(before['probability'], abs=1e-9)
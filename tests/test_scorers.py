@@ -0,0 +1,115 @@
+"""Compiled and mapped scorers against the sklearn model they were built from."""
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from src.model.mapped_model import SMALL_LOOKUP_TOKENS, MappedSpamFilter, term_hashes, token_hash
+from src.model.spam_filter import SpamFilter
+
+# Maximum absolute probability error per mapped storage dtype
+TOLERANCES = {'float64': 1e-9, 'float16': 1e-2, 'int8': 5e-2}
+
+
+@pytest.fixture(scope='module')
+def expected(model, clean_messages):
+    return model.classifier.predict_proba(model.vectorizer.transform(clean_messages))
+
+
+@pytest.fixture(scope='module', params=sorted(TOLERANCES))
+def mapped(request, model, tmp_path_factory):
+    path = tmp_path_factory.mktemp('mapped') / request.param
+    model.export_model(str(path), dtype=request.param)
+    scorer = SpamFilter.load_model(str(path))
+    assert isinstance(scorer, MappedSpamFilter)
+    return request.param, scorer
+
+
+def check_scorer(scorer, expected, clean_messages, messages, tolerance):
+    assert np.abs(scorer.predict_proba(clean_messages) - expected).max() <= tolerance
+    predictions, probabilities = scorer.predict_batch(messages)
+    assert np.abs(probabilities - expected.max(axis=1)).max() <= tolerance
+    agreement = (predictions == scorer.classes_[expected.argmax(axis=1)]).mean()
+    assert agreement == 1.0 if tolerance < 1e-6 else agreement >= 0.995
+
+
+def test_compiled_matches_predict_proba(model, expected, clean_messages, messages):
+    check_scorer(model.compile(), expected, clean_messages, messages, 1e-9)
+
+
+def test_compiled_single_message_matches_batch(model, messages):
+    compiled = model.compile()
+    predictions, probabilities = model.predict_batch(messages[:200])
+    for message, prediction, probability in zip(messages, predictions, probabilities):
+        assert compiled.predict(message)[0] == prediction
+        assert compiled.predict(message)[1] == pytest.approx(probability, abs=1e-9)
+
+
+def test_compiled_unknown_and_empty_messages(model):
+    messages = ['', 'zzzzqqq xxyyzz', '!!!']
+    expected = model.predict_batch(messages)
+    actual = model.compile().predict_batch(messages)
+    assert list(actual[0]) == list(expected[0])
+    assert np.allclose(actual[1], expected[1], rtol=0, atol=1e-9)
+
+
+def test_mapped_matches_predict_proba(mapped, expected, clean_messages, messages):
+    dtype, scorer = mapped
+    check_scorer(scorer, expected, clean_messages, messages, TOLERANCES[dtype])
+
+
+def test_compiled_from_mapped_matches_predict_proba(mapped, expected, clean_messages, messages):
+    dtype, scorer = mapped
+    check_scorer(scorer.compile(), expected, clean_messages, messages, TOLERANCES[dtype])
+
+
+def test_mapped_vocabulary_round_trips(model, mapped):
+    dtype, scorer = mapped
+    terms = scorer.terms()
+    # Mapped columns are in hash order; each term keeps its own log-probabilities
+    assert sorted(terms) == sorted(model.vectorizer.vocabulary_)
+    columns = [model.vectorizer.vocabulary_[term] for term in terms]
+    error = np.abs(scorer.log_probabilities() - model.classifier.feature_log_prob_[:, columns]).max()
+    # int8 rounds to the nearest step of scale, float16 keeps about three significant digits
+    tolerance = scorer.scale.max() / 2 + 1e-9 if dtype == 'int8' else {'float64': 1e-12, 'float16': 5e-3}[dtype]
+    assert error <= tolerance
+
+
+def test_mapped_unknown_and_empty_messages(model, mapped):
+    dtype, scorer = mapped
+    messages = ['', 'zzzzqqq xxyyzz', '!!!']
+    expected = model.predict_batch(messages)
+    actual = scorer.predict_batch(messages)
+    assert list(actual[0]) == list(expected[0])
+    assert np.allclose(actual[1], expected[1], rtol=0, atol=TOLERANCES[dtype])
+
+
+def test_mapped_long_token_stays_small(model, mapped):
+    # One 50 KB token used to widen every token of the message to 50 KB (gigabytes in total)
+    dtype, scorer = mapped
+    message = 'x' * 50000 + ' hello' * 10000
+    tracemalloc.start()
+    try:
+        prediction, probability = scorer.predict(message)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 16 * 1024 * 1024
+    expected = model.predict(message)
+    assert prediction == expected[0]
+    assert probability == pytest.approx(expected[1], abs=TOLERANCES[dtype])
+
+
+def test_token_hash_matches_vectorized_hash():
+    tokens = [b'', b'a', b'ab', b'eight888', b'nine99999', b'x' * 16, b'y' * 17, 'caféüberß'.encode('utf-8')]
+    assert [token_hash(token) for token in tokens] == term_hashes(np.array(tokens, dtype=bytes)).tolist()
+
+
+def test_mapped_small_lookup_matches_vectorized(mapped, messages):
+    # Single messages take the Python path, a whole batch the vectorized one
+    dtype, scorer = mapped
+    batch = [message for message in messages[:500] if len(scorer.tokenize(scorer.clean_text(message)))]
+    assert max(len(scorer.tokenize(scorer.clean_text(message))) for message in batch) <= SMALL_LOOKUP_TOKENS
+    predictions, probabilities = scorer.predict_batch(batch)
+    for message, prediction, probability in zip(batch, predictions, probabilities):
+        assert scorer.predict(message) == (prediction, pytest.approx(probability, rel=0, abs=1e-12))
@@ -0,0 +1,57 @@
+"""Streaming training against a single ``fit`` on the whole corpus."""
+import numpy as np
+import pytest
+
+from src.model.spam_filter import SpamFilter
+from src.training.streaming import train_streaming
+
+from tests.conftest import DATA_PATH
+
+
+def fit_whole(feature_mode, rows):
+    spam_filter = SpamFilter(feature_mode)
+    labels = [label for label, _ in rows]
+    features = spam_filter.vectorizer.fit_transform(spam_filter.clean_batch([message for _, message in rows]))
+    spam_filter.classifier.fit(features, labels)
+    return spam_filter
+
+
+def assert_same_model(streamed, expected):
+    if hasattr(expected.vectorizer, 'vocabulary_'):
+        assert streamed.vectorizer.vocabulary_ == expected.vectorizer.vocabulary_
+    for attribute in ('classes_', 'class_count_', 'feature_count_'):
+        assert np.array_equal(getattr(streamed.classifier, attribute), getattr(expected.classifier, attribute))
+    for attribute in ('class_log_prior_', 'feature_log_prob_'):
+        assert np.allclose(getattr(streamed.classifier, attribute), getattr(expected.classifier, attribute),
+                           rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('feature_mode', ['count', 'hashing'])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_streaming_matches_fit(rows, feature_mode, workers):
+    streamed = train_streaming(SpamFilter(feature_mode), DATA_PATH, chunk_size=700, workers=workers)
+    assert_same_model(streamed, fit_whole(feature_mode, rows))
+
+
+def test_streaming_from_pairs_matches_file(rows):
+    from_pairs = train_streaming(SpamFilter(), iter(rows), chunk_size=1000, workers=1)
+    assert_same_model(from_pairs, train_streaming(SpamFilter(), DATA_PATH, chunk_size=5000, workers=1))
+
+
+def test_streamed_model_scores_like_fitted_one(rows, messages):
+    streamed = train_streaming(SpamFilter(), DATA_PATH, chunk_size=1000, workers=1)
+    expected = fit_whole('count', rows)
+    predictions, probabilities = streamed.predict_batch(messages)
+    expected_predictions, expected_probabilities = expected.predict_batch(messages)
+    assert np.array_equal(predictions, expected_predictions)
+    assert np.allclose(probabilities, expected_probabilities, rtol=0, atol=1e-12)
+
+
+def test_unknown_labels_are_rejected():
+    with pytest.raises(ValueError, match='Unknown labels'):
+        train_streaming(SpamFilter(), [('ham', 'hello'), ('spam', 'win cash'), ('eggs', 'breakfast')], workers=1)
+
+
+def test_missing_class_is_rejected():
+    with pytest.raises(ValueError, match='every class'):
+        train_streaming(SpamFilter(), [('ham', 'hello'), ('ham', 'see you')], workers=1)